@@ -33,6 +33,7 @@ from buildbase import (
     read_version_file,
 )
 from pypath import get_python_include_dir, get_python_version
+from sdkversion import write_version_module
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
@@ -418,6 +419,10 @@ def _build(
                     os.path.join(sora_build_target_dir, file), os.path.join(sora_src_dir, file)
                 )
 
+        # import 時に importlib.metadata を読まずに済むよう、バージョンを埋め込んでおく
+        # setup.py と同じく BUILD_PROFILE=debug の場合は +debug を付ける
+        write_version_module()
+
         if platform.target.os == "raspberry-pi-os":
             # libcamerac.so を sora_sdk_ext.*.so と同じディレクトリにコピーする
             libcamerac_so = os.path.join(sora_info.sora_install_dir, "lib", "libcamerac.so")
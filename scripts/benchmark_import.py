@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+import sora_sdk にかかる時間を計測するスクリプトです。
+
+毎回新しいプロセスで以下を実行し、中央値を表示します。
+
+- import sora_sdk して __version__ を参照する (拡張モジュールは読み込まれない)
+- from sora_sdk import Sora する (拡張モジュールが読み込まれる)
+
+Usage:
+    uv run python scripts/benchmark_import.py [--count N]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+CASES = {
+    "import sora_sdk; sora_sdk.__version__": "import sora_sdk; sora_sdk.__version__",
+    "from sora_sdk import Sora": "from sora_sdk import Sora",
+}
+
+# 子プロセスで計測するコード、 Python の起動時間を含めないように import の前後だけを計る
+MEASURE = """
+import time
+start = time.perf_counter()
+{code}
+print(time.perf_counter() - start)
+"""
+
+
+def measure(code: str, count: int) -> list[float]:
+    results = []
+    for _ in range(count):
+        output = subprocess.check_output(
+            [sys.executable, "-c", MEASURE.format(code=code)], text=True
+        )
+        results.append(float(output.strip()))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=10, help="計測する回数")
+    args = parser.parse_args()
+
+    for name, code in CASES.items():
+        results = measure(code, args.count)
+        print(
+            f"{name}: median={statistics.median(results) * 1000:.2f} ms "
+            f"min={min(results) * 1000:.2f} ms max={max(results) * 1000:.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+# setup.py と run.py の両方から、パッケージに埋め込むバージョンを書き出すために使う
+import os
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+
+def get_sdk_version() -> str:
+    """VERSION ファイルのバージョンに、ビルドの種類に応じたローカルバージョンを付けて返す"""
+    with open(os.path.join(BASE_DIR, "VERSION"), "r") as f:
+        version = f.read().strip()
+
+    build_profile = os.getenv("BUILD_PROFILE")
+    if build_profile == "debug":
+        version += "+debug"
+    return version
+
+
+def write_version_module() -> str:
+    """import 時に importlib.metadata を読まずに済むよう、パッケージにバージョンを埋め込む"""
+    version = get_sdk_version()
+    with open(os.path.join(BASE_DIR, "src", "sora_sdk", "_version.py"), "w") as f:
+        f.write(f'__version__ = "{version}"\n')
+    return version
@@ -10,15 +10,12 @@ sys.path.insert(0, BASE_DIR)
 
 
 from buildbase import PlatformTarget, cd, get_build_platform  # noqa: E402
+from sdkversion import write_version_module  # noqa: E402
 
 
 def run_setup(build_platform, target_platform):
-    with open(os.path.join(BASE_DIR, "VERSION"), "r") as f:
-        version = f.read().strip()
-
-    build_profile = os.getenv("BUILD_PROFILE")
-    if build_profile == "debug":
-        version += "+debug"
+    # import 時に importlib.metadata を読まずに済むよう、パッケージにバージョンを埋め込む
+    version = write_version_module()
 
     plat = None
     additional_files = []
@@ -68,11 +68,18 @@ class DisposePublisher {
    * TODO(tnoho): 役割的に protected にして良いのでは。
    */
   virtual void Disposed() {
-    for (DisposeSubscriber* subscriber : subscribers_) {
+    // 通知を受けた DisposeSubscriber が RemoveSubscriber を呼んでも良いようにコピーしてから通知する
+    std::vector<DisposeSubscriber*> subscribers = subscribers_;
+    for (DisposeSubscriber* subscriber : subscribers) {
       subscriber->PublisherDisposed();
     }
   }
 
+ protected:
+  const std::vector<DisposeSubscriber*>& subscribers() const {
+    return subscribers_;
+  }
+
  private:
   std::vector<DisposeSubscriber*> subscribers_;
 };
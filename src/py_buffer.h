@@ -0,0 +1,48 @@
+#ifndef PY_BUFFER_H_
+#define PY_BUFFER_H_
+
+#include <cstddef>
+#include <cstdint>
+
+// nonobind
+#include <nanobind/nanobind.h>
+
+namespace nb = nanobind;
+
+/**
+ * Python のバッファプロトコルに対応したオブジェクトのメモリをコピーせずに参照する PyBuffer です。
+ *
+ * bytes, bytearray, memoryview, numpy.ndarray などを nb::bytes に変換することなく受け取るために用意しました。
+ * 連続したメモリを持たないオブジェクトが渡された場合は BufferError を送出します。
+ *
+ * 実装上の留意点：生成と破棄は GIL を保持した状態で行う必要があります。
+ * 参照しているメモリは PyBuffer が破棄されるまで有効ですが、
+ * GIL を解放している間に Python 側でオブジェクトが変更される可能性があるため、
+ * GIL を解放する場合は事前に必要な分をコピーしてください。
+ */
+class PyBuffer {
+ public:
+  PyBuffer(const PyBuffer&) = delete;
+  PyBuffer& operator=(const PyBuffer&) = delete;
+
+  /**
+   * @param obj バッファプロトコルに対応した Python オブジェクト
+   * @param writable 書き込み可能なバッファを要求するかどうか
+   */
+  explicit PyBuffer(nb::handle obj, bool writable = false) {
+    int flags = writable ? PyBUF_WRITABLE : PyBUF_SIMPLE;
+    if (PyObject_GetBuffer(obj.ptr(), &view_, flags) != 0) {
+      throw nb::python_error();
+    }
+  }
+  ~PyBuffer() { PyBuffer_Release(&view_); }
+
+  const uint8_t* data() const { return static_cast<const uint8_t*>(view_.buf); }
+  uint8_t* mutable_data() { return static_cast<uint8_t*>(view_.buf); }
+  size_t size() const { return static_cast<size_t>(view_.len); }
+
+ private:
+  Py_buffer view_;
+};
+
+#endif
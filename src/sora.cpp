@@ -1,30 +1,76 @@
+#include <algorithm>
+#include <chrono>
+#include <cmath>
+#include <condition_variable>
 #include <exception>
+#include <map>
+#include <stdexcept>
 
 #include "sora.h"
 
 // WebRTC
 #include <rtc_base/crypto_random.h>
 
+#include "gil.h"
+
 Sora::Sora(std::optional<std::string> openh264,
            std::optional<sora::VideoCodecPreference> video_codec_preference,
-           std::optional<bool> force_i420_conversion) {
-  factory_.reset(
-      new SoraFactory(openh264, video_codec_preference, force_i420_conversion));
-  ioc_.reset(new boost::asio::io_context(1));
-  thread_.reset(new std::thread([this]() {
-    auto guard = boost::asio::make_work_guard(*ioc_);
-    ioc_->run();
-  }));
+           std::optional<bool> force_i420_conversion,
+           int io_threads,
+           int contexts,
+           std::optional<std::vector<int>> thread_affinity,
+           int dtls_certificates,
+           bool prewarm_network) {
+  if (io_threads < 1) {
+    throw std::invalid_argument("io_threads must be 1 or greater");
+  }
+  if (dtls_certificates < 0) {
+    throw std::invalid_argument("dtls_certificates must be 0 or greater");
+  }
+  factory_.reset(new SoraFactory(openh264, video_codec_preference,
+                                 force_i420_conversion, contexts,
+                                 thread_affinity));
+  if (dtls_certificates > 0) {
+    // 証明書の生成は接続時間の大きな割合を占めるので、ここでまとめて生成しておく
+    auto pool = std::make_shared<SoraDtlsCertificatePool>(dtls_certificates);
+    for (size_t i = 0; i < factory_->GetContextCount(); i++) {
+      pc_factories_.push_back(
+          webrtc::make_ref_counted<SoraCertificatePeerConnectionFactory>(
+              factory_->GetPeerConnectionFactory(i), pool));
+    }
+  }
+  if (prewarm_network) {
+    factory_->StartNetworkUpdating();
+    prewarm_network_ = true;
+  }
+  // Sora C++ SDK は io_context を 1 スレッドで回す前提で書かれているので、
+  // スレッドごとに io_context を用意して Connection を振り分ける
+  for (int i = 0; i < io_threads; i++) {
+    iocs_.emplace_back(new boost::asio::io_context(1));
+  }
+  for (auto& ioc : iocs_) {
+    boost::asio::io_context* p = ioc.get();
+    threads_.emplace_back([p]() {
+      auto guard = boost::asio::make_work_guard(*p);
+      p->run();
+    });
+  }
 }
 
 Sora::~Sora() {
+  if (prewarm_network_) {
+    factory_->StopNetworkUpdating();
+  }
+  pc_factories_.clear();
   factory_.reset();
-  if (thread_) {
-    ioc_->stop();
-    thread_->join();
-    thread_ = nullptr;
-    ioc_ = nullptr;
+  for (auto& ioc : iocs_) {
+    ioc->stop();
   }
+  for (auto& thread : threads_) {
+    thread.join();
+  }
+  threads_.clear();
+  iocs_.clear();
   Disposed();
 }
 
@@ -77,12 +123,73 @@ nb::ref<SoraConnection> Sora::CreateConnection(
     std::optional<std::string> proxy_agent,
     std::optional<webrtc::DegradationPreference> degradation_preference,
     std::optional<std::string> user_agent) {
-  std::shared_ptr<SoraSignalingObserver> observer(new SoraSignalingObserver());
-  nb::ref<SoraConnection> conn = new SoraConnection(this, ioc_.get(), observer);
-  observer->SetSoraConnection(conn);
+  auto connection_config = CreateConnectionConfig(
+      signaling_urls, role, channel_id, client_id, bundle_id, metadata,
+      signaling_notify_metadata, audio_source, video_source, audio, video,
+      audio_codec_type, video_codec_type, video_bit_rate, audio_bit_rate,
+      video_vp9_params, video_av1_params, video_h264_params, audio_opus_params,
+      simulcast, spotlight, spotlight_number, simulcast_rid,
+      simulcast_request_rid, spotlight_focus_rid, spotlight_unfocus_rid,
+      forwarding_filter, forwarding_filters, data_channels,
+      data_channel_signaling, ignore_disconnect_websocket,
+      data_channel_signaling_timeout, disconnect_wait_timeout,
+      websocket_close_timeout, websocket_connection_timeout,
+      audio_streaming_language_code, insecure, client_cert, client_key, ca_cert,
+      proxy_url, proxy_username, proxy_password, proxy_agent,
+      degradation_preference, user_agent);
+  return CreateConnectionFromConfig(
+      connection_config, std::nullopt, std::nullopt, nb::none(), nb::none(),
+      nullptr, nullptr, audio_frame_transformer, video_frame_transformer);
+}
+
+nb::ref<SoraConnectionConfig> Sora::CreateConnectionConfig(
+    const nb::handle& signaling_urls,
+    const std::string& role,
+    const std::string& channel_id,
+    std::optional<std::string> client_id,
+    std::optional<std::string> bundle_id,
+    const nb::handle& metadata,
+    const nb::handle& signaling_notify_metadata,
+    nb::ref<SoraTrackInterface> audio_source,
+    nb::ref<SoraTrackInterface> video_source,
+    std::optional<bool> audio,
+    std::optional<bool> video,
+    std::optional<std::string> audio_codec_type,
+    std::optional<std::string> video_codec_type,
+    std::optional<int> video_bit_rate,
+    std::optional<int> audio_bit_rate,
+    const nb::handle& video_vp9_params,
+    const nb::handle& video_av1_params,
+    const nb::handle& video_h264_params,
+    const nb::handle& audio_opus_params,
+    std::optional<bool> simulcast,
+    std::optional<bool> spotlight,
+    std::optional<int> spotlight_number,
+    std::optional<std::string> simulcast_rid,
+    std::optional<std::string> simulcast_request_rid,
+    std::optional<std::string> spotlight_focus_rid,
+    std::optional<std::string> spotlight_unfocus_rid,
+    const nb::handle& forwarding_filter,
+    const nb::handle& forwarding_filters,
+    const nb::handle& data_channels,
+    std::optional<bool> data_channel_signaling,
+    std::optional<bool> ignore_disconnect_websocket,
+    std::optional<int> data_channel_signaling_timeout,
+    std::optional<int> disconnect_wait_timeout,
+    std::optional<int> websocket_close_timeout,
+    std::optional<int> websocket_connection_timeout,
+    std::optional<std::string> audio_streaming_language_code,
+    std::optional<bool> insecure,
+    std::optional<nb::bytes> client_cert,
+    std::optional<nb::bytes> client_key,
+    std::optional<nb::bytes> ca_cert,
+    std::optional<std::string> proxy_url,
+    std::optional<std::string> proxy_username,
+    std::optional<std::string> proxy_password,
+    std::optional<std::string> proxy_agent,
+    std::optional<webrtc::DegradationPreference> degradation_preference,
+    std::optional<std::string> user_agent) {
   sora::SoraSignalingConfig config;
-  config.pc_factory = factory_->GetPeerConnectionFactory();
-  config.observer = observer;
   config.signaling_urls = ConvertSignalingUrls(signaling_urls);
   config.role = role;
   config.channel_id = channel_id;
@@ -211,12 +318,72 @@ nb::ref<SoraConnection> Sora::CreateConnection(
         "Mozilla 5.0 (Sora Unity SDK/" BOOST_PP_STRINGIZE(SORA_PYTHON_SDK_VERSION) ")");
   }
 
-  config.network_manager = factory_->default_network_manager();
-  config.socket_factory = factory_->default_socket_factory();
-
   config.sora_client =
       "Sora Python SDK " BOOST_PP_STRINGIZE(SORA_PYTHON_SDK_VERSION);
 
+  nb::ref<SoraConnectionConfig> connection_config =
+      new SoraConnectionConfig(this, config, audio_source, video_source);
+  return connection_config;
+}
+
+nb::ref<SoraConnection> Sora::CreateConnectionFromConfig(
+    nb::ref<SoraConnectionConfig> connection_config,
+    std::optional<std::string> client_id,
+    std::optional<std::string> bundle_id,
+    const nb::handle& metadata,
+    const nb::handle& signaling_notify_metadata,
+    nb::ref<SoraTrackInterface> audio_source,
+    nb::ref<SoraTrackInterface> video_source,
+    SoraAudioFrameTransformer* audio_frame_transformer,
+    SoraVideoFrameTransformer* video_frame_transformer) {
+  // ソースやネットワーク関連の設定は生成元の Sora に紐づいているので、別の Sora では使えない
+  if (connection_config->owner() != this) {
+    throw std::invalid_argument(
+        "config must be created by the same Sora instance");
+  }
+  // 変換済みの設定をコピーして、 Connection ごとに異なる値だけを設定する
+  sora::SoraSignalingConfig config = connection_config->signaling_config();
+  if (client_id) {
+    config.client_id = *client_id;
+  }
+  if (bundle_id) {
+    config.bundle_id = *bundle_id;
+  }
+  if (!metadata.is_none()) {
+    config.metadata =
+        ConvertJsonValue(metadata, "Invalid JSON value in metadata");
+  }
+  if (!signaling_notify_metadata.is_none()) {
+    config.signaling_notify_metadata =
+        ConvertJsonValue(signaling_notify_metadata,
+                         "Invalid JSON value in signaling_notify_metadata");
+  }
+  if (!audio_source) {
+    audio_source = connection_config->audio_source();
+  }
+  if (!video_source) {
+    video_source = connection_config->video_source();
+  }
+
+  std::shared_ptr<SoraSignalingObserver> observer(new SoraSignalingObserver());
+  // 順番に振り分けて、コールバックの遅い Connection が他の Connection のシグナリングを止めないようにする
+  boost::asio::io_context* ioc = iocs_[next_ioc_index_++ % iocs_.size()].get();
+  nb::ref<SoraConnection> conn =
+      new SoraConnection(this, ioc, observer, connection_count_);
+  observer->SetSoraConnection(conn);
+  // ソースは 0 番目の context で生成しているので、送信する Connection は同じ context を使う
+  // 受信のみの Connection は順番に振り分けてデコードなどの処理を分散させる
+  size_t context_index = 0;
+  if (config.role == "recvonly") {
+    context_index = next_context_index_++ % factory_->GetContextCount();
+  }
+  config.pc_factory = pc_factories_.empty()
+                          ? factory_->GetPeerConnectionFactory(context_index)
+                          : pc_factories_[context_index];
+  config.observer = observer;
+  config.network_manager = factory_->default_network_manager(context_index);
+  config.socket_factory = factory_->default_socket_factory(context_index);
+
   conn->Init(config);
   if (audio_source) {
     conn->SetAudioTrack(audio_source);
@@ -234,6 +401,120 @@ nb::ref<SoraConnection> Sora::CreateConnection(
   return conn;
 }
 
+nb::dict Sora::ConnectMany(std::vector<nb::ref<SoraConnection>> connections,
+                           int max_concurrent,
+                           float timeout) {
+  if (max_concurrent < 1) {
+    throw std::invalid_argument("max_concurrent must be 1 or greater");
+  }
+  // 既に connect を呼んだ Connection は接続処理の終わりを数えられないので受け付けない
+  for (auto& conn : connections) {
+    if (conn->IsConnectStarted()) {
+      throw std::invalid_argument(
+          "connections must not contain a connection that has already been "
+          "connected");
+    }
+  }
+  // タイムアウトした後にコールバックが呼ばれても良いように shared_ptr で共有する
+  struct State {
+    std::condition_variable_any cv;
+    size_t settled = 0;
+  };
+  auto state = std::make_shared<State>();
+
+  auto deadline = std::chrono::steady_clock::now() +
+                  std::chrono::duration_cast<std::chrono::nanoseconds>(
+                      std::chrono::duration<float>(timeout));
+  bool timed_out = false;
+  size_t started = 0;
+  for (auto& conn : connections) {
+    {
+      // コールバックは GIL を保持して呼ばれるので GIL で排他する
+      GILLock lock;
+      if (!state->cv.wait_until(lock, deadline, [&]() {
+            return started - state->settled <
+                   static_cast<size_t>(max_concurrent);
+          })) {
+        timed_out = true;
+        break;
+      }
+      // この呼び出しで connect を呼んだ Connection だけを数える
+      conn->SetOnSetupSettled([state]() {
+        state->settled++;
+        state->cv.notify_all();
+      });
+    }
+    conn->Connect();
+    started++;
+  }
+  if (!timed_out) {
+    GILLock lock;
+    timed_out = !state->cv.wait_until(
+        lock, deadline, [&]() { return state->settled >= started; });
+  }
+
+  nb::list timings;
+  std::map<std::string, std::vector<double>> values;
+  for (auto& conn : connections) {
+    nb::dict conn_timings = conn->GetTimings();
+    for (auto [key, value] : conn_timings) {
+      if (!value.is_none()) {
+        values[nb::borrow<nb::str>(key).c_str()].push_back(
+            nb::cast<double>(value));
+      }
+    }
+    timings.append(conn_timings);
+  }
+  nb::dict percentiles;
+  for (auto& [key, samples] : values) {
+    std::sort(samples.begin(), samples.end());
+    // nearest-rank 法で求める
+    auto percentile = [&samples](double p) {
+      size_t rank = static_cast<size_t>(std::ceil(p / 100 * samples.size()));
+      return samples[std::max<size_t>(rank, 1) - 1];
+    };
+    nb::dict result;
+    result["p50"] = percentile(50);
+    result["p90"] = percentile(90);
+    result["p99"] = percentile(99);
+    percentiles[key.c_str()] = result;
+  }
+
+  nb::dict result;
+  result["timings"] = timings;
+  result["percentiles"] = percentiles;
+  result["timed_out"] = timed_out;
+  // タイムアウトしたために connect を呼ばなかった Connection
+  nb::list not_started;
+  for (size_t i = started; i < connections.size(); i++) {
+    not_started.append(connections[i]);
+  }
+  result["not_started"] = not_started;
+  return result;
+}
+
+bool Sora::DisconnectAll(std::optional<float> timeout) {
+  // DisconnectAsync の中で Python が呼ばれて Connection が破棄されても良いように、先に参照を取っておく
+  std::vector<nb::ref<SoraConnection>> connections;
+  for (auto* subscriber : subscribers()) {
+    if (auto* conn = dynamic_cast<SoraConnection*>(subscriber)) {
+      connections.push_back(conn);
+    }
+  }
+  nb::list futures;
+  for (auto& conn : connections) {
+    futures.append(conn->DisconnectAsync());
+  }
+  nb::object timeout_object = nb::none();
+  if (timeout) {
+    timeout_object = nb::float_(*timeout);
+  }
+  // concurrent.futures.wait は待っている間 GIL を解放する
+  nb::object result = nb::module_::import_("concurrent.futures")
+                          .attr("wait")(futures, timeout_object);
+  return nb::len(result.attr("not_done")) == 0;
+}
+
 nb::ref<SoraAudioSource> Sora::CreateAudioSource(size_t channels,
                                                  int sample_rate) {
   auto source =
@@ -261,6 +542,38 @@ nb::ref<SoraVideoSource> Sora::CreateVideoSource() {
   return video_source;
 }
 
+nb::ref<SoraTrackInterface> Sora::CreateMirrorSource(
+    nb::ref<SoraTrackInterface> origin) {
+  if (!origin->GetTrack()) {
+    throw std::runtime_error("The origin track has already been disposed");
+  }
+  std::string kind = origin->kind();
+  std::string track_id = webrtc::CreateRandomString(16);
+  if (kind == webrtc::MediaStreamTrackInterface::kAudioKind) {
+    auto source = webrtc::make_ref_counted<SoraMirrorAudioSourceInterface>();
+    auto track = factory_->GetPeerConnectionFactory()->CreateAudioTrack(
+        track_id, source.get());
+    nb::ref<SoraTrackInterface> mirror =
+        new SoraAudioTrackMirror(this, source, track, origin);
+    return mirror;
+  }
+  if (kind == webrtc::MediaStreamTrackInterface::kVideoKind) {
+    sora::ScalableVideoTrackSourceConfig config;
+    auto source =
+        webrtc::make_ref_counted<sora::ScalableVideoTrackSource>(config);
+    auto track = factory_->GetPeerConnectionFactory()->CreateVideoTrack(
+        source, track_id);
+    nb::ref<SoraTrackInterface> mirror =
+        new SoraVideoTrackMirror(this, source, track, origin);
+    return mirror;
+  }
+  throw std::invalid_argument("Unknown track kind: " + kind);
+}
+
+int Sora::GetConnectionCount() const {
+  return connection_count_->load();
+}
+
 #if USE_V4L2
 nb::ref<SoraTrackInterface> Sora::CreateLibcameraSource(
     int width,
@@ -1,8 +1,10 @@
 #ifndef SORA_H_
 #define SORA_H_
 
+#include <atomic>
 #include <memory>
 #include <optional>
+#include <thread>
 #include <vector>
 
 // nonobind
@@ -17,9 +19,12 @@
 #include "dispose_listener.h"
 #include "sora_audio_source.h"
 #include "sora_connection.h"
+#include "sora_connection_config.h"
+#include "sora_dtls_certificate_pool.h"
 #include "sora_factory.h"
 #include "sora_frame_transformer.h"
 #include "sora_track_interface.h"
+#include "sora_track_mirror.h"
 #include "sora_video_source.h"
 
 /**
@@ -28,7 +33,8 @@
  * SoraFactory を内包し Connection や AudioSource、VideoSource を生成します。
  * 一つの Sora インスタンスから複数の Connection、AudioSource、VideoSource が生成できます。
  * 同じ Sora インスタンス内でしか Connection や AudioSource、VideoSource を共有できないので、
- * 複数の Sora インスタンスを生成することは不具合の原因になります。
+ * 複数の Sora インスタンスを使う場合は CreateMirrorSource で他の Sora インスタンスのソースを転送するか、
+ * これを行う SoraPool を利用してください。
  */
 class Sora : public CountedPublisher {
  public:
@@ -38,10 +44,24 @@ class Sora : public CountedPublisher {
    * @param openh264 (オプション) OpenH264 ライブラリへのパス
    * @param video_codec_preference (オプション) 利用するエンコーダ/デコーダの実装の設定
    * @param force_i420_conversion (オプション) エンコーダに渡す前に I420 に変換するかどうかの設定
+   * @param io_threads シグナリングやコールバックの呼び出しを行うスレッドの数
+   *                   Connection は生成順にスレッドへ振り分けられ、同じスレッドの Connection 同士でのみ影響し合います
+   * @param contexts WebRTC のネットワーク、ワーカー、シグナリングのスレッドの組の数
+   *                 受信のみの Connection は生成順に振り分けられ、送信する Connection は 1 組目を使います
+   * @param thread_affinity (オプション) i 組目のスレッドを thread_affinity[i % len(thread_affinity)] 番の CPU に固定します
+   *                        Linux のみ対応しています
+   * @param dtls_certificates 事前に生成して Connection 間で使い回す DTLS の証明書の数
+   *                          0 の場合は Connection ごとに証明書を生成します
+   * @param prewarm_network ネットワークインターフェースの列挙を事前に開始して Connection 間で使い回すかどうか
    */
   Sora(std::optional<std::string> openh264,
        std::optional<sora::VideoCodecPreference> video_codec_preference,
-       std::optional<bool> force_i420_conversion);
+       std::optional<bool> force_i420_conversion,
+       int io_threads,
+       int contexts,
+       std::optional<std::vector<int>> thread_affinity,
+       int dtls_certificates,
+       bool prewarm_network);
   ~Sora();
 
   /**
@@ -153,6 +173,122 @@ class Sora : public CountedPublisher {
       std::optional<webrtc::DegradationPreference> degradation_preference,
       std::optional<std::string> user_agent);
 
+  /**
+   * 複数の Connection の生成に使い回せる SoraConnectionConfig を生成します。
+   *
+   * 引数は CreateConnection と同じで、 metadata などの変換と検証はここで 1 度だけ行います。
+   * 同じ設定で多くの Connection を生成する場合に、 CreateConnection を繰り返し呼ぶよりも速く生成できます。
+   * Encoded Transform は Connection ごとに異なるため、 CreateConnectionFromConfig で指定してください。
+   *
+   * @return SoraConnectionConfig インスタンス
+   */
+  nb::ref<SoraConnectionConfig> CreateConnectionConfig(
+      // 必須パラメータ
+      const nb::handle& signaling_urls,
+      const std::string& role,
+      const std::string& channel_id,
+
+      // オプショナルパラメータ
+      // （Python 側で省略するか None が指定された場合には C++ SDK のデフォルト値が使われる）
+      std::optional<std::string> client_id,
+      std::optional<std::string> bundle_id,
+      const nb::handle& metadata,
+      const nb::handle& signaling_notify_metadata,
+      nb::ref<SoraTrackInterface> audio_source,
+      nb::ref<SoraTrackInterface> video_source,
+      std::optional<bool> audio,
+      std::optional<bool> video,
+      std::optional<std::string> audio_codec_type,
+      std::optional<std::string> video_codec_type,
+      std::optional<int> video_bit_rate,
+      std::optional<int> audio_bit_rate,
+      const nb::handle& video_vp9_params,
+      const nb::handle& video_av1_params,
+      const nb::handle& video_h264_params,
+      const nb::handle& audio_opus_params,
+      std::optional<bool> simulcast,
+      std::optional<bool> spotlight,
+      std::optional<int> spotlight_number,
+      std::optional<std::string> simulcast_rid,
+      std::optional<std::string> simulcast_request_rid,
+      std::optional<std::string> spotlight_focus_rid,
+      std::optional<std::string> spotlight_unfocus_rid,
+      const nb::handle& forwarding_filter,
+      const nb::handle& forwarding_filters,
+      const nb::handle& data_channels,
+      std::optional<bool> data_channel_signaling,
+      std::optional<bool> ignore_disconnect_websocket,
+      std::optional<int> data_channel_signaling_timeout,
+      std::optional<int> disconnect_wait_timeout,
+      std::optional<int> websocket_close_timeout,
+      std::optional<int> websocket_connection_timeout,
+      std::optional<std::string> audio_streaming_language_code,
+      std::optional<bool> insecure,
+      std::optional<nb::bytes> client_cert,
+      std::optional<nb::bytes> client_key,
+      std::optional<nb::bytes> ca_cert,
+      std::optional<std::string> proxy_url,
+      std::optional<std::string> proxy_username,
+      std::optional<std::string> proxy_password,
+      std::optional<std::string> proxy_agent,
+      std::optional<webrtc::DegradationPreference> degradation_preference,
+      std::optional<std::string> user_agent);
+  /**
+   * SoraConnectionConfig から Connection を生成します。
+   *
+   * 引数を指定した値のみ SoraConnectionConfig の値を上書きします。
+   *
+   * @param config この Sora インスタンスの CreateConnectionConfig で生成した SoraConnectionConfig 別の Sora インスタンスで生成したものは ValueError になります
+   * @param client_id (オプション)クライアント ID
+   * @param bundle_id (オプション)バンドル ID
+   * @param metadata (オプション)認証メタデータ
+   * @param signaling_notify_metadata (オプション)シグナリング通知メタデータ
+   * @param audio_source (オプション)音声ソース
+   * @param video_source (オプション)映像ソース
+   * @param audio_frame_transformer (オプション)音声送信時の Encoded Transform
+   * @param video_frame_transformer (オプション)映像送信時の Encoded Transform
+   * @return SoraConnection インスタンス
+   */
+  nb::ref<SoraConnection> CreateConnectionFromConfig(
+      nb::ref<SoraConnectionConfig> config,
+      std::optional<std::string> client_id,
+      std::optional<std::string> bundle_id,
+      const nb::handle& metadata,
+      const nb::handle& signaling_notify_metadata,
+      nb::ref<SoraTrackInterface> audio_source,
+      nb::ref<SoraTrackInterface> video_source,
+      SoraAudioFrameTransformer* audio_frame_transformer,
+      SoraVideoFrameTransformer* video_frame_transformer);
+
+  /**
+   * 複数の Connection の接続を、同時に接続処理を行う数を制限しながら順番に開始します。
+   *
+   * 接続が確立するか切断されるまでを接続処理中として、接続処理中の Connection が max_concurrent 未満になるたびに次の Connection の connect を呼びます。
+   * 多くの Connection の WebSocket の接続や ICE の処理が一度に集中しないようにするためのものです。
+   * 待っている間は GIL を解放します。
+   *
+   * @param connections 接続する Connection のリスト 既に connect を呼んだものが含まれている場合は ValueError になります
+   * @param max_concurrent 同時に接続処理を行う Connection の最大数
+   * @param timeout 全ての Connection の接続処理が終わるのを待つ最大秒数
+   * @return timings に Connection ごとの SoraConnection::GetTimings の結果、
+   *         percentiles に段階ごとの p50, p90, p99 、 timed_out にタイムアウトしたかどうか、
+   *         not_started にタイムアウトしたために connect を呼ばなかった Connection のリストを格納した dict
+   */
+  nb::dict ConnectMany(std::vector<nb::ref<SoraConnection>> connections,
+                       int max_concurrent,
+                       float timeout);
+
+  /**
+   * この Sora インスタンスで生成した全ての Connection を並行して切断します。
+   *
+   * 全ての Connection で SoraConnection::DisconnectAsync を呼んでから、まとめて完了を待ちます。
+   * 待っている間は GIL を解放します。
+   *
+   * @param timeout (オプション) 切断の完了を待つ最大秒数 None の場合は全ての切断が完了するまで待ちます
+   * @return 全ての切断が完了した場合は true 、タイムアウトした場合は false
+   */
+  bool DisconnectAll(std::optional<float> timeout);
+
   /**
    * Sora に音声データを送る受け口である SoraAudioSource を生成します。
    * 
@@ -175,6 +311,24 @@ class Sora : public CountedPublisher {
    * @return SoraVideoSource インスタンス
    */
   nb::ref<SoraVideoSource> CreateVideoSource();
+  /**
+   * 別の Sora インスタンスで生成されたトラックの内容を転送する SoraTrackInterface を生成します。
+   *
+   * Sora インスタンスをまたいで AudioSource や VideoSource を Connection に渡すことはできないため、
+   * 転送元のトラックに Sink として取り付いて、この Sora インスタンスで生成したトラックに内容を渡します。
+   * 映像はフレームのバッファを共有するため、 Sora インスタンスごとに変換やコピーは発生しません。
+   *
+   * @param origin 転送元のトラック 別の Sora インスタンスで生成した AudioSource や VideoSource を渡してください
+   * @return SoraTrackInterface インスタンス
+   */
+  nb::ref<SoraTrackInterface> CreateMirrorSource(
+      nb::ref<SoraTrackInterface> origin);
+  /**
+   * 生成して、まだ切断も破棄もされていない Connection の数を返します。
+   *
+   * SoraPool が Connection を振り分ける Sora インスタンスを選ぶために使います。
+   */
+  int GetConnectionCount() const;
 
 #if USE_V4L2
   nb::ref<SoraTrackInterface> CreateLibcameraSource(
@@ -209,7 +363,16 @@ class Sora : public CountedPublisher {
   ConvertForwardingFilter(const nb::handle value);
 
   std::unique_ptr<SoraFactory> factory_;
-  std::unique_ptr<boost::asio::io_context> ioc_;
-  std::unique_ptr<std::thread> thread_;
+  // dtls_certificates が指定された場合に証明書を設定する context ごとの pc_factory
+  std::vector<webrtc::scoped_refptr<webrtc::PeerConnectionFactoryInterface>>
+      pc_factories_;
+  bool prewarm_network_ = false;
+  std::vector<std::unique_ptr<boost::asio::io_context>> iocs_;
+  std::vector<std::thread> threads_;
+  // CreateConnection は GIL を保持した状態で呼ばれるので排他は不要
+  size_t next_ioc_index_ = 0;
+  size_t next_context_index_ = 0;
+  std::shared_ptr<std::atomic<int>> connection_count_ =
+      std::make_shared<std::atomic<int>>(0);
 };
 #endif
@@ -44,7 +44,11 @@ void SoraAudioSinkImpl::Disposed() {
 }
 
 void SoraAudioSinkImpl::PublisherDisposed() {
-  Disposed();
+  // Track の受信が終わったら Python で破棄されるのを待たずに Track から外れて、
+  // Track を解放できるようにしてからバッファを解放する
+  Del();
+  std::unique_lock<std::mutex> lock(buffer_mtx_);
+  buffer_ = webrtc::BufferT<int16_t>();
 }
 
 void SoraAudioSinkImpl::OnData(
@@ -170,7 +170,9 @@ void SoraAudioStreamSinkImpl::Disposed() {
 }
 
 void SoraAudioStreamSinkImpl::PublisherDisposed() {
-  Disposed();
+  // Track の受信が終わったら Python で破棄されるのを待たずに Track から外れて、
+  // Track を解放できるようにする
+  Del();
 }
 
 void SoraAudioStreamSinkImpl::OnData(
@@ -1,39 +1,101 @@
 #include "sora_connection.h"
 
+#include <algorithm>
 #include <chrono>
 #include <future>
+#include <iterator>
 #include <stdexcept>
 
 // WebRTC
+#include <api/environment/environment_factory.h>
+#include <api/task_queue/task_queue_factory.h>
 #include <rtc_base/crypto_random.h>
+#include <rtc_base/logging.h>
 
 // Sora C++ SDK
 #include <sora/rtc_stats.h>
 
 // Boost
+#include <boost/asio/post.hpp>
 #include <boost/asio/signal_set.hpp>
+#include <boost/json.hpp>
 
 // nonobind
 #include <nanobind/nanobind.h>
+#include <nanobind/ndarray.h>
 
 #include "gil.h"
+#include "py_buffer.h"
 #include "sora_call.h"
 
 namespace nb = nanobind;
 
-SoraConnection::SoraConnection(CountedPublisher* publisher,
-                               boost::asio::io_context* ioc,
-                               std::shared_ptr<SoraSignalingObserver> observer)
+namespace {
+
+// send_blob で送るチャンクのヘッダ
+// magic (4 バイト) + blob ID (4 バイト) + 全体のサイズ (8 バイト) + オフセット (8 バイト)
+const char kBlobMagic[4] = {'S', 'B', 'L', 'B'};
+const size_t kBlobHeaderSize = 24;
+// max_buffered_amount_ が設定されていない時に send_blob で送信キューに積む最大量
+const uint64_t kDefaultBlobBufferedAmount = 1024 * 1024;
+
+bool HasBlobHeader(const std::string& data) {
+  return data.size() >= kBlobHeaderSize &&
+         data.compare(0, sizeof(kBlobMagic), kBlobMagic, sizeof(kBlobMagic)) ==
+             0;
+}
+
+void AppendUint(std::string& buf, uint64_t value, int bytes) {
+  for (int i = bytes - 1; i >= 0; --i) {
+    buf.push_back(static_cast<char>((value >> (i * 8)) & 0xff));
+  }
+}
+
+uint64_t ReadUint(const std::string& buf, size_t offset, int bytes) {
+  uint64_t value = 0;
+  for (int i = 0; i < bytes; ++i) {
+    value = (value << 8) | static_cast<uint8_t>(buf[offset + i]);
+  }
+  return value;
+}
+
+}  // namespace
+
+SoraConnection::SoraConnection(
+    CountedPublisher* publisher,
+    boost::asio::io_context* ioc,
+    std::shared_ptr<SoraSignalingObserver> observer,
+    std::shared_ptr<std::atomic<int>> connection_count)
     : publisher_(publisher),
       ioc_(ioc),
       observer_(observer),
       audio_source_(nullptr),
-      video_source_(nullptr) {
+      video_source_(nullptr),
+      connection_count_(connection_count) {
   publisher_->AddSubscriber(this);
+  connection_count_->fetch_add(1);
 }
 
 SoraConnection::~SoraConnection() {
+  if (conn_ && ioc_->get_executor().running_in_this_thread()) {
+    // コールバックの中で最後の参照が消された場合は ioc_ のスレッドを待てないので、その場で後始末する
+    // ioc_ に積まれているハンドラは alive_ が消えていれば this に触らない
+    StartDisconnect();
+    if (message_batch_timer_) {
+      message_batch_timer_->cancel();
+    }
+    if (reconnect_timer_) {
+      reconnect_timer_->cancel();
+    }
+    // コールバックを呼び出している途中の sora::SoraSignaling を破棄しないよう、解放はコールバックから戻った後に行う
+    boost::asio::post(*ioc_, [conn = std::move(conn_)]() {});
+    FinishDisconnect();
+  }
   Disconnect();
+  // send_queue_ をメンバの破棄に任せると GIL を保持したまま終了を待つことになるので、ここで止める
+  StopSendQueue();
+  // 接続せずに破棄された場合はここで減算する
+  ReleaseConnectionCount();
   Disposed();
   if (publisher_) {
     publisher_->RemoveSubscriber(this);
@@ -53,11 +115,69 @@ void SoraConnection::Disposed() {
   }
 }
 
-void SoraConnection::PublisherDisposed() {}
+void SoraConnection::PublisherDisposed() {
+  // Sora が破棄された後は設定に含まれるポインタが使えないので再接続しない
+  config_.reset();
+}
+
+nb::dict SoraConnection::GetTimings() const {
+  auto to_object = [](const std::optional<double>& timing) -> nb::object {
+    if (!timing) {
+      return nb::none();
+    }
+    return nb::float_(*timing);
+  };
+  nb::dict timings;
+  timings["ws_open"] = to_object(ws_open_time_);
+  timings["offer"] = to_object(offer_time_);
+  timings["connected"] = to_object(connected_time_);
+  timings["first_track"] = to_object(first_track_time_);
+  return timings;
+}
+
+void SoraConnection::SetOnSetupSettled(std::function<void()> on_setup_settled) {
+  if (setup_settled_) {
+    on_setup_settled();
+    return;
+  }
+  on_setup_settled_ = std::move(on_setup_settled);
+}
+
+bool SoraConnection::IsConnectStarted() const {
+  return connect_started_at_.has_value() || conn_ == nullptr;
+}
+
+void SoraConnection::RecordTiming(std::optional<double>& timing) {
+  if (timing || !connect_started_at_) {
+    return;
+  }
+  timing = std::chrono::duration<double>(std::chrono::steady_clock::now() -
+                                         *connect_started_at_)
+               .count();
+}
+
+void SoraConnection::SettleSetup() {
+  if (setup_settled_) {
+    return;
+  }
+  setup_settled_ = true;
+  if (on_setup_settled_) {
+    auto on_setup_settled = std::move(on_setup_settled_);
+    on_setup_settled_ = nullptr;
+    on_setup_settled();
+  }
+}
+
+void SoraConnection::ReleaseConnectionCount() {
+  if (connection_counted_.exchange(false)) {
+    connection_count_->fetch_sub(1);
+  }
+}
 
 void SoraConnection::Init(sora::SoraSignalingConfig& config) {
   // TODO(tnoho): 複数回の呼び出しは禁止なので、ちゃんと throw する
   config.io_context = ioc_;
+  config_ = config;
   conn_ = sora::SoraSignaling::Create(config);
 }
 
@@ -68,77 +188,516 @@ void SoraConnection::Connect() {
         "establish a new connection.");
   }
 
+  if (!auto_reconnect_) {
+    // 再接続しないなら PeerConnectionFactory などへの参照を持ち続ける必要はない
+    config_.reset();
+  }
+  connect_started_at_ = std::chrono::steady_clock::now();
   conn_->Connect();
 }
 
 void SoraConnection::Disconnect() {
+  if (conn_ && ioc_->get_executor().running_in_this_thread()) {
+    // on_message などのコールバックから呼ばれた場合、 OnDisconnect も後始末も ioc_ のスレッドで行うので待てない
+    // DisconnectAsync と同じく、後始末は OnDisconnect の後に ioc_ のスレッドで行う
+    DisconnectAsync();
+    return;
+  }
   if (conn_) {
-    Disposed();
-    conn_->Disconnect();
+    StartDisconnect();
     // OnDisconnect が来るまで待つ
+    // DisconnectAsync で切断を開始していた場合は ioc_ のスレッドでの後始末が終わるまで待つ
     {
       GILLock lock;
-      on_disconnect_cv_.wait(lock,
-                             [this]() -> bool { return on_disconnected_; });
+      on_disconnect_cv_.wait(lock, [this]() -> bool {
+        return on_disconnected_ && !finish_disconnect_pending_;
+      });
+    }
+    if (conn_ == nullptr) {
+      // ioc_ のスレッドで後始末が済んでいる
+      return;
+    }
+    // メッセージをまとめるタイマーは OnDisconnect でキャンセルしているが、
+    // 既にキューに積まれたハンドラが this を参照し終わるまで ioc_ のスレッドを待つ
+    // 再接続を待っている場合はタイマーを ioc_ のスレッドでキャンセルする
+    if (message_batch_timer_ || reconnect_timer_) {
+      std::promise<void> barrier;
+      std::future<void> future = barrier.get_future();
+      boost::asio::post(*ioc_, [this, &barrier]() {
+        if (reconnect_timer_) {
+          reconnect_timer_->cancel();
+        }
+        barrier.set_value();
+      });
+      gil_scoped_release release;
+      future.wait();
     }
-    // Connection から生成したものは、ここで消す
-    audio_sender_ = nullptr;
-    video_sender_ = nullptr;
-    conn_ = nullptr;
+    FinishDisconnect();
   }
 }
 
-void SoraConnection::SetAudioTrack(nb::ref<SoraTrackInterface> audio_source) {
-  // TODO(tnoho): audio_sender_ がないと意味がないので、エラーを返すようにするべき
-  if (audio_sender_) {
-    audio_sender_->SetTrack(audio_source->GetTrack().get());
+nb::object SoraConnection::DisconnectAsync() {
+  if (disconnect_future_.is_valid()) {
+    return disconnect_future_;
   }
-  if (audio_source_) {
-    audio_source_->RemoveSubscriber(this);
-    audio_source_ = nullptr;
+  nb::object future =
+      nb::module_::import_("concurrent.futures").attr("Future")();
+  // 後始末を途中で止めることはできないので、キャンセルできないようにしておく
+  future.attr("set_running_or_notify_cancel")();
+  if (conn_ == nullptr) {
+    future.attr("set_result")(nb::none());
+    return future;
   }
-  audio_source->AddSubscriber(this);
-  audio_source_ = audio_source;
+  disconnect_future_ = future;
+  StartDisconnect();
+  if (on_disconnected_) {
+    // 既に OnDisconnect が来ている場合は後始末だけ行う
+    PostFinishDisconnect();
+  }
+  return future;
+}
+
+void SoraConnection::StartDisconnect() {
+  if (disconnect_started_) {
+    return;
+  }
+  disconnect_started_ = true;
+  config_.reset();
+  Disposed();
+  StopSendQueue();
+  if (on_disconnected_ && reconnect_attempt_ > 0) {
+    // 再接続を待っている間は OnDisconnect が来ないので、ここで切断を通知する
+    ReleaseConnectionCount();
+    SettleSetup();
+    if (on_disconnect_) {
+      call_python(on_disconnect_, sora::SoraSignalingErrorCode::CLOSE_SUCCEEDED,
+                  std::string("Disconnected while waiting to reconnect"));
+    }
+  }
+  conn_->Disconnect();
+}
+
+void SoraConnection::PostFinishDisconnect() {
+  if (finish_disconnect_pending_) {
+    return;
+  }
+  finish_disconnect_pending_ = true;
+  // ioc_ に積むことで、メッセージをまとめるタイマーなど既にキューに積まれたハンドラの後に後始末を行う
+  // 後始末が終わるまではデストラクタの Disconnect で待つので this は破棄されない
+  boost::asio::post(*ioc_, [this, alive = std::weak_ptr<bool>(alive_)]() {
+    if (alive.expired()) {
+      return;
+    }
+    gil_scoped_acquire acq;
+    if (reconnect_timer_) {
+      reconnect_timer_->cancel();
+    }
+    FinishDisconnect();
+    nb::object future = std::move(disconnect_future_);
+    finish_disconnect_pending_ = false;
+    on_disconnect_cv_.notify_all();
+    if (future.is_valid()) {
+      future.attr("set_result")(nb::none());
+    }
+  });
+}
+
+void SoraConnection::FinishDisconnect() {
+  // Connection から生成したものは、ここで消す
+  audio_sender_ = nullptr;
+  video_sender_ = nullptr;
+  remote_tracks_.clear();
+  conn_ = nullptr;
+  config_.reset();
+}
+
+void SoraConnection::SetAudioTrack(nb::ref<SoraTrackInterface> audio_source) {
+  ReplaceTrack(audio_sender_, audio_source_, audio_source,
+               webrtc::MediaStreamTrackInterface::kAudioKind);
 }
 
 void SoraConnection::SetVideoTrack(nb::ref<SoraTrackInterface> video_source) {
-  // TODO(tnoho): video_sender_ がないと意味がないので、エラーを返すようにするべき
-  if (video_sender_) {
-    video_sender_->SetTrack(video_source->GetTrack().get());
+  ReplaceTrack(video_sender_, video_source_, video_source,
+               webrtc::MediaStreamTrackInterface::kVideoKind);
+}
+
+void SoraConnection::ReplaceTrack(
+    webrtc::scoped_refptr<webrtc::RtpSenderInterface> sender,
+    nb::ref<SoraTrackInterface>& current,
+    nb::ref<SoraTrackInterface> source,
+    const std::string& kind) {
+  webrtc::scoped_refptr<webrtc::MediaStreamTrackInterface> track;
+  if (source) {
+    track = source->GetTrack();
+    if (track == nullptr) {
+      throw std::runtime_error("The track has already been disposed.");
+    }
+    if (track->kind() != kind) {
+      throw std::invalid_argument("Expected " + kind + " track, but got " +
+                                  track->kind() + " track.");
+    }
   }
-  if (video_source_) {
-    video_source_->RemoveSubscriber(this);
-    video_source_ = nullptr;
+  if (current.get() == source.get()) {
+    return;
+  }
+  // 接続前は OnSetOffer で AddTrack するのでソースを差し替えるだけで良い
+  if (sender) {
+    bool result;
+    {
+      // SetTrack はシグナリングスレッドへの BlockingCall になり、
+      // シグナリングスレッドは GIL を待っていることがあるので GIL を解放する
+      gil_scoped_release release;
+      result = sender->SetTrack(track.get());
+    }
+    if (!result) {
+      throw std::runtime_error("Failed to replace the " + kind + " track.");
+    }
+  }
+  if (current) {
+    current->RemoveSubscriber(this);
+  }
+  current = source;
+  if (current) {
+    current->AddSubscriber(this);
   }
-  video_source->AddSubscriber(this);
-  video_source_ = video_source;
 }
 
 void SoraConnection::SetAudioSenderFrameTransformer(
     SoraAudioFrameTransformer* audio_sender_frame_transformer) {
-  // TODO(tnoho): audio_sender_ がないと意味がないので、エラーを返すようにするべき
-  auto interface =
-      audio_sender_frame_transformer->GetFrameTransformerInterface();
-  if (audio_sender_) {
-    audio_sender_->SetFrameTransformer(interface);
-  }
-  audio_sender_frame_transformer_ = interface;
+  SetSenderFrameTransformer(
+      audio_sender_, audio_sender_frame_transformer_,
+      audio_sender_frame_transformer
+          ? audio_sender_frame_transformer->GetFrameTransformerInterface()
+          : nullptr);
 }
 
 void SoraConnection::SetVideoSenderFrameTransformer(
     SoraVideoFrameTransformer* video_sender_frame_transformer) {
-  // TODO(tnoho): video_sender_ がないと意味がないので、エラーを返すようにするべき
-  auto interface =
-      video_sender_frame_transformer->GetFrameTransformerInterface();
-  if (video_sender_) {
-    video_sender_->SetFrameTransformer(interface);
+  SetSenderFrameTransformer(
+      video_sender_, video_sender_frame_transformer_,
+      video_sender_frame_transformer
+          ? video_sender_frame_transformer->GetFrameTransformerInterface()
+          : nullptr);
+}
+
+void SoraConnection::SetSenderFrameTransformer(
+    webrtc::scoped_refptr<webrtc::RtpSenderInterface> sender,
+    webrtc::scoped_refptr<SoraFrameTransformerInterface>& current,
+    webrtc::scoped_refptr<SoraFrameTransformerInterface> transformer) {
+  if (current == transformer) {
+    return;
+  }
+  if (transformer == nullptr) {
+    // libwebrtc は Audio で nullptr を渡しても外せないので、素通しする FrameTransformer に入れ替える
+    // current を StartShortCircuiting すると、同じ SoraFrameTransformer を使う他の接続まで短絡されてしまう
+    if (current && sender) {
+      gil_scoped_release release;
+      sender->SetFrameTransformer(
+          webrtc::make_ref_counted<SoraPassthroughFrameTransformer>());
+    }
+    current = nullptr;
+    return;
+  }
+  // 接続前は OnSetOffer で設定するので保持するだけで良い
+  if (sender) {
+    // SetFrameTransformer はワーカースレッドへの BlockingCall になり、
+    // エンコーダーのスレッドは Transform で GIL を待っていることがあるので GIL を解放する
+    gil_scoped_release release;
+    // 入れ替えると素通しする FrameTransformer のコールバックは登録が解除され、
+    // 新しく登録されるコールバックは短絡されていない状態になる
+    sender->SetFrameTransformer(transformer);
   }
-  video_sender_frame_transformer_ = interface;
+  current = transformer;
 }
 
 bool SoraConnection::SendDataChannel(const std::string& label,
-                                     nb::bytes& data) {
-  return conn_->SendDataChannel(label, std::string(data.c_str(), data.size()));
+                                     nb::handle data) {
+  auto conn = conn_;
+  if (conn == nullptr) {
+    return false;
+  }
+  // Sora C++ SDK は std::string で受け取るので、コピーはここでの 1 回だけにする
+  std::string buf;
+  {
+    PyBuffer view(data);
+    buf.assign(reinterpret_cast<const char*>(view.data()), view.size());
+  }
+  // 送信はネットワークスレッドへの BlockingCall になるので、その間は GIL を解放する
+  gil_scoped_release release;
+  return SendMessage(conn, label, buf);
+}
+
+nb::list SoraConnection::SendDataChannelMany(const std::string& label,
+                                             nb::handle data_list) {
+  std::vector<std::pair<std::string, std::string>> messages;
+  for (nb::handle data : data_list) {
+    PyBuffer view(data);
+    messages.emplace_back(
+        label,
+        std::string(reinterpret_cast<const char*>(view.data()), view.size()));
+  }
+  return SendDataChannelBatch(messages);
+}
+
+nb::list SoraConnection::SendDataChannelMany(nb::handle messages) {
+  std::vector<std::pair<std::string, std::string>> batch;
+  for (nb::handle message : messages) {
+    if (nb::len(message) != 2) {
+      throw nb::value_error("Each message must be a tuple of (label, data)");
+    }
+    nb::object label = message[0];
+    nb::object data = message[1];
+    PyBuffer view(data);
+    batch.emplace_back(
+        nb::cast<std::string>(label),
+        std::string(reinterpret_cast<const char*>(view.data()), view.size()));
+  }
+  return SendDataChannelBatch(batch);
+}
+
+nb::list SoraConnection::SendDataChannelBatch(
+    const std::vector<std::pair<std::string, std::string>>& messages) {
+  std::vector<char> results(messages.size(), false);
+  auto conn = conn_;
+  if (conn) {
+    // 送信中は GIL を解放し、全てのメッセージを 1 回の解放で送りきる
+    gil_scoped_release release;
+    for (size_t i = 0; i < messages.size(); ++i) {
+      results[i] = SendMessage(conn, messages[i].first, messages[i].second);
+    }
+  }
+  nb::list list;
+  for (char result : results) {
+    list.append(nb::bool_(result != 0));
+  }
+  return list;
+}
+
+bool SoraConnection::EnqueueDataChannel(const std::string& label,
+                                        nb::handle data,
+                                        bool block,
+                                        std::optional<float> timeout) {
+  if (conn_ == nullptr) {
+    return false;
+  }
+  std::string buf;
+  {
+    PyBuffer view(data);
+    buf.assign(reinterpret_cast<const char*>(view.data()), view.size());
+  }
+  return EnqueueMessage(label, std::move(buf), max_buffered_amount_, block,
+                        timeout);
+}
+
+bool SoraConnection::EnqueueMessage(const std::string& label,
+                                    std::string buf,
+                                    uint64_t max_buffered_amount,
+                                    bool block,
+                                    std::optional<float> timeout) {
+  auto conn = conn_;
+  if (conn == nullptr) {
+    return false;
+  }
+  {
+    // 開いていない label は送信に失敗するので、積む前に弾く
+    std::lock_guard<std::mutex> lock(data_channel_labels_mutex_);
+    if (data_channel_labels_.count(label) == 0) {
+      return false;
+    }
+  }
+  uint64_t size = buf.size();
+
+  {
+    // 空きを待つ場合があるので GIL を解放してから送信キューの量を確認する
+    gil_scoped_release release;
+    std::unique_lock<std::mutex> lock(buffered_amount_mutex_);
+    auto has_room = [&]() {
+      uint64_t amount = buffered_amounts_[label];
+      // max_buffered_amount より大きいデータでも送信キューが空なら積めるようにする
+      return max_buffered_amount == 0 || amount == 0 ||
+             amount + size <= max_buffered_amount;
+    };
+    if (!block) {
+      if (!has_room()) {
+        return false;
+      }
+    } else if (timeout) {
+      if (!buffered_amount_cv_.wait_for(
+              lock,
+              std::chrono::nanoseconds(
+                  // Python の流儀に合わせて秒を float で受け取っているので換算
+                  (int64_t)((double)*timeout * 1000. * 1000. * 1000.)),
+              has_room)) {
+        return false;
+      }
+    } else {
+      buffered_amount_cv_.wait(lock, has_room);
+    }
+    buffered_amounts_[label] += size;
+  }
+
+  std::lock_guard<std::mutex> queue_lock(send_queue_mutex_);
+  // GIL を解放している間に切断された場合は積まない
+  if (conn_ == nullptr || send_queue_stopped_) {
+    // StopSendQueue で既に消されている場合があるので、引き過ぎないようにする
+    std::lock_guard<std::mutex> lock(buffered_amount_mutex_);
+    uint64_t& amount = buffered_amounts_[label];
+    amount = amount > size ? amount - size : 0;
+    return false;
+  }
+  if (send_queue_ == nullptr) {
+    send_queue_ =
+        webrtc::CreateEnvironment().task_queue_factory().CreateTaskQueue(
+            "DataChannelSendQueue", webrtc::TaskQueueFactory::Priority::NORMAL);
+  }
+  send_queue_->PostTask([this, conn, label, buf = std::move(buf)]() {
+    bool sent = SendMessage(conn, label, buf);
+    bool low = false;
+    {
+      uint64_t threshold = buffered_amount_low_threshold_;
+      std::lock_guard<std::mutex> lock(buffered_amount_mutex_);
+      uint64_t& amount = buffered_amounts_[label];
+      low = amount > threshold && amount - buf.size() <= threshold;
+      amount -= buf.size();
+    }
+    buffered_amount_cv_.notify_all();
+    if (!sent || low) {
+      gil_scoped_acquire acq;
+      if (!sent && on_send_error_) {
+        call_python(on_send_error_, label);
+      }
+      if (low && on_buffered_amount_low_) {
+        call_python(on_buffered_amount_low_, label);
+      }
+    }
+  });
+  return true;
+}
+
+bool SoraConnection::SendBlob(const std::string& label,
+                              nb::handle data,
+                              size_t chunk_size,
+                              std::optional<float> timeout) {
+  if (chunk_size == 0) {
+    throw nb::value_error("chunk_size must be greater than 0");
+  }
+  if (conn_ == nullptr) {
+    return false;
+  }
+  uint64_t max_buffered_amount = max_buffered_amount_ != 0
+                                     ? max_buffered_amount_
+                                     : kDefaultBlobBufferedAmount;
+  uint32_t blob_id = next_blob_id_++;
+
+  // チャンクを積むたびに GIL を解放するが、 PyBuffer を保持している間はバッファの解放やリサイズは起きない
+  PyBuffer view(data);
+  uint64_t total_size = view.size();
+  uint64_t offset = 0;
+  do {
+    size_t size = static_cast<size_t>(
+        std::min<uint64_t>(chunk_size, total_size - offset));
+    std::string chunk;
+    chunk.reserve(kBlobHeaderSize + size);
+    chunk.append(kBlobMagic, sizeof(kBlobMagic));
+    AppendUint(chunk, blob_id, 4);
+    AppendUint(chunk, total_size, 8);
+    AppendUint(chunk, offset, 8);
+    chunk.append(reinterpret_cast<const char*>(view.data()) + offset, size);
+    if (!EnqueueMessage(label, std::move(chunk), max_buffered_amount, true,
+                        timeout)) {
+      return false;
+    }
+    offset += size;
+  } while (offset < total_size);
+  return true;
+}
+
+void SoraConnection::SetDataChannelCompression(const std::string& label,
+                                               int level,
+                                               nb::handle dictionary,
+                                               size_t max_decompressed_size) {
+  std::optional<std::string> dict;
+  if (!dictionary.is_none()) {
+    PyBuffer view(dictionary);
+    dict.emplace(reinterpret_cast<const char*>(view.data()), view.size());
+  }
+  auto compressor = std::make_shared<const SoraDataChannelCompressor>(
+      level, std::move(dict), max_decompressed_size);
+  std::lock_guard<std::mutex> lock(compressors_mutex_);
+  compressors_[label] = compressor;
+}
+
+void SoraConnection::RemoveDataChannelCompression(const std::string& label) {
+  std::lock_guard<std::mutex> lock(compressors_mutex_);
+  compressors_.erase(label);
+}
+
+std::shared_ptr<const SoraDataChannelCompressor> SoraConnection::GetCompressor(
+    const std::string& label) {
+  std::lock_guard<std::mutex> lock(compressors_mutex_);
+  auto it = compressors_.find(label);
+  return it == compressors_.end() ? nullptr : it->second;
+}
+
+bool SoraConnection::SendMessage(
+    const std::shared_ptr<sora::SoraSignaling>& conn,
+    const std::string& label,
+    const std::string& data) {
+  // 圧縮は GIL を解放した状態で送信するスレッドで行う
+  if (auto compressor = GetCompressor(label)) {
+    auto compressed = compressor->Compress(data);
+    if (!compressed) {
+      RTC_LOG(LS_WARNING) << "Failed to compress message: label=" << label;
+      return false;
+    }
+    return conn->SendDataChannel(label, *compressed);
+  }
+  return conn->SendDataChannel(label, data);
+}
+
+uint64_t SoraConnection::BufferedAmount(const std::string& label) {
+  std::lock_guard<std::mutex> lock(buffered_amount_mutex_);
+  auto it = buffered_amounts_.find(label);
+  return it == buffered_amounts_.end() ? 0 : it->second;
+}
+
+bool SoraConnection::WaitBufferedAmountLow(const std::string& label,
+                                           std::optional<float> timeout) {
+  gil_scoped_release release;
+  std::unique_lock<std::mutex> lock(buffered_amount_mutex_);
+  auto is_low = [&]() {
+    return buffered_amounts_[label] <= buffered_amount_low_threshold_.load();
+  };
+  if (timeout) {
+    return buffered_amount_cv_.wait_for(
+        lock,
+        std::chrono::nanoseconds(
+            (int64_t)((double)*timeout * 1000. * 1000. * 1000.)),
+        is_low);
+  }
+  buffered_amount_cv_.wait(lock, is_low);
+  return true;
+}
+
+void SoraConnection::StopSendQueue() {
+  std::unique_ptr<webrtc::TaskQueueBase, webrtc::TaskQueueDeleter> send_queue;
+  {
+    std::lock_guard<std::mutex> lock(send_queue_mutex_);
+    send_queue_stopped_ = true;
+    send_queue = std::move(send_queue_);
+  }
+  if (send_queue) {
+    // 送信キューのスレッドは on_send_error_ や on_buffered_amount_low_ の呼び出しで GIL を獲得するので、
+    // GIL を解放してから終了を待つ
+    gil_scoped_release release;
+    send_queue.reset();
+  }
+  {
+    // 送信されずに破棄されたデータの分を消して、空きを待っているスレッドを起こす
+    std::lock_guard<std::mutex> lock(buffered_amount_mutex_);
+    buffered_amounts_.clear();
+  }
+  buffered_amount_cv_.notify_all();
 }
 
 std::string SoraConnection::GetStats() {
@@ -159,6 +718,7 @@ std::string SoraConnection::GetStats() {
 
 void SoraConnection::OnSetOffer(std::string offer) {
   gil_scoped_acquire acq;
+  RecordTiming(offer_time_);
   std::string stream_id = webrtc::CreateRandomString(16);
   if (audio_source_) {
     webrtc::RTCErrorOr<webrtc::scoped_refptr<webrtc::RtpSenderInterface>>
@@ -191,15 +751,137 @@ void SoraConnection::OnSetOffer(std::string offer) {
 void SoraConnection::OnDisconnect(sora::SoraSignalingErrorCode ec,
                                   std::string message) {
   gil_scoped_acquire acq;
+  // まとめている途中の受信メッセージは切断を通知する前に渡しておく
+  FlushMessages();
+  // 受信途中の send_blob のデータは破棄する
+  blob_assemblies_.clear();
+  on_disconnected_ = true;
+  if (ShouldReconnect(ec)) {
+    // Connection の数や on_disconnect は再接続を諦めるまでそのままにする
+    ScheduleReconnect(ec, std::move(message));
+    on_disconnect_cv_.notify_all();
+    return;
+  }
+  // 再接続しないことが決まったので、設定は disconnect を待たずに捨てる
+  config_.reset();
+  // on_disconnect の中で次の Connection を生成した場合に、この Connection を数えないようにする
+  ReleaseConnectionCount();
+  SettleSetup();
   if (on_disconnect_) {
     call_python(on_disconnect_, ec, message);
   }
-  on_disconnected_ = true;
+  if (disconnect_future_.is_valid()) {
+    PostFinishDisconnect();
+  }
   on_disconnect_cv_.notify_all();
 }
 
+bool SoraConnection::ShouldReconnect(sora::SoraSignalingErrorCode ec) const {
+  // disconnect を呼んだ場合と、一度も接続が確立していない場合は再接続しない
+  if (!auto_reconnect_ || !config_ || disconnect_started_ || !connected_time_) {
+    return false;
+  }
+  if (reconnect_max_attempts_ > 0 &&
+      reconnect_attempt_ >= reconnect_max_attempts_) {
+    return false;
+  }
+  switch (ec) {
+    case sora::SoraSignalingErrorCode::WEBSOCKET_ONERROR:
+    case sora::SoraSignalingErrorCode::PEER_CONNECTION_STATE_FAILED:
+    case sora::SoraSignalingErrorCode::ICE_FAILED:
+      return true;
+    case sora::SoraSignalingErrorCode::WEBSOCKET_HANDSHAKE_FAILED:
+      // 再接続中はネットワークが戻るまで接続に失敗し続けるので、再接続を続ける
+      return reconnect_attempt_ > 0;
+    default:
+      // Sora から正常に切断された場合や設定が間違っている場合は再接続しても意味がない
+      return false;
+  }
+}
+
+void SoraConnection::ScheduleReconnect(sora::SoraSignalingErrorCode ec,
+                                       std::string message) {
+  reconnect_attempt_++;
+  int64_t delay_ms = reconnect_initial_delay_ms_;
+  for (int i = 1; i < reconnect_attempt_ && delay_ms < reconnect_max_delay_ms_;
+       i++) {
+    delay_ms *= 2;
+  }
+  delay_ms = std::min<int64_t>(delay_ms, reconnect_max_delay_ms_);
+  if (reconnect_timer_ == nullptr) {
+    reconnect_timer_.reset(new boost::asio::steady_timer(*ioc_));
+  }
+  reconnect_timer_->expires_after(std::chrono::milliseconds(delay_ms));
+  reconnect_timer_->async_wait(
+      [this, alive = std::weak_ptr<bool>(alive_), ec,
+       message = std::move(message)](const boost::system::error_code& error) {
+        if (error || alive.expired()) {
+          // キャンセルされた場合は this が破棄されている可能性があるので触らない
+          return;
+        }
+        gil_scoped_acquire acq;
+        if (disconnect_started_) {
+          return;
+        }
+        Reconnect(ec, message);
+      });
+}
+
+void SoraConnection::Reconnect(sora::SoraSignalingErrorCode ec,
+                               std::string message) {
+  if (on_reconnect_) {
+    call_python(on_reconnect_, reconnect_attempt_, ec, message);
+  }
+  // on_reconnect の中で disconnect が呼ばれた場合や、 Sora が破棄された場合は再接続しない
+  if (disconnect_started_ || !config_) {
+    return;
+  }
+  // 切断された PeerConnection の RtpReceiver や RtpSender は使えないので外す
+  RemoveRemoteTracks();
+  audio_sender_ = nullptr;
+  video_sender_ = nullptr;
+  on_disconnected_ = false;
+  {
+    // 新しい PeerConnection では DataChannel が開き直されるまで積めないようにする
+    std::lock_guard<std::mutex> lock(data_channel_labels_mutex_);
+    data_channel_labels_.clear();
+  }
+  // ソースや送信側の Encoded Transform は保持しているので、 OnSetOffer で新しい PeerConnection に設定される
+  conn_ = sora::SoraSignaling::Create(*config_);
+  conn_->Connect();
+}
+
+void SoraConnection::RemoveRemoteTracks() {
+  auto remote_tracks = std::move(remote_tracks_);
+  remote_tracks_.clear();
+  for (auto& [id, track] : remote_tracks) {
+    if (on_remove_track_) {
+      call_python(on_remove_track_, track);
+    }
+    track->Disposed();
+  }
+}
+
 void SoraConnection::OnNotify(std::string text) {
   gil_scoped_acquire acq;
+  if (!connected_time_ || reconnect_attempt_ > 0) {
+    // 自身の connection.created を受け取った時点を接続の確立とする
+    boost::system::error_code ec;
+    auto json = boost::json::parse(text, ec);
+    if (!ec && json.is_object()) {
+      const auto& object = json.as_object();
+      auto event_type = object.if_contains("event_type");
+      auto connection_id = object.if_contains("connection_id");
+      if (event_type && event_type->is_string() &&
+          event_type->as_string() == "connection.created" && connection_id &&
+          connection_id->is_string() &&
+          connection_id->as_string() == conn_->GetConnectionID()) {
+        RecordTiming(connected_time_);
+        SettleSetup();
+        reconnect_attempt_ = 0;
+      }
+    }
+  }
   if (on_notify_) {
     call_python(on_notify_, text);
   }
@@ -212,9 +894,158 @@ void SoraConnection::OnPush(std::string text) {
 }
 
 void SoraConnection::OnMessage(std::string label, std::string data) {
+  if (auto compressor = GetCompressor(label)) {
+    auto decompressed = compressor->Decompress(data);
+    if (!decompressed) {
+      RTC_LOG(LS_WARNING) << "Failed to decompress message: label=" << label;
+      return;
+    }
+    data = std::move(*decompressed);
+  }
+
+  // on_blob_ や max_blob_size_ は Python から GIL を保持して書き換えられるので、GIL を獲得してから参照する
+  // send_blob のヘッダで始まらないメッセージでは GIL を獲得しないように先に確認する
+  if (HasBlobHeader(data)) {
+    gil_scoped_acquire acq;
+    if (on_blob_ && HandleBlobChunk(label, data)) {
+      return;
+    }
+  }
+
+  size_t batch_size = message_batch_size_.load();
+  int batch_interval_ms = message_batch_interval_ms_.load();
+  if (batch_size == 0) {
+    // まとめている途中で 0 に変更された場合は、溜まっているメッセージを先に渡して順番を保つ
+    FlushMessages();
+    gil_scoped_acquire acq;
+    if (on_message_) {
+      call_python(on_message_, label, MessageToObject(std::move(data)));
+    }
+    return;
+  }
+
+  // まとめて渡す場合は GIL を獲得せずに溜めておく
+  pending_messages_.emplace_back(std::move(label), std::move(data));
+  // message_batch_interval_ms_ が 0 以下の場合は待たずに渡す
+  if (pending_messages_.size() >= batch_size || batch_interval_ms <= 0) {
+    FlushMessages();
+    return;
+  }
+  if (pending_messages_.size() == 1) {
+    if (message_batch_timer_ == nullptr) {
+      message_batch_timer_.reset(new boost::asio::steady_timer(*ioc_));
+    }
+    message_batch_timer_->expires_after(
+        std::chrono::milliseconds(batch_interval_ms));
+    message_batch_timer_->async_wait(
+        [this, alive = std::weak_ptr<bool>(alive_)](
+            const boost::system::error_code& ec) {
+          // キャンセルされた時は this が破棄されている可能性があるので触らない
+          if (ec || alive.expired()) {
+            return;
+          }
+          FlushMessages();
+        });
+  }
+}
+
+bool SoraConnection::HandleBlobChunk(const std::string& label,
+                                     const std::string& data) {
+  uint32_t blob_id = static_cast<uint32_t>(ReadUint(data, 4, 4));
+  uint64_t total_size = ReadUint(data, 8, 8);
+  uint64_t offset = ReadUint(data, 16, 8);
+  uint64_t size = data.size() - kBlobHeaderSize;
+  // ヘッダとして正しくない場合は、たまたま magic で始まる通常のメッセージとして扱う
+  if (offset > total_size || size > total_size - offset ||
+      (size == 0 && total_size != 0)) {
+    return false;
+  }
+
+  auto key = std::make_pair(label, blob_id);
+  auto it = blob_assemblies_.find(key);
+  if (it == blob_assemblies_.end()) {
+    // 相手が送ってきた全体のサイズで領域を確保するので、上限を超える場合は受信しない
+    if (total_size > max_blob_size_) {
+      RTC_LOG(LS_WARNING) << "Blob is too large: label=" << label
+                          << " blob_id=" << blob_id
+                          << " total_size=" << total_size;
+      return true;
+    }
+    if (blob_assemblies_.size() >= max_blob_assemblies_) {
+      RTC_LOG(LS_WARNING) << "Too many blobs are being received: label="
+                          << label << " blob_id=" << blob_id;
+      return true;
+    }
+    // 最初のチャンクを受信した時に全体のサイズ分の領域を確保しておき、以降はそこに書き込む
+    it = blob_assemblies_.emplace(key, BlobAssembly()).first;
+    it->second.buffer.resize(total_size);
+  } else if (it->second.buffer.size() != total_size) {
+    return false;
+  }
+  BlobAssembly& assembly = it->second;
+  std::copy(data.begin() + kBlobHeaderSize, data.end(),
+            assembly.buffer.begin() + offset);
+
+  // 受信済みの範囲に [offset, offset + size) を追加して、隣接するものや重なるものはまとめる
+  uint64_t begin = offset;
+  uint64_t end = offset + size;
+  auto& ranges = assembly.received_ranges;
+  auto range = ranges.upper_bound(begin);
+  if (range != ranges.begin() && std::prev(range)->second >= begin) {
+    --range;
+  }
+  while (range != ranges.end() && range->first <= end) {
+    begin = std::min(begin, range->first);
+    end = std::max(end, range->second);
+    range = ranges.erase(range);
+  }
+  ranges.emplace(begin, end);
+  bool complete = ranges.size() == 1 && ranges.begin()->first == 0 &&
+                  ranges.begin()->second == total_size;
+  if (!complete) {
+    return true;
+  }
+
+  std::string buffer = std::move(assembly.buffer);
+  blob_assemblies_.erase(it);
+  call_python(on_blob_, label, MessageToObject(std::move(buffer)));
+  return true;
+}
+
+nb::object SoraConnection::MessageToObject(std::string data) {
+  if (!message_as_memoryview_) {
+    return nb::bytes(data.c_str(), data.size());
+  }
+  // 受信したバッファをそのまま所有させて、 memoryview からはそれを参照する
+  std::string* owned = new std::string(std::move(data));
+  nb::capsule owner(
+      owned, [](void* p) noexcept { delete static_cast<std::string*>(p); });
+  size_t shape[1] = {owned->size()};
+  return nb::cast(nb::ndarray<nb::memview, const uint8_t, nb::ndim<1>>(
+      reinterpret_cast<const uint8_t*>(owned->data()), 1, shape, owner));
+}
+
+void SoraConnection::FlushMessages() {
+  if (message_batch_timer_) {
+    message_batch_timer_->cancel();
+  }
+  if (pending_messages_.empty()) {
+    return;
+  }
+  std::vector<std::pair<std::string, std::string>> messages;
+  messages.swap(pending_messages_);
+
   gil_scoped_acquire acq;
-  if (on_message_) {
-    call_python(on_message_, label, nb::bytes(data.c_str(), data.size()));
+  if (on_messages_) {
+    nb::list list;
+    for (auto& [label, data] : messages) {
+      list.append(nb::make_tuple(label, MessageToObject(std::move(data))));
+    }
+    call_python(on_messages_, list);
+  } else if (on_message_) {
+    for (auto& [label, data] : messages) {
+      call_python(on_message_, label, MessageToObject(std::move(data)));
+    }
   }
 }
 
@@ -236,6 +1067,11 @@ void SoraConnection::OnSignalingMessage(sora::SoraSignalingType type,
                                         sora::SoraSignalingDirection direction,
                                         std::string message) {
   gil_scoped_acquire acq;
+  // connect メッセージは WebSocket が開いた直後に送る
+  if (type == sora::SoraSignalingType::WEBSOCKET &&
+      direction == sora::SoraSignalingDirection::SENT) {
+    RecordTiming(ws_open_time_);
+  }
   if (on_signaling_message_) {
     call_python(on_signaling_message_, type, direction, message);
   }
@@ -251,9 +1087,11 @@ void SoraConnection::OnWsClose(uint16_t code, std::string message) {
 void SoraConnection::OnTrack(
     webrtc::scoped_refptr<webrtc::RtpTransceiverInterface> transceiver) {
   gil_scoped_acquire acq;
+  RecordTiming(first_track_time_);
   if (on_track_) {
     auto receiver = transceiver->receiver();
     nb::ref<SoraMediaTrack> track = new SoraMediaTrack(this, receiver);
+    remote_tracks_[receiver->id()] = track;
     call_python(on_track_, track);
   }
 }
@@ -261,10 +1099,25 @@ void SoraConnection::OnTrack(
 void SoraConnection::OnRemoveTrack(
     webrtc::scoped_refptr<webrtc::RtpReceiverInterface> receiver) {
   gil_scoped_acquire acq;
-  // TODO(tnoho): 要実装
+  auto it = remote_tracks_.find(receiver->id());
+  if (it == remote_tracks_.end()) {
+    return;
+  }
+  nb::ref<SoraMediaTrack> track = std::move(it->second);
+  remote_tracks_.erase(it);
+  if (on_remove_track_) {
+    call_python(on_remove_track_, track);
+  }
+  // Python で SoraMediaTrack が破棄されるのを待たずに、
+  // 取り付けられている Sink を外してスレッドやバッファを解放させる
+  track->Disposed();
 }
 
 void SoraConnection::OnDataChannel(std::string label) {
+  {
+    std::lock_guard<std::mutex> lock(data_channel_labels_mutex_);
+    data_channel_labels_.insert(label);
+  }
   gil_scoped_acquire acq;
   if (on_data_channel_) {
     call_python(on_data_channel_, label);
@@ -1,9 +1,19 @@
 #ifndef SORA_CONNECTION_H_
 #define SORA_CONNECTION_H_
 
+#include <atomic>
+#include <chrono>
 #include <condition_variable>
+#include <functional>
+#include <map>
 #include <memory>
+#include <mutex>
+#include <optional>
 #include <thread>
+#include <unordered_map>
+#include <unordered_set>
+#include <utility>
+#include <vector>
 
 // nonobind
 // clang-format off
@@ -15,15 +25,18 @@
 
 // Boost
 #include <boost/asio/io_context.hpp>
+#include <boost/asio/steady_timer.hpp>
 
 // WebRTC
 #include <api/media_stream_interface.h>
 #include <api/rtp_sender_interface.h>
+#include <api/task_queue/task_queue_base.h>
 
 // Sora
 #include <sora/sora_signaling.h>
 
 #include "dispose_listener.h"
+#include "sora_data_channel_compressor.h"
 #include "sora_frame_transformer.h"
 #include "sora_track_interface.h"
 
@@ -42,10 +55,13 @@ class SoraConnection : public DisposePublisher,
  public:
   /**
    * コンストラクタではインスタンスの生成のみで実際の生成処理は Init 関数で行います。
+   *
+   * @param connection_count 生成元の Sora の Connection 数 生成時に加算し、切断か破棄で減算します
    */
   SoraConnection(CountedPublisher* publisher,
                  boost::asio::io_context* ioc,
-                 std::shared_ptr<SoraSignalingObserver> observer);
+                 std::shared_ptr<SoraSignalingObserver> observer,
+                 std::shared_ptr<std::atomic<int>> connection_count);
   ~SoraConnection();
 
   void Disposed() override;
@@ -70,28 +86,48 @@ class SoraConnection : public DisposePublisher,
   void Connect();
   /**
    * Sora から切断する関数です。
+   *
+   * on_message などのコールバックの中から呼ばれた場合は、切断の完了を待つとコールバックを呼び出しているスレッドが止まるため、
+   * DisconnectAsync と同じく切断を開始するだけで戻ります。
    */
   void Disconnect();
+  /**
+   * 切断の完了を待たずに Sora からの切断を開始する関数です。
+   *
+   * 切断が完了した時に結果が設定される concurrent.futures.Future を返します。
+   * asyncio で待つ場合は asyncio.wrap_future で変換してください。
+   * 切断が完了するまでの後始末は ioc_ のスレッドで行うため、呼び出し元のスレッドは待たされません。
+   *
+   * @return concurrent.futures.Future
+   */
+  nb::object DisconnectAsync();
   /**
    * 音声トラックを入れ替える javascript でいう replaceTrack に相当する関数です。
    * 
-   * TODO(tnoho): Python で呼び出すことを想定しているが、動作確認していないため NB_MODULE に定義していない
+   * 接続後に呼び出した場合は再ネゴシエーションせずに送信するトラックだけを入れ替えます。
+   * 送信されるのは入れ替えた後にソースに渡したフレームからで、入れ替える前に渡したフレームは破棄されます。
+   * 入れ替えはシグナリングスレッドで行うため、完了するまで GIL を解放して待ちます。
    * 
-   * @param audio_source 入れ替える新しい音声トラック
+   * @param audio_source 入れ替える新しい音声トラック None の場合は送信を止める
    */
   void SetAudioTrack(nb::ref<SoraTrackInterface> audio_source);
   /**
    * 映像トラックを入れ替える javascript でいう replaceTrack に相当する関数です。
    * 
-   * TODO(tnoho): Python で呼び出すことを想定しているが、動作確認していないため NB_MODULE に定義していない
+   * 接続後に呼び出した場合は再ネゴシエーションせずに送信するトラックだけを入れ替えます。
+   * 送信されるのは入れ替えた後にソースに渡したフレームからで、入れ替える前に渡したフレームは破棄されます。
+   * 入れ替えはシグナリングスレッドで行うため、完了するまで GIL を解放して待ちます。
    * 
-   * @param audio_source 入れ替える新しい映像トラック
+   * @param video_source 入れ替える新しい映像トラック None の場合は送信を止める
    */
   void SetVideoTrack(nb::ref<SoraTrackInterface> video_source);
   /**
    * 音声送信時の Encoded Transform を設定する関数です。
    * 
-   * TODO(tnoho): Python で呼び出すことを想定しているが、動作確認していないため NB_MODULE に定義していない
+   * 接続後に呼び出した場合は再ネゴシエーションせずに設定します。
+   * nullptr を渡すと Encoded Transform を外し、以降のフレームは Transform を経由せずに送信されます。
+   * 外すのはこの接続の RtpSender だけで、同じ Transformer を使う他の接続には影響しません。
+   * 外した SoraAudioFrameTransformer はもう一度この関数に渡すことで再び設定できます。
    * 
    * @param audio_sender_frame_transformer エンコードされたフレームが経由する SoraAudioFrameTransformer
    */
@@ -100,7 +136,10 @@ class SoraConnection : public DisposePublisher,
   /**
    * 映像送信時の Encoded Transform を設定する関数です。
    * 
-   * TODO(tnoho): Python で呼び出すことを想定しているが、動作確認していないため NB_MODULE に定義していない
+   * 接続後に呼び出した場合は再ネゴシエーションせずに設定します。
+   * nullptr を渡すと Encoded Transform を外し、以降のフレームは Transform を経由せずに送信されます。
+   * 外すのはこの接続の RtpSender だけで、同じ Transformer を使う他の接続には影響しません。
+   * 外した SoraVideoFrameTransformer はもう一度この関数に渡すことで再び設定できます。
    * 
    * @param video_sender_frame_transformer エンコードされたフレームが経由する SoraVideoFrameTransformer
    */
@@ -109,10 +148,119 @@ class SoraConnection : public DisposePublisher,
   /**
    * DataChannel でデータを送信する関数です。
    * 
+   * bytes, bytearray, memoryview, numpy.ndarray などバッファプロトコルに対応したオブジェクトを受け取ります。
+   * データのコピーは Sora C++ SDK に渡すための 1 回のみで、送信中は GIL を解放します。
+   * 
+   * @param label 送信する DataChannel の label
+   * @param data 送信するデータ
+   * @return 送信に成功したかどうか
+   */
+  bool SendDataChannel(const std::string& label, nb::handle data);
+  /**
+   * 同じ DataChannel に複数のデータをまとめて送信する関数です。
+   * 
+   * 小さいメッセージを大量に送る場合に、メッセージごとに Python と C++ を往復するのを避けるために用意しました。
+   * 全てのデータをコピーしてから GIL を解放し、まとめて Sora C++ SDK に渡します。
+   * 
+   * @param label 送信する DataChannel の label
+   * @param data_list 送信するデータのリスト
+   * @return メッセージごとに送信に成功したかどうかを格納した list[bool]
+   */
+  nb::list SendDataChannelMany(const std::string& label, nb::handle data_list);
+  /**
+   * 複数の DataChannel にデータをまとめて送信する関数です。
+   * 
+   * @param messages 送信する DataChannel の label とデータの tuple のリスト
+   * @return メッセージごとに送信に成功したかどうかを格納した list[bool]
+   */
+  nb::list SendDataChannelMany(nb::handle messages);
+  /**
+   * DataChannel で送信するデータを送信キューに積む関数です。
+   * 
+   * 送信キューに積まれたデータは専用のスレッドで順番に Sora C++ SDK に渡されるため、
+   * 呼び出し元は送信の完了を待たずに処理を続けることができます。
+   * max_buffered_amount_ が設定されている場合、送信キューに積まれている量がそれを超える場合は、
+   * block が false であれば積まずに false を返し、 true であれば空きができるまで GIL を解放して待ちます。
+   * 
+   * まだ開いていない label の場合は積まずに false を返します。
+   * 送信キューに積まれたデータの送信に失敗した場合は on_send_error_ が呼ばれ、
+   * 切断時に送信されていないデータは破棄されます。
+   * 
    * @param label 送信する DataChannel の label
    * @param data 送信するデータ
+   * @param block 送信キューに空きがない場合に待つかどうか
+   * @param timeout (オプション) block が true の場合に待つ最大秒数 指定しない場合は空きができるまで待つ
+   * @return 送信キューに積めたかどうか
+   */
+  bool EnqueueDataChannel(const std::string& label,
+                          nb::handle data,
+                          bool block,
+                          std::optional<float> timeout);
+  /**
+   * 大きなデータを分割して DataChannel で送信する関数です。
+   * 
+   * データを chunk_size ごとに分割し、それぞれに 24 バイトのヘッダをつけて送信キューに積みます。
+   * ヘッダは magic "SBLB" (4 バイト)、 blob ID (4 バイト)、全体のサイズ (8 バイト)、オフセット (8 バイト) で、
+   * 数値はビッグエンディアンです。
+   * 分割したデータは送信キューに少しずつ積むため、 send_data_channel で送る小さなメッセージが
+   * 大きなデータの送信完了を待たされることはありません。
+   * 送信キューに積む量は max_buffered_amount_ が設定されていればそれに、
+   * 設定されていなければ 1 MiB に制限し、空きができるまで GIL を解放して待ちます。
+   * 
+   * 受信側は on_blob_ を設定しておくと、全てのチャンクを受信した時点で 1 回だけデータが渡されます。
+   * 積んだチャンクの送信に失敗した場合は on_send_error_ が呼ばれます。
+   * 
+   * @param label 送信する DataChannel の label
+   * @param data 送信するデータ
+   * @param chunk_size 分割するサイズ (ヘッダを含まない)
+   * @param timeout (オプション) 送信キューの空きを待つ最大秒数 指定しない場合は空きができるまで待つ
+   * @return 全てのチャンクを送信キューに積めたかどうか
+   */
+  bool SendBlob(const std::string& label,
+                nb::handle data,
+                size_t chunk_size,
+                std::optional<float> timeout);
+  /**
+   * DataChannel のメッセージを zlib で圧縮して送信し、受信したメッセージを伸長するように設定する関数です。
+   * 
+   * Sora の DataChannel の compress と異なり、圧縮したまま相手のクライアントまで届くため、
+   * 送信側と受信側の両方で同じ label に同じ設定をする必要があります。
+   * 圧縮と伸長は GIL を解放しているスレッドで行います。
+   * send_blob で送信する場合はチャンクごとに圧縮されます。
+   * 
+   * @param label 圧縮する DataChannel の label
+   * @param level 圧縮レベル 0 - 9 もしくはデフォルトを表す -1
+   * @param dictionary (オプション) 圧縮と伸長に使うプリセット辞書
+   * @param max_decompressed_size 受信したメッセージを伸長した後の最大サイズ (バイト) 超える場合はメッセージを破棄します
+   */
+  void SetDataChannelCompression(const std::string& label,
+                                 int level,
+                                 nb::handle dictionary,
+                                 size_t max_decompressed_size);
+  /**
+   * SetDataChannelCompression で設定した圧縮を解除する関数です。
+   * 
+   * @param label 圧縮を解除する DataChannel の label
+   */
+  void RemoveDataChannelCompression(const std::string& label);
+  /**
+   * 送信キューに積まれていて、まだ Sora C++ SDK に渡していないデータの量を返す関数です。
+   * 
+   * @param label DataChannel の label
+   * @return バイト数
+   */
+  uint64_t BufferedAmount(const std::string& label);
+  /**
+   * 送信キューに積まれているデータの量が buffered_amount_low_threshold_ 以下になるまで待つ関数です。
+   * 
+   * 待っている間は GIL を解放します。
+   * 
+   * @param label DataChannel の label
+   * @param timeout (オプション) 待つ最大秒数 指定しない場合は条件を満たすまで待つ
+   * @return 条件を満たしたかどうか タイムアウトした場合は false
    */
-  bool SendDataChannel(const std::string& label, nb::bytes& data);
+  bool WaitBufferedAmountLow(const std::string& label,
+                             std::optional<float> timeout);
 
   /**
    * WebRTC の統計情報を取得します。
@@ -121,6 +269,32 @@ class SoraConnection : public DisposePublisher,
    * また、libwebrtc のシグナリングスレッドから呼ぶとデッドロックするので、必ずそれ以外のスレッドから呼ぶようにしてください。
    */
   std::string GetStats();
+  /**
+   * 接続の各段階に到達するまでにかかった時間を返します。
+   *
+   * 以下の段階ごとに connect を呼んでから到達するまでの経過秒数を返し、到達していない段階は None になります。
+   * - ws_open: WebSocket が開いて connect メッセージを送った
+   * - offer: offer を受け取った
+   * - connected: 自身の connection.created を受け取った
+   * - first_track: 最初のリモートトラックを受け取った
+   *
+   * @return 段階の名前をキーにした dict
+   */
+  nb::dict GetTimings() const;
+  /**
+   * 接続が確立するか切断されるかのどちらかに至った時に 1 度だけ呼ぶ関数を設定します。
+   *
+   * Sora::ConnectMany で同時に接続処理中の Connection の数を数えるために使います。
+   * 既に至っている場合はその場で呼び出します。
+   * GIL を保持した状態で呼んでください。コールバックも GIL を保持した状態で呼ばれます。
+   */
+  void SetOnSetupSettled(std::function<void()> on_setup_settled);
+  /**
+   * connect を呼んだことがあるかどうかを返します。
+   *
+   * 切断済みで connect できない場合も true を返します。
+   */
+  bool IsConnectStarted() const;
 
   // sora::SoraSignalingObserver に定義されているコールバック関数
   void OnSetOffer(std::string offer);
@@ -149,17 +323,151 @@ class SoraConnection : public DisposePublisher,
   std::function<void(sora::SoraSignalingErrorCode, std::string)> on_disconnect_;
   std::function<void(std::string)> on_notify_;
   std::function<void(std::string)> on_push_;
-  std::function<void(std::string, nb::bytes)> on_message_;
+  /**
+   * DataChannel でメッセージを受信した時に label とデータを引数に呼び出されるコールバック変数です。
+   * 
+   * データは message_as_memoryview_ が false の場合は bytes で、 true の場合は memoryview で渡されます。
+   */
+  std::function<void(std::string, nb::object)> on_message_;
+  /**
+   * message_batch_size_ が 1 以上の場合に、受信したメッセージをまとめて (label, データ) の tuple の list で渡すコールバック変数です。
+   * 
+   * 設定されていない場合は、まとめたメッセージを 1 件ずつ on_message_ に渡します。
+   */
+  std::function<void(nb::list)> on_messages_;
+  /**
+   * send_blob で分割して送られたデータを全て受信した時に label とデータを引数に呼び出されるコールバック変数です。
+   * 
+   * 設定されている場合、 send_blob のヘッダを持つメッセージは on_message_ には渡されません。
+   * ただし、オフセットやサイズが全体のサイズと矛盾するなどヘッダとして正しくないメッセージは on_message_ に渡します。
+   * max_blob_size_ を超えるデータや、受信途中のデータが max_blob_assemblies_ 個ある時に届いた新しいデータは破棄します。
+   * データは message_as_memoryview_ が false の場合は bytes で、 true の場合は memoryview で渡されます。
+   */
+  std::function<void(std::string, nb::object)> on_blob_;
   std::function<void(nb::bytes)> on_rpc_;
   std::function<void(std::string)> on_switched_;
   std::function<void(nb::ref<SoraMediaTrack>)> on_track_;
+  /**
+   * リモートトラックの受信が終わった時に on_track_ で渡した SoraMediaTrack を引数に呼び出されるコールバック変数です。
+   * 
+   * 呼び出した後に SoraMediaTrack は破棄され、取り付けられていた SoraVideoSink や SoraAudioSink は
+   * Python で破棄されるのを待たずにトラックから外れて、スレッドやバッファを解放します。
+   */
+  std::function<void(nb::ref<SoraMediaTrack>)> on_remove_track_;
   std::function<void(std::string)> on_data_channel_;
+  /**
+   * auto_reconnect_ が有効な時に、再接続を開始する直前に呼び出されるコールバックです。
+   *
+   * 何回目の再接続か、再接続の原因になった切断のエラーコードとメッセージが渡されます。
+   * 再接続を諦めた場合は on_disconnect が呼ばれます。
+   */
+  std::function<void(int, sora::SoraSignalingErrorCode, std::string)>
+      on_reconnect_;
+  /**
+   * 送信キューに積まれているデータの量が buffered_amount_low_threshold_ を上回った状態から、
+   * buffered_amount_low_threshold_ 以下に下がった時に label を引数に呼び出されるコールバック変数です。
+   * 
+   * 送信キューのスレッドから呼び出されます。
+   */
+  std::function<void(std::string)> on_buffered_amount_low_;
+  /**
+   * 送信キューに積まれたデータの送信に失敗した時に label を引数に呼び出されるコールバック変数です。
+   * 
+   * 送信キューのスレッドから呼び出されます。
+   */
+  std::function<void(std::string)> on_send_error_;
+  // DisconnectAsync で返した concurrent.futures.Future 、切断の後始末が終わったら結果を設定する
+  nb::object disconnect_future_;
+  // on_buffered_amount_low_ を呼び出す閾値 (バイト)
+  // 送信キューのスレッドから GIL を獲得せずに読むので atomic にする
+  std::atomic<uint64_t> buffered_amount_low_threshold_ = 0;
+  // 送信キューに積める最大量 (バイト) 0 の場合は無制限
+  uint64_t max_buffered_amount_ = 0;
+  /**
+   * on_blob_ で受信できるデータの最大サイズ (バイト) です。
+   *
+   * ヘッダの全体のサイズを見て受信側で領域を確保するため、これを超えるデータは受信せずに破棄します。
+   */
+  uint64_t max_blob_size_ = 64 * 1024 * 1024;
+  // 同時に受信途中にできる send_blob のデータの最大数、超えた分は破棄する
+  size_t max_blob_assemblies_ = 16;
+  /**
+   * 受信したメッセージを bytes にコピーせず、受信したバッファを参照する読み取り専用の memoryview で渡すかどうかの設定です。
+   */
+  bool message_as_memoryview_ = false;
+  /**
+   * 受信したメッセージをまとめてコールバックに渡す最大件数です。
+   * 
+   * 0 の場合はまとめずに受信するたびに on_message_ を呼び出します。
+   * 1 以上の場合は、この件数が溜まるか、最初のメッセージを受信してから message_batch_interval_ms_ が経過した時にまとめて渡します。
+   * Python の関数を呼び出す回数と GIL を獲得する回数を減らすために用意しました。
+   * ioc_ のスレッドから GIL を獲得せずに参照するため atomic にしています。
+   */
+  std::atomic<size_t> message_batch_size_ = 0;
+  // 受信したメッセージをまとめる最大時間 (ミリ秒)
+  // 0 以下の場合は待たずに、受信するたびにそれまでに溜まっているメッセージを渡します
+  std::atomic<int> message_batch_interval_ms_ = 10;
+  /**
+   * 接続の確立後にネットワークの問題で切断された場合に、自動で再接続するかどうかの設定です。
+   *
+   * 同じ設定で新しく接続し直し、 AudioSource や VideoSource 、送信側の Encoded Transform はそのまま使います。
+   * 受信していたトラックは on_remove_track で破棄されるので、再接続後に on_track で渡されるトラックに Sink を取り付け直してください。
+   * disconnect を呼んだ場合や、 Sora から正常に切断された場合は再接続しません。
+   * connect を呼ぶ前に設定してください。 connect の時点で無効な場合は再接続に使う設定を保持しません。
+   */
+  bool auto_reconnect_ = false;
+  // 再接続を試みる最大回数 0 の場合は無制限
+  int reconnect_max_attempts_ = 5;
+  // 1 回目の再接続までの待ち時間 (ミリ秒) 以降は 2 倍ずつ reconnect_max_delay_ms_ まで伸ばす
+  int reconnect_initial_delay_ms_ = 100;
+  // 再接続までの待ち時間の上限 (ミリ秒)
+  int reconnect_max_delay_ms_ = 5000;
 
  private:
+  void ReplaceTrack(webrtc::scoped_refptr<webrtc::RtpSenderInterface> sender,
+                    nb::ref<SoraTrackInterface>& current,
+                    nb::ref<SoraTrackInterface> source,
+                    const std::string& kind);
+  void SetSenderFrameTransformer(
+      webrtc::scoped_refptr<webrtc::RtpSenderInterface> sender,
+      webrtc::scoped_refptr<SoraFrameTransformerInterface>& current,
+      webrtc::scoped_refptr<SoraFrameTransformerInterface> transformer);
+  nb::list SendDataChannelBatch(
+      const std::vector<std::pair<std::string, std::string>>& messages);
+  std::shared_ptr<const SoraDataChannelCompressor> GetCompressor(
+      const std::string& label);
+  bool SendMessage(const std::shared_ptr<sora::SoraSignaling>& conn,
+                   const std::string& label,
+                   const std::string& data);
+  bool EnqueueMessage(const std::string& label,
+                      std::string buf,
+                      uint64_t max_buffered_amount,
+                      bool block,
+                      std::optional<float> timeout);
+  void StopSendQueue();
+  nb::object MessageToObject(std::string data);
+  // send_blob のヘッダを持つメッセージに対して GIL を獲得した状態で呼ぶこと
+  bool HandleBlobChunk(const std::string& label, const std::string& data);
+  void FlushMessages();
+  void ReleaseConnectionCount();
+  bool ShouldReconnect(sora::SoraSignalingErrorCode ec) const;
+  void ScheduleReconnect(sora::SoraSignalingErrorCode ec, std::string message);
+  void Reconnect(sora::SoraSignalingErrorCode ec, std::string message);
+  void RemoveRemoteTracks();
+  void StartDisconnect();
+  void PostFinishDisconnect();
+  void FinishDisconnect();
+  void RecordTiming(std::optional<double>& timing);
+  void SettleSetup();
+
   CountedPublisher* publisher_;
   std::shared_ptr<SoraSignalingObserver> observer_;
   boost::asio::io_context* ioc_;
   std::shared_ptr<sora::SoraSignaling> conn_;
+  // 再接続時に sora::SoraSignaling を生成し直すために Init で受け取った設定を保持する
+  // PeerConnectionFactory の参照や Sora が所有するネットワーク関連のポインタを含むため、
+  // auto_reconnect_ が無効な場合や切断した場合、 Sora が破棄された場合は捨てる
+  std::optional<sora::SoraSignalingConfig> config_;
   nb::ref<SoraTrackInterface> audio_source_ = nullptr;
   nb::ref<SoraTrackInterface> video_source_ = nullptr;
   webrtc::scoped_refptr<webrtc::RtpSenderInterface> audio_sender_;
@@ -170,6 +478,58 @@ class SoraConnection : public DisposePublisher,
       video_sender_frame_transformer_;
   bool on_disconnected_ = false;
   std::condition_variable_any on_disconnect_cv_;
+  // 切断を開始したかどうかと、 ioc_ のスレッドで行う切断の後始末が残っているかどうか
+  // GIL を獲得した状態でのみ触る
+  bool disconnect_started_ = false;
+  bool finish_disconnect_pending_ = false;
+  // 再接続を試みた回数、接続が確立したら 0 に戻す GIL を獲得した状態でのみ触る
+  int reconnect_attempt_ = 0;
+  // ioc_ に積んだハンドラが this の破棄を知るためのもの、 weak_ptr で参照して消えていれば this に触らない
+  std::shared_ptr<bool> alive_ = std::make_shared<bool>(true);
+  // 再接続までの待ち時間を計るタイマー、 ioc_ のスレッドからのみ触る
+  std::unique_ptr<boost::asio::steady_timer> reconnect_timer_;
+  // Sora が先に破棄されても良いように shared_ptr で共有する
+  std::shared_ptr<std::atomic<int>> connection_count_;
+  std::atomic<bool> connection_counted_{true};
+  // 接続の各段階に到達するまでの時間、コールバックは GIL を保持して呼ばれるので GIL で排他する
+  std::optional<std::chrono::steady_clock::time_point> connect_started_at_;
+  std::optional<double> ws_open_time_;
+  std::optional<double> offer_time_;
+  std::optional<double> connected_time_;
+  std::optional<double> first_track_time_;
+  bool setup_settled_ = false;
+  std::function<void()> on_setup_settled_;
+  std::mutex buffered_amount_mutex_;
+  std::condition_variable buffered_amount_cv_;
+  std::unordered_map<std::string, uint64_t> buffered_amounts_;
+  // OnDataChannel で開いたことが通知された label 、送信キューに積む前に確認する
+  // 再接続した場合は開き直すので消す
+  std::mutex data_channel_labels_mutex_;
+  std::unordered_set<std::string> data_channel_labels_;
+  // まとめて渡すために溜めている受信メッセージ、 ioc_ のスレッドからのみ触る
+  std::vector<std::pair<std::string, std::string>> pending_messages_;
+  std::unique_ptr<boost::asio::steady_timer> message_batch_timer_;
+  std::atomic<uint32_t> next_blob_id_ = 0;
+  // 受信途中の send_blob のデータ、 ioc_ のスレッドから GIL を獲得した状態でのみ触る
+  // 重複して届いたチャンクを数えないよう、受信済みの範囲を [開始, 終了) で重ならないように持つ
+  struct BlobAssembly {
+    std::string buffer;
+    std::map<uint64_t, uint64_t> received_ranges;
+  };
+  std::map<std::pair<std::string, uint32_t>, BlobAssembly> blob_assemblies_;
+  // OnRemoveTrack で破棄するために OnTrack で渡したリモートトラックを RtpReceiver の ID ごとに保持する
+  // GIL を獲得した状態でのみ触る
+  std::unordered_map<std::string, nb::ref<SoraMediaTrack>> remote_tracks_;
+  std::mutex compressors_mutex_;
+  std::unordered_map<std::string,
+                     std::shared_ptr<const SoraDataChannelCompressor>>
+      compressors_;
+  // EnqueueDataChannel で積まれたデータを送信するスレッド、最初に積まれた時に生成する
+  // 送信のタスクは上のメンバを使うので、先に破棄されるよう最後に宣言する
+  // StopSendQueue の後は生成しないよう send_queue_stopped_ と合わせて send_queue_mutex_ で排他する
+  std::mutex send_queue_mutex_;
+  bool send_queue_stopped_ = false;
+  std::unique_ptr<webrtc::TaskQueueBase, webrtc::TaskQueueDeleter> send_queue_;
 };
 
 class SoraSignalingObserver : public sora::SoraSignalingObserver {
@@ -0,0 +1,66 @@
+#ifndef SORA_CONNECTION_CONFIG_H_
+#define SORA_CONNECTION_CONFIG_H_
+
+// nonobind
+// clang-format off
+#include <nanobind/nanobind.h>
+// clang-format on
+#include <nanobind/intrusive/counter.h>
+#include <nanobind/intrusive/ref.h>
+
+// Sora
+#include <sora/sora_signaling.h>
+
+#include "sora_track_interface.h"
+
+namespace nb = nanobind;
+
+class Sora;
+
+/**
+ * Sora::CreateConnectionConfig で生成する、変換と検証を済ませた Connection の設定です。
+ *
+ * metadata や forwarding_filters などの Python の値から boost::json::value への変換は生成時に 1 度だけ行い、
+ * Sora::CreateConnectionFromConfig で複数の Connection の生成に使い回します。
+ * client_id や metadata など Connection ごとに異なる値は Sora::CreateConnectionFromConfig で上書きできます。
+ *
+ * 生成元の Sora でしか使えず、別の Sora の Sora::CreateConnectionFromConfig に渡すと ValueError になります。
+ *
+ * 実装上の留意点：
+ * pc_factory や observer など Connection ごとに異なるものは Sora::CreateConnectionFromConfig で設定するため、
+ * signaling_config には含めていません。
+ */
+class SoraConnectionConfig : public nb::intrusive_base {
+ public:
+  SoraConnectionConfig(const Sora* owner,
+                       const sora::SoraSignalingConfig& signaling_config,
+                       nb::ref<SoraTrackInterface> audio_source,
+                       nb::ref<SoraTrackInterface> video_source)
+      : owner_(owner),
+        signaling_config_(signaling_config),
+        audio_source_(audio_source),
+        video_source_(video_source) {}
+
+  const Sora* owner() const { return owner_; }
+
+  const sora::SoraSignalingConfig& signaling_config() const {
+    return signaling_config_;
+  }
+  nb::ref<SoraTrackInterface> audio_source() const { return audio_source_; }
+  nb::ref<SoraTrackInterface> video_source() const { return video_source_; }
+
+  /**
+   * Python で呼び出すための関数
+   */
+  std::string role() const { return signaling_config_.role; }
+  std::string channel_id() const { return signaling_config_.channel_id; }
+
+ private:
+  // 生成元の Sora かどうかを比べるためだけに使い、参照はしない
+  const Sora* owner_;
+  const sora::SoraSignalingConfig signaling_config_;
+  nb::ref<SoraTrackInterface> audio_source_;
+  nb::ref<SoraTrackInterface> video_source_;
+};
+
+#endif
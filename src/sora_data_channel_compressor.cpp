@@ -0,0 +1,99 @@
+#include "sora_data_channel_compressor.h"
+
+#include <algorithm>
+#include <stdexcept>
+
+// WebRTC
+#include <third_party/zlib/zlib.h>
+
+SoraDataChannelCompressor::SoraDataChannelCompressor(
+    int level,
+    std::optional<std::string> dictionary,
+    size_t max_decompressed_size)
+    : level_(level),
+      dictionary_(std::move(dictionary)),
+      max_decompressed_size_(max_decompressed_size) {
+  if (level_ < Z_DEFAULT_COMPRESSION || level_ > Z_BEST_COMPRESSION) {
+    throw std::invalid_argument("level must be between -1 and 9");
+  }
+}
+
+std::optional<std::string> SoraDataChannelCompressor::Compress(
+    const std::string& data) const {
+  z_stream zs = {};
+  if (deflateInit(&zs, level_) != Z_OK) {
+    return std::nullopt;
+  }
+  if (dictionary_ &&
+      deflateSetDictionary(&zs,
+                           reinterpret_cast<const Bytef*>(dictionary_->data()),
+                           static_cast<uInt>(dictionary_->size())) != Z_OK) {
+    deflateEnd(&zs);
+    return std::nullopt;
+  }
+
+  // deflateBound の大きさがあれば 1 回の deflate で圧縮しきれる
+  std::string output;
+  output.resize(deflateBound(&zs, static_cast<uLong>(data.size())));
+  zs.next_in = reinterpret_cast<Bytef*>(const_cast<char*>(data.data()));
+  zs.avail_in = static_cast<uInt>(data.size());
+  zs.next_out = reinterpret_cast<Bytef*>(output.data());
+  zs.avail_out = static_cast<uInt>(output.size());
+  int result = deflate(&zs, Z_FINISH);
+  output.resize(zs.total_out);
+  deflateEnd(&zs);
+  if (result != Z_STREAM_END) {
+    return std::nullopt;
+  }
+  return output;
+}
+
+std::optional<std::string> SoraDataChannelCompressor::Decompress(
+    const std::string& data) const {
+  z_stream zs = {};
+  if (inflateInit(&zs) != Z_OK) {
+    return std::nullopt;
+  }
+  zs.next_in = reinterpret_cast<Bytef*>(const_cast<char*>(data.data()));
+  zs.avail_in = static_cast<uInt>(data.size());
+
+  // 伸長後のサイズは分からないので、足りなくなったら max_decompressed_size_ を上限に倍にしていく
+  // 上限ちょうどまで伸長しても終わらない場合は超えていると判断する
+  std::string output;
+  output.resize(std::min<size_t>(data.size() * 4 + 64, max_decompressed_size_));
+  int result;
+  while (true) {
+    zs.next_out = reinterpret_cast<Bytef*>(output.data() + zs.total_out);
+    zs.avail_out = static_cast<uInt>(output.size() - zs.total_out);
+    result = inflate(&zs, Z_NO_FLUSH);
+    if (result == Z_NEED_DICT) {
+      if (!dictionary_ ||
+          inflateSetDictionary(
+              &zs, reinterpret_cast<const Bytef*>(dictionary_->data()),
+              static_cast<uInt>(dictionary_->size())) != Z_OK) {
+        break;
+      }
+      continue;
+    }
+    if (result == Z_STREAM_END || (result != Z_OK && result != Z_BUF_ERROR)) {
+      break;
+    }
+    if (zs.avail_out == 0) {
+      if (output.size() >= max_decompressed_size_) {
+        result = Z_MEM_ERROR;
+        break;
+      }
+      output.resize(std::min(output.size() * 2, max_decompressed_size_));
+    } else if (zs.avail_in == 0) {
+      // 入力を全て渡しても終わらない場合は壊れている
+      result = Z_DATA_ERROR;
+      break;
+    }
+  }
+  output.resize(zs.total_out);
+  inflateEnd(&zs);
+  if (result != Z_STREAM_END) {
+    return std::nullopt;
+  }
+  return output;
+}
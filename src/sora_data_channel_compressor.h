@@ -0,0 +1,48 @@
+#ifndef SORA_DATA_CHANNEL_COMPRESSOR_H_
+#define SORA_DATA_CHANNEL_COMPRESSOR_H_
+
+#include <cstddef>
+#include <optional>
+#include <string>
+
+/**
+ * DataChannel で送受信するメッセージを zlib で圧縮、伸長する SoraDataChannelCompressor です。
+ * 
+ * DataChannel の compress はクライアントと Sora の間の圧縮なので、受信側には伸長されたメッセージが届きます。
+ * こちらは送信側で圧縮したまま受信側まで届けて受信側で伸長するため、送信側と受信側の両方で同じ設定をする必要があります。
+ * 圧縮レベルと、短いメッセージの圧縮率を上げるためのプリセット辞書を指定できます。
+ */
+class SoraDataChannelCompressor {
+ public:
+  /**
+   * @param level 圧縮レベル 0 - 9 もしくはデフォルトを表す -1
+   * @param dictionary (オプション) 圧縮と伸長に使うプリセット辞書
+   * @param max_decompressed_size 伸長後の最大サイズ (バイト)
+   *                              小さなメッセージが巨大に伸長されてメモリを使い切らないよう、超える場合は伸長に失敗させます
+   */
+  SoraDataChannelCompressor(int level,
+                            std::optional<std::string> dictionary,
+                            size_t max_decompressed_size);
+
+  /**
+   * メッセージを圧縮します。
+   * 
+   * @param data 圧縮するメッセージ
+   * @return 圧縮したメッセージ 失敗した場合は std::nullopt
+   */
+  std::optional<std::string> Compress(const std::string& data) const;
+  /**
+   * Compress で圧縮されたメッセージを伸長します。
+   * 
+   * @param data 伸長するメッセージ
+   * @return 伸長したメッセージ 失敗した場合と max_decompressed_size を超える場合は std::nullopt
+   */
+  std::optional<std::string> Decompress(const std::string& data) const;
+
+ private:
+  int level_;
+  std::optional<std::string> dictionary_;
+  size_t max_decompressed_size_;
+};
+
+#endif
@@ -0,0 +1,107 @@
+#include "sora_dtls_certificate_pool.h"
+
+#include <stdexcept>
+
+// WebRTC
+#include <rtc_base/rtc_certificate_generator.h>
+#include <rtc_base/ssl_identity.h>
+#include <rtc_base/time_utils.h>
+
+namespace {
+
+webrtc::scoped_refptr<webrtc::RTCCertificate> GenerateCertificate() {
+  // ECDSA は RSA に比べて鍵の生成が速く、 libwebrtc のデフォルトでもある
+  auto certificate = webrtc::RTCCertificateGenerator::GenerateCertificate(
+      webrtc::KeyParams::ECDSA(), std::nullopt);
+  if (certificate == nullptr) {
+    throw std::runtime_error("Failed to generate DTLS certificate");
+  }
+  return certificate;
+}
+
+}  // namespace
+
+SoraDtlsCertificatePool::SoraDtlsCertificatePool(size_t size) {
+  for (size_t i = 0; i < size; i++) {
+    certificates_.push_back(GenerateCertificate());
+  }
+}
+
+webrtc::scoped_refptr<webrtc::RTCCertificate> SoraDtlsCertificatePool::Get() {
+  std::lock_guard<std::mutex> lock(mutex_);
+  auto& certificate = certificates_[next_index_++ % certificates_.size()];
+  if (certificate->HasExpired(webrtc::TimeMillis())) {
+    certificate = GenerateCertificate();
+  }
+  return certificate;
+}
+
+SoraCertificatePeerConnectionFactory::SoraCertificatePeerConnectionFactory(
+    webrtc::scoped_refptr<webrtc::PeerConnectionFactoryInterface> factory,
+    std::shared_ptr<SoraDtlsCertificatePool> pool)
+    : factory_(factory), pool_(pool) {}
+
+void SoraCertificatePeerConnectionFactory::SetOptions(const Options& options) {
+  factory_->SetOptions(options);
+}
+
+webrtc::RTCErrorOr<webrtc::scoped_refptr<webrtc::PeerConnectionInterface>>
+SoraCertificatePeerConnectionFactory::CreatePeerConnectionOrError(
+    const webrtc::PeerConnectionInterface::RTCConfiguration& configuration,
+    webrtc::PeerConnectionDependencies dependencies) {
+  if (!configuration.certificates.empty()) {
+    return factory_->CreatePeerConnectionOrError(configuration,
+                                                 std::move(dependencies));
+  }
+  webrtc::PeerConnectionInterface::RTCConfiguration config = configuration;
+  config.certificates.push_back(pool_->Get());
+  return factory_->CreatePeerConnectionOrError(config, std::move(dependencies));
+}
+
+webrtc::RtpCapabilities
+SoraCertificatePeerConnectionFactory::GetRtpSenderCapabilities(
+    webrtc::MediaType kind) const {
+  return factory_->GetRtpSenderCapabilities(kind);
+}
+
+webrtc::RtpCapabilities
+SoraCertificatePeerConnectionFactory::GetRtpReceiverCapabilities(
+    webrtc::MediaType kind) const {
+  return factory_->GetRtpReceiverCapabilities(kind);
+}
+
+webrtc::scoped_refptr<webrtc::MediaStreamInterface>
+SoraCertificatePeerConnectionFactory::CreateLocalMediaStream(
+    const std::string& stream_id) {
+  return factory_->CreateLocalMediaStream(stream_id);
+}
+
+webrtc::scoped_refptr<webrtc::AudioSourceInterface>
+SoraCertificatePeerConnectionFactory::CreateAudioSource(
+    const webrtc::AudioOptions& options) {
+  return factory_->CreateAudioSource(options);
+}
+
+webrtc::scoped_refptr<webrtc::VideoTrackInterface>
+SoraCertificatePeerConnectionFactory::CreateVideoTrack(
+    webrtc::scoped_refptr<webrtc::VideoTrackSourceInterface> source,
+    absl::string_view label) {
+  return factory_->CreateVideoTrack(source, label);
+}
+
+webrtc::scoped_refptr<webrtc::AudioTrackInterface>
+SoraCertificatePeerConnectionFactory::CreateAudioTrack(
+    const std::string& label,
+    webrtc::AudioSourceInterface* source) {
+  return factory_->CreateAudioTrack(label, source);
+}
+
+bool SoraCertificatePeerConnectionFactory::StartAecDump(
+    FILE* file,
+    int64_t max_size_bytes) {
+  return factory_->StartAecDump(file, max_size_bytes);
+}
+
+void SoraCertificatePeerConnectionFactory::StopAecDump() {
+  factory_->StopAecDump();
+}
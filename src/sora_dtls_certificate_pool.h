@@ -0,0 +1,81 @@
+#ifndef SORA_DTLS_CERTIFICATE_POOL_H_
+#define SORA_DTLS_CERTIFICATE_POOL_H_
+
+#include <cstdio>
+#include <memory>
+#include <mutex>
+#include <string>
+#include <vector>
+
+// WebRTC
+#include <api/peer_connection_interface.h>
+#include <api/scoped_refptr.h>
+#include <rtc_base/rtc_certificate.h>
+
+/**
+ * 事前に生成した DTLS の証明書を Connection 間で使い回す SoraDtlsCertificatePool です。
+ *
+ * PeerConnection は証明書が指定されていない場合に接続のたびに鍵を生成するため、
+ * Sora の生成時に ECDSA の証明書をまとめて生成しておき、 Connection には順番に割り当てます。
+ * 有効期限が切れた証明書は割り当てる時に生成し直します。
+ */
+class SoraDtlsCertificatePool {
+ public:
+  /**
+   * @param size 生成しておく証明書の数
+   */
+  explicit SoraDtlsCertificatePool(size_t size);
+
+  /**
+   * 次に割り当てる証明書を返します。
+   */
+  webrtc::scoped_refptr<webrtc::RTCCertificate> Get();
+
+ private:
+  std::mutex mutex_;
+  std::vector<webrtc::scoped_refptr<webrtc::RTCCertificate>> certificates_;
+  size_t next_index_ = 0;
+};
+
+/**
+ * PeerConnection の生成時に SoraDtlsCertificatePool の証明書を設定する webrtc::PeerConnectionFactoryInterface です。
+ *
+ * Sora C++ SDK は PeerConnection の設定を外から変えられないため、
+ * sora::SoraSignalingConfig の pc_factory にこれを渡して CreatePeerConnectionOrError で証明書を差し込みます。
+ * それ以外の関数は元の webrtc::PeerConnectionFactoryInterface をそのまま呼び出します。
+ */
+class SoraCertificatePeerConnectionFactory
+    : public webrtc::PeerConnectionFactoryInterface {
+ public:
+  SoraCertificatePeerConnectionFactory(
+      webrtc::scoped_refptr<webrtc::PeerConnectionFactoryInterface> factory,
+      std::shared_ptr<SoraDtlsCertificatePool> pool);
+
+  void SetOptions(const Options& options) override;
+  webrtc::RTCErrorOr<webrtc::scoped_refptr<webrtc::PeerConnectionInterface>>
+  CreatePeerConnectionOrError(
+      const webrtc::PeerConnectionInterface::RTCConfiguration& configuration,
+      webrtc::PeerConnectionDependencies dependencies) override;
+  webrtc::RtpCapabilities GetRtpSenderCapabilities(
+      webrtc::MediaType kind) const override;
+  webrtc::RtpCapabilities GetRtpReceiverCapabilities(
+      webrtc::MediaType kind) const override;
+  webrtc::scoped_refptr<webrtc::MediaStreamInterface> CreateLocalMediaStream(
+      const std::string& stream_id) override;
+  webrtc::scoped_refptr<webrtc::AudioSourceInterface> CreateAudioSource(
+      const webrtc::AudioOptions& options) override;
+  webrtc::scoped_refptr<webrtc::VideoTrackInterface> CreateVideoTrack(
+      webrtc::scoped_refptr<webrtc::VideoTrackSourceInterface> source,
+      absl::string_view label) override;
+  webrtc::scoped_refptr<webrtc::AudioTrackInterface> CreateAudioTrack(
+      const std::string& label,
+      webrtc::AudioSourceInterface* source) override;
+  bool StartAecDump(FILE* file, int64_t max_size_bytes) override;
+  void StopAecDump() override;
+
+ private:
+  webrtc::scoped_refptr<webrtc::PeerConnectionFactoryInterface> factory_;
+  std::shared_ptr<SoraDtlsCertificatePool> pool_;
+};
+
+#endif
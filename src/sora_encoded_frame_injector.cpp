@@ -0,0 +1,70 @@
+#include "sora_encoded_frame_injector.h"
+
+// WebRTC
+#include <rtc_base/time_utils.h>
+
+#include "py_buffer.h"
+#include "sora_frame_transformer.h"
+
+SoraEncodedFrameInjector::SoraEncodedFrameInjector(
+    SoraVideoSource* video_source,
+    int width,
+    int height,
+    size_t max_queue_size)
+    : video_source_(video_source),
+      width_(width),
+      height_(height),
+      max_queue_size_(max_queue_size) {}
+
+bool SoraEncodedFrameInjector::Push(nb::handle data,
+                                    bool key_frame,
+                                    std::optional<int64_t> timestamp_us) {
+  PyBuffer view(data);
+  {
+    std::lock_guard<std::mutex> lock(mutex_);
+    if (queue_.size() >= max_queue_size_) {
+      // エンコーダーがフレームを落とすなどして送信が追いついていない。
+      // 途中のアクセスユニットを飛ばすとデコードできなくなるので次のキーフレームからやり直す
+      queue_.clear();
+      waiting_key_frame_ = true;
+    }
+    if (waiting_key_frame_ && !key_frame) {
+      return false;
+    }
+    waiting_key_frame_ = false;
+    queue_.emplace_back(view.data(), view.data() + view.size());
+  }
+  video_source_->OnCapturedBlank(width_, height_,
+                                 timestamp_us.value_or(webrtc::TimeMicros()));
+  return true;
+}
+
+size_t SoraEncodedFrameInjector::GetQueueSize() const {
+  std::lock_guard<std::mutex> lock(mutex_);
+  return queue_.size();
+}
+
+bool SoraEncodedFrameInjector::Process(
+    webrtc::TransformableFrameInterface* frame) {
+  if (frame->GetDirection() !=
+      webrtc::TransformableFrameInterface::Direction::kSender) {
+    return true;
+  }
+  std::vector<uint8_t> access_unit;
+  {
+    std::lock_guard<std::mutex> lock(mutex_);
+    if (queue_.empty()) {
+      // 黒一色のフレームをそのまま送ると映像が壊れるので破棄する
+      return false;
+    }
+    access_unit = std::move(queue_.front());
+    queue_.pop_front();
+  }
+  frame->SetData(access_unit);
+  return true;
+}
+
+void SoraVideoFrameTransformer::AddInjectionStage(
+    std::shared_ptr<SoraEncodedFrameInjector> injector) {
+  AddStage(std::move(injector));
+}
@@ -0,0 +1,80 @@
+#ifndef SORA_ENCODED_FRAME_INJECTOR_H_
+#define SORA_ENCODED_FRAME_INJECTOR_H_
+
+#include <cstdint>
+#include <deque>
+#include <mutex>
+#include <optional>
+#include <vector>
+
+// nonobind
+#include <nanobind/intrusive/ref.h>
+#include <nanobind/nanobind.h>
+
+// WebRTC
+#include <api/frame_transformer_interface.h>
+
+#include "sora_frame_transform_stage.h"
+#include "sora_video_source.h"
+
+namespace nb = nanobind;
+
+/**
+ * エンコード済みの映像データを再エンコードせずに送信するための SoraEncodedFrameInjector です。
+ *
+ * 送信用の SoraVideoFrameTransformer に SoraFrameTransformStage として登録して利用します。
+ * push でエンコード済みのアクセスユニットを渡すと、SoraVideoSource に黒一色の小さなフレームを渡して
+ * エンコーダーに 1 フレーム出力させ、そのフレームのデータを渡されたアクセスユニットに入れ替えて送信します。
+ * 元の映像のエンコードは行わないため、ファイルの再生や再配信を少ない CPU で行えます。
+ *
+ * 実装上の留意点：
+ * - 接続時の video_codec_type には push するデータと同じコーデックを指定してください
+ * - 受信側がビットストリームからキーフレームを判断できる H.264 と VP8 を想定しています
+ * - サイマルキャストには対応していません
+ * - 受信側からのキーフレーム要求には応えられないため、定期的にキーフレームを push してください
+ */
+class SoraEncodedFrameInjector : public SoraFrameTransformStage {
+ public:
+  /**
+   * @param video_source エンコーダーにフレームを出力させるために使う SoraVideoSource
+   * @param width エンコーダーに渡す黒一色のフレームの幅
+   * @param height エンコーダーに渡す黒一色のフレームの高さ
+   * @param max_queue_size 送信待ちのアクセスユニットの上限 超えた場合は次のキーフレームまで破棄します
+   */
+  SoraEncodedFrameInjector(SoraVideoSource* video_source,
+                           int width,
+                           int height,
+                           size_t max_queue_size);
+
+  /**
+   * エンコード済みのアクセスユニットを送信待ちに積みます。
+   *
+   * 最初のキーフレームと、送信待ちが溢れた後の次のキーフレームまでは破棄します。
+   *
+   * @param data エンコード済みのアクセスユニット H.264 は Annex-B 形式
+   * @param key_frame キーフレームかどうか
+   * @param timestamp_us (オプション) マイクロ秒単位の整数で表されるフレームのタイムスタンプ
+   * @return 送信待ちに積んだ場合は true 、破棄した場合は false
+   */
+  bool Push(nb::handle data,
+            bool key_frame,
+            std::optional<int64_t> timestamp_us);
+  /**
+   * 送信待ちのアクセスユニットの数を返します。
+   */
+  size_t GetQueueSize() const;
+
+  bool Process(webrtc::TransformableFrameInterface* frame) override;
+
+ private:
+  nb::ref<SoraVideoSource> video_source_;
+  const int width_;
+  const int height_;
+  const size_t max_queue_size_;
+
+  mutable std::mutex mutex_;
+  std::deque<std::vector<uint8_t>> queue_;
+  bool waiting_key_frame_ = true;
+};
+
+#endif
@@ -0,0 +1,334 @@
+#include "sora_encoded_frame_recorder.h"
+
+#include <algorithm>
+#include <array>
+#include <cctype>
+#include <future>
+#include <stdexcept>
+
+// WebRTC
+#include <api/environment/environment_factory.h>
+#include <api/task_queue/task_queue_factory.h>
+#include <rtc_base/logging.h>
+
+namespace {
+
+// この量が溜まったらファイルに書き出す
+constexpr size_t kFlushSize = 256 * 1024;
+constexpr size_t kIvfHeaderSize = 32;
+// Opus の RTP タイムスタンプと Ogg の granule position は 48kHz
+constexpr uint32_t kOpusSampleRate = 48000;
+constexpr uint32_t kVideoClockRate = 90000;
+
+void AppendLE(std::vector<uint8_t>& buf, uint64_t value, size_t size) {
+  for (size_t i = 0; i < size; i++) {
+    buf.push_back(static_cast<uint8_t>(value >> (8 * i)));
+  }
+}
+
+void WriteLE(uint8_t* p, uint64_t value, size_t size) {
+  for (size_t i = 0; i < size; i++) {
+    p[i] = static_cast<uint8_t>(value >> (8 * i));
+  }
+}
+
+std::string ToLower(std::string s) {
+  std::transform(s.begin(), s.end(), s.begin(),
+                 [](unsigned char c) { return std::tolower(c); });
+  return s;
+}
+
+// Ogg のページで使う CRC-32 (多項式 0x04c11db7 、反転なし)
+std::array<uint32_t, 256> MakeOggCrcTable() {
+  std::array<uint32_t, 256> table{};
+  for (uint32_t i = 0; i < 256; i++) {
+    uint32_t r = i << 24;
+    for (int j = 0; j < 8; j++) {
+      r = (r & 0x80000000) ? (r << 1) ^ 0x04c11db7 : (r << 1);
+    }
+    table[i] = r;
+  }
+  return table;
+}
+
+uint32_t OggCrc(const uint8_t* data, size_t size) {
+  static const std::array<uint32_t, 256> table = MakeOggCrcTable();
+  uint32_t crc = 0;
+  for (size_t i = 0; i < size; i++) {
+    crc = (crc << 8) ^ table[((crc >> 24) & 0xff) ^ data[i]];
+  }
+  return crc;
+}
+
+// Opus のパケットに含まれるサンプル数 (48kHz) を TOC から求める (RFC 6716 3.1)
+uint32_t OpusPacketSamples(const std::vector<uint8_t>& packet) {
+  if (packet.empty()) {
+    return 0;
+  }
+  uint8_t toc = packet[0];
+  uint32_t config = toc >> 3;
+  uint32_t frame_samples;
+  if (config < 12) {
+    // SILK: 10, 20, 40, 60 ms
+    static const uint32_t kSilk[] = {480, 960, 1920, 2880};
+    frame_samples = kSilk[config & 3];
+  } else if (config < 16) {
+    // Hybrid: 10, 20 ms
+    frame_samples = (config & 1) ? 960 : 480;
+  } else {
+    // CELT: 2.5, 5, 10, 20 ms
+    frame_samples = 120 << (config & 3);
+  }
+  uint32_t frames;
+  switch (toc & 3) {
+    case 0:
+      frames = 1;
+      break;
+    case 1:
+    case 2:
+      frames = 2;
+      break;
+    default:
+      frames = packet.size() < 2 ? 0 : (packet[1] & 0x3f);
+      break;
+  }
+  return frame_samples * frames;
+}
+
+}  // namespace
+
+SoraEncodedFrameRecorder::SoraEncodedFrameRecorder(const std::string& path) {
+  file_ = std::fopen(path.c_str(), "wb");
+  if (file_ == nullptr) {
+    throw std::runtime_error("Failed to open file: path=" + path);
+  }
+  buffer_.reserve(kFlushSize * 2);
+  queue_ = webrtc::CreateEnvironment().task_queue_factory().CreateTaskQueue(
+      "EncodedFrameRecorder", webrtc::TaskQueueFactory::Priority::LOW);
+}
+
+SoraEncodedFrameRecorder::~SoraEncodedFrameRecorder() {
+  Close();
+}
+
+bool SoraEncodedFrameRecorder::Process(
+    webrtc::TransformableFrameInterface* frame) {
+  std::lock_guard<std::mutex> lock(mutex_);
+  if (!queue_) {
+    return true;
+  }
+
+  std::string mime_type = ToLower(frame->GetMimeType());
+  if (format_ == Format::kUnknown) {
+    if (mime_type == "video/vp8" || mime_type == "video/vp9" ||
+        mime_type == "video/av1") {
+      format_ = Format::kIvf;
+    } else if (mime_type == "video/h264" || mime_type == "video/h265") {
+      format_ = Format::kAnnexB;
+    } else if (mime_type == "audio/opus") {
+      format_ = Format::kOgg;
+    } else {
+      return true;
+    }
+    mime_type_ = mime_type;
+    RTC_LOG(LS_INFO) << "Start recording: mime_type=" << mime_type_;
+  } else if (mime_type != mime_type_) {
+    // 途中でコーデックが変わったフレームは書き出さない
+    return true;
+  }
+
+  Frame item;
+  item.rtp_timestamp = frame->GetTimestamp();
+  item.width = 0;
+  item.height = 0;
+  if (format_ != Format::kOgg) {
+    auto video_frame =
+        static_cast<webrtc::TransformableVideoFrameInterface*>(frame);
+    if (!started_) {
+      // キーフレームが来るまではデコードできないので書き出さない
+      if (!video_frame->IsKeyFrame()) {
+        return true;
+      }
+      item.width = video_frame->Metadata().GetWidth();
+      item.height = video_frame->Metadata().GetHeight();
+    }
+  }
+  started_ = true;
+
+  auto data = frame->GetData();
+  item.data.assign(data.begin(), data.end());
+  queue_->PostTask([this, item = std::move(item)]() { Write(item); });
+  return true;
+}
+
+void SoraEncodedFrameRecorder::Close() {
+  std::unique_ptr<webrtc::TaskQueueBase, webrtc::TaskQueueDeleter> queue;
+  {
+    std::lock_guard<std::mutex> lock(mutex_);
+    queue = std::move(queue_);
+  }
+  if (!queue) {
+    return;
+  }
+  // 積まれている書き出しが全て終わってから閉じる
+  std::promise<void> finished;
+  queue->PostTask([this, &finished]() {
+    Finish();
+    finished.set_value();
+  });
+  finished.get_future().wait();
+  queue.reset();
+}
+
+std::optional<std::string> SoraEncodedFrameRecorder::GetFormat() const {
+  std::lock_guard<std::mutex> lock(mutex_);
+  switch (format_) {
+    case Format::kIvf:
+      return "ivf";
+    case Format::kAnnexB:
+      return "annexb";
+    case Format::kOgg:
+      return "ogg";
+    default:
+      return std::nullopt;
+  }
+}
+
+void SoraEncodedFrameRecorder::Write(const Frame& frame) {
+  if (frame_count_ == 0) {
+    if (mime_type_ == "audio/opus") {
+      WriteOggHeaders(frame);
+    } else if (mime_type_ != "video/h264" && mime_type_ != "video/h265") {
+      WriteIvfHeader(frame);
+    }
+  }
+
+  uint64_t timestamp = UnwrapTimestamp(frame.rtp_timestamp);
+  if (mime_type_ == "audio/opus") {
+    // DTX などで途切れた区間も再生時間に反映されるように RTP タイムスタンプから求める
+    ogg_granule_position_ = timestamp + OpusPacketSamples(frame.data);
+    WriteOggPage(frame.data.data(), frame.data.size(), 0,
+                 ogg_granule_position_);
+  } else if (ivf_fourcc_ != 0) {
+    AppendLE(buffer_, frame.data.size(), 4);
+    AppendLE(buffer_, timestamp, 8);
+    buffer_.insert(buffer_.end(), frame.data.begin(), frame.data.end());
+  } else {
+    // H.264, H.265 は Annex-B のスタートコード付きで来るのでそのまま書き出す
+    buffer_.insert(buffer_.end(), frame.data.begin(), frame.data.end());
+  }
+  ++frame_count_;
+
+  if (buffer_.size() >= kFlushSize) {
+    Flush();
+  }
+}
+
+void SoraEncodedFrameRecorder::WriteIvfHeader(const Frame& frame) {
+  if (mime_type_ == "video/vp8") {
+    ivf_fourcc_ = 0x30385056;  // "VP80"
+  } else if (mime_type_ == "video/vp9") {
+    ivf_fourcc_ = 0x30395056;  // "VP90"
+  } else {
+    ivf_fourcc_ = 0x31305641;  // "AV01"
+  }
+  const uint8_t signature[] = {'D', 'K', 'I', 'F'};
+  buffer_.insert(buffer_.end(), std::begin(signature), std::end(signature));
+  AppendLE(buffer_, 0, 2);  // version
+  AppendLE(buffer_, kIvfHeaderSize, 2);
+  AppendLE(buffer_, ivf_fourcc_, 4);
+  AppendLE(buffer_, frame.width, 2);
+  AppendLE(buffer_, frame.height, 2);
+  // タイムスタンプは RTP タイムスタンプのまま書き出す
+  AppendLE(buffer_, kVideoClockRate, 4);
+  AppendLE(buffer_, 1, 4);
+  // フレーム数は Finish で書き換える
+  AppendLE(buffer_, 0, 4);
+  AppendLE(buffer_, 0, 4);
+}
+
+void SoraEncodedFrameRecorder::WriteOggHeaders(const Frame& frame) {
+  ogg_serial_ = frame.rtp_timestamp;
+  // TOC の s ビットでステレオかどうかを判断する
+  uint8_t channels = (!frame.data.empty() && (frame.data[0] & 0x04)) ? 2 : 1;
+
+  // RFC 7845 5.1
+  std::vector<uint8_t> head = {'O', 'p', 'u', 's', 'H', 'e', 'a', 'd', 1};
+  head.push_back(channels);
+  AppendLE(head, 0, 2);  // pre-skip
+  AppendLE(head, kOpusSampleRate, 4);
+  AppendLE(head, 0, 2);  // output gain
+  head.push_back(0);     // channel mapping family
+  WriteOggPage(head.data(), head.size(), 0x02, 0);
+
+  // RFC 7845 5.2
+  const std::string vendor = "sora-python-sdk";
+  std::vector<uint8_t> tags = {'O', 'p', 'u', 's', 'T', 'a', 'g', 's'};
+  AppendLE(tags, vendor.size(), 4);
+  tags.insert(tags.end(), vendor.begin(), vendor.end());
+  AppendLE(tags, 0, 4);
+  WriteOggPage(tags.data(), tags.size(), 0, 0);
+}
+
+void SoraEncodedFrameRecorder::WriteOggPage(const uint8_t* data,
+                                            size_t size,
+                                            uint8_t header_type,
+                                            uint64_t granule_position) {
+  // 1 ページに 1 パケットだけ入れる
+  std::vector<uint8_t> lacing(size / 255, 255);
+  lacing.push_back(static_cast<uint8_t>(size % 255));
+  if (size == 0 && header_type != 0) {
+    // EOS のみのページ
+    lacing.clear();
+  }
+
+  size_t start = buffer_.size();
+  const uint8_t capture_pattern[] = {'O', 'g', 'g', 'S'};
+  buffer_.insert(buffer_.end(), std::begin(capture_pattern),
+                 std::end(capture_pattern));
+  buffer_.push_back(0);  // version
+  buffer_.push_back(header_type);
+  AppendLE(buffer_, granule_position, 8);
+  AppendLE(buffer_, ogg_serial_, 4);
+  AppendLE(buffer_, ogg_sequence_++, 4);
+  size_t crc_offset = buffer_.size();
+  AppendLE(buffer_, 0, 4);
+  buffer_.push_back(static_cast<uint8_t>(lacing.size()));
+  buffer_.insert(buffer_.end(), lacing.begin(), lacing.end());
+  buffer_.insert(buffer_.end(), data, data + size);
+  WriteLE(buffer_.data() + crc_offset,
+          OggCrc(buffer_.data() + start, buffer_.size() - start), 4);
+}
+
+uint64_t SoraEncodedFrameRecorder::UnwrapTimestamp(uint32_t rtp_timestamp) {
+  if (last_timestamp_) {
+    // 32 bit で一周した場合も単調に増えるようにする
+    int32_t diff = static_cast<int32_t>(rtp_timestamp - *last_timestamp_);
+    unwrapped_timestamp_ += diff;
+  }
+  last_timestamp_ = rtp_timestamp;
+  return unwrapped_timestamp_;
+}
+
+void SoraEncodedFrameRecorder::Flush() {
+  if (!buffer_.empty()) {
+    std::fwrite(buffer_.data(), 1, buffer_.size(), file_);
+    buffer_.clear();
+  }
+}
+
+void SoraEncodedFrameRecorder::Finish() {
+  if (mime_type_ == "audio/opus" && frame_count_ > 0) {
+    WriteOggPage(nullptr, 0, 0x04, ogg_granule_position_);
+  }
+  Flush();
+  if (ivf_fourcc_ != 0) {
+    // IVF のヘッダのフレーム数を書き換える
+    uint8_t count[4];
+    WriteLE(count, static_cast<uint32_t>(frame_count_), 4);
+    std::fseek(file_, 24, SEEK_SET);
+    std::fwrite(count, 1, sizeof(count), file_);
+  }
+  std::fclose(file_);
+  file_ = nullptr;
+}
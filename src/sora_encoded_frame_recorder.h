@@ -0,0 +1,98 @@
+#ifndef SORA_ENCODED_FRAME_RECORDER_H_
+#define SORA_ENCODED_FRAME_RECORDER_H_
+
+#include <atomic>
+#include <cstdint>
+#include <cstdio>
+#include <memory>
+#include <mutex>
+#include <optional>
+#include <string>
+#include <vector>
+
+// WebRTC
+#include <api/frame_transformer_interface.h>
+#include <api/task_queue/task_queue_base.h>
+
+#include "sora_frame_transform_stage.h"
+
+/**
+ * エンコード済みのフレームをデコードせずにファイルに書き出す SoraEncodedFrameRecorder です。
+ *
+ * SoraFrameTransformer に SoraFrameTransformStage として登録して利用します。
+ * 最初に来たフレームのコーデックから書き出す形式を決めます。
+ *
+ * - VP8, VP9, AV1 は IVF
+ * - H.264, H.265 は Annex-B
+ * - Opus は Ogg
+ *
+ * フレームはコピーしてすぐに後段に渡し、ファイルへの書き出しは専用のスレッドでまとめて行います。
+ * Video は最初のキーフレームから書き出します。
+ */
+class SoraEncodedFrameRecorder : public SoraFrameTransformStage {
+ public:
+  /**
+   * @param path 書き出すファイルのパス
+   */
+  explicit SoraEncodedFrameRecorder(const std::string& path);
+  ~SoraEncodedFrameRecorder() override;
+
+  bool Process(webrtc::TransformableFrameInterface* frame) override;
+
+  /**
+   * 書き出していないフレームを全て書き出してファイルを閉じます。
+   *
+   * 以降に来たフレームは書き出しません。
+   */
+  void Close();
+  /**
+   * 書き出したフレームの数を返します。
+   */
+  uint64_t GetFrameCount() const { return frame_count_; }
+  /**
+   * 書き出しているファイルの形式を返します。
+   *
+   * @return "ivf", "annexb", "ogg" のいずれか、まだフレームが来ていない場合は std::nullopt
+   */
+  std::optional<std::string> GetFormat() const;
+
+ private:
+  enum class Format { kUnknown, kIvf, kAnnexB, kOgg };
+  struct Frame {
+    std::vector<uint8_t> data;
+    uint32_t rtp_timestamp;
+    uint16_t width;
+    uint16_t height;
+  };
+
+  // 以下は書き出し用のスレッドで呼ぶ
+  void Write(const Frame& frame);
+  void WriteIvfHeader(const Frame& frame);
+  void WriteOggHeaders(const Frame& frame);
+  void WriteOggPage(const uint8_t* data,
+                    size_t size,
+                    uint8_t header_type,
+                    uint64_t granule_position);
+  uint64_t UnwrapTimestamp(uint32_t rtp_timestamp);
+  void Flush();
+  void Finish();
+
+  mutable std::mutex mutex_;
+  std::unique_ptr<webrtc::TaskQueueBase, webrtc::TaskQueueDeleter> queue_;
+  Format format_ = Format::kUnknown;
+  std::string mime_type_;
+  bool started_ = false;
+  std::atomic<uint64_t> frame_count_{0};
+
+  // 書き出し用のスレッドからのみ参照する
+  FILE* file_;
+  std::vector<uint8_t> buffer_;
+  uint32_t ivf_fourcc_ = 0;
+  std::optional<uint32_t> last_timestamp_;
+  uint64_t unwrapped_timestamp_ = 0;
+  uint32_t ogg_serial_ = 0;
+  uint32_t ogg_sequence_ = 0;
+  uint64_t ogg_granule_position_ = 0;
+};
+
+#endif
@@ -8,6 +8,7 @@
 #include <api/environment/environment_factory.h>
 #include <api/rtc_event_log/rtc_event_log_factory.h>
 #include <media/engine/webrtc_media_engine.h>
+#include <rtc_base/logging.h>
 #include <rtc_base/ssl_adapter.h>
 
 // Sora
@@ -17,6 +18,7 @@
 #include <sora/sora_video_encoder_factory.h>
 
 #include "dummy_audio_mixer.h"
+#include "sora_video_codec_capability_cache.h"
 #ifndef _WIN32
 #include "dynamic_h264_decoder.h"
 #include "dynamic_h264_encoder.h"
@@ -24,25 +26,65 @@
 
 #include <exception>
 #include <iostream>
+#include <stdexcept>
 
 #include <exception>
 #include <iostream>
 
+#if defined(__linux__)
+#include <pthread.h>
+#include <sched.h>
+#endif
+
+namespace {
+
+void SetThreadAffinity(webrtc::Thread* thread, int cpu) {
+#if defined(__linux__)
+  thread->BlockingCall([cpu]() {
+    cpu_set_t cpuset;
+    CPU_ZERO(&cpuset);
+    CPU_SET(cpu, &cpuset);
+    int result =
+        pthread_setaffinity_np(pthread_self(), sizeof(cpu_set_t), &cpuset);
+    if (result != 0) {
+      RTC_LOG(LS_WARNING) << "Failed to set thread affinity: cpu=" << cpu
+                          << " error=" << result;
+    }
+  });
+#else
+  RTC_LOG(LS_WARNING) << "thread_affinity is only supported on Linux";
+#endif
+}
+
+}  // namespace
+
 SoraFactory::SoraFactory(
     std::optional<std::string> openh264,
     std::optional<sora::VideoCodecPreference> video_codec_preference,
-    std::optional<bool> force_i420_conversion) {
+    std::optional<bool> force_i420_conversion,
+    int contexts,
+    std::optional<std::vector<int>> thread_affinity) {
+  if (contexts < 1) {
+    throw std::invalid_argument("contexts must be 1 or greater");
+  }
+  if (thread_affinity && thread_affinity->empty()) {
+    throw std::invalid_argument("thread_affinity must not be empty");
+  }
   auto env = webrtc::CreateEnvironment();
   sora::SoraClientContextConfig context_config;
   context_config.video_codec_factory_config.capability_config.openh264_path =
       openh264;
-  if (sora::CudaContext::CanCreate()) {
+  // ハードウェアのコンテキストの生成は遅いので、使う可能性がある場合だけ生成し、 Sora インスタンス間で共有する
+  if (!video_codec_preference ||
+      video_codec_preference->HasImplementation(
+          sora::VideoCodecImplementation::kNvidiaVideoCodec)) {
     context_config.video_codec_factory_config.capability_config.cuda_context =
-        sora::CudaContext::Create();
+        GetSharedCudaContext();
   }
-  if (sora::AMFContext::CanCreate()) {
+  if (!video_codec_preference || video_codec_preference->HasImplementation(
+                                     sora::VideoCodecImplementation::kAmdAmf)) {
     context_config.video_codec_factory_config.capability_config.amf_context =
-        sora::AMFContext::Create();
+        GetSharedAMFContext();
   }
   context_config.video_codec_factory_config.preference = video_codec_preference;
 
@@ -60,29 +102,57 @@ SoraFactory::SoraFactory(
         dependencies.audio_mixer = dependencies.worker_thread->BlockingCall(
             [&env]() { return DummyAudioMixer::Create(env); });
       };
-  context_ = sora::SoraClientContext::Create(context_config);
-  if (context_ == nullptr) {
-    throw std::exception();
+  for (int i = 0; i < contexts; i++) {
+    auto context = sora::SoraClientContext::Create(context_config);
+    if (context == nullptr) {
+      throw std::exception();
+    }
+    if (thread_affinity) {
+      int cpu = (*thread_affinity)[i % thread_affinity->size()];
+      SetThreadAffinity(context->network_thread(), cpu);
+      SetThreadAffinity(context->worker_thread(), cpu);
+      SetThreadAffinity(context->signaling_thread(), cpu);
+    }
+    contexts_.push_back(context);
   }
 }
 
 webrtc::scoped_refptr<webrtc::PeerConnectionFactoryInterface>
-SoraFactory::GetPeerConnectionFactory() const {
-  return context_->peer_connection_factory();
+SoraFactory::GetPeerConnectionFactory(size_t index) const {
+  return contexts_[index]->peer_connection_factory();
 };
 
 webrtc::scoped_refptr<webrtc::ConnectionContext>
-SoraFactory::GetConnectionContext() const {
-  return context_->connection_context();
+SoraFactory::GetConnectionContext(size_t index) const {
+  return contexts_[index]->connection_context();
 };
 
-webrtc::NetworkManager* SoraFactory::default_network_manager() {
-  return context_->signaling_thread()->BlockingCall([this]() {
-    return context_->connection_context()->default_network_manager();
+webrtc::NetworkManager* SoraFactory::default_network_manager(size_t index) {
+  auto context = contexts_[index];
+  return context->signaling_thread()->BlockingCall([context]() {
+    return context->connection_context()->default_network_manager();
   });
 }
-webrtc::PacketSocketFactory* SoraFactory::default_socket_factory() {
-  return context_->signaling_thread()->BlockingCall([this]() {
-    return context_->connection_context()->default_socket_factory();
+webrtc::PacketSocketFactory* SoraFactory::default_socket_factory(size_t index) {
+  auto context = contexts_[index];
+  return context->signaling_thread()->BlockingCall([context]() {
+    return context->connection_context()->default_socket_factory();
   });
+}
+
+void SoraFactory::StartNetworkUpdating() {
+  for (size_t i = 0; i < contexts_.size(); i++) {
+    auto network_manager = default_network_manager(i);
+    // NetworkManager はネットワークスレッドでしか触れない
+    GetConnectionContext(i)->network_thread()->BlockingCall(
+        [network_manager]() { network_manager->StartUpdating(); });
+  }
+}
+
+void SoraFactory::StopNetworkUpdating() {
+  for (size_t i = 0; i < contexts_.size(); i++) {
+    auto network_manager = default_network_manager(i);
+    GetConnectionContext(i)->network_thread()->BlockingCall(
+        [network_manager]() { network_manager->StopUpdating(); });
+  }
 }
\ No newline at end of file
@@ -1,7 +1,9 @@
 #ifndef SORA_FACTORY_H_
 #define SORA_FACTORY_H_
 
+#include <memory>
 #include <optional>
+#include <vector>
 
 // WebRTC
 #include <api/peer_connection_interface.h>
@@ -13,21 +15,46 @@
 
 /**
  * sora::SoraClientContext を呼び出す必要がある処理をまとめたクラスです。
+ * 
+ * sora::SoraClientContext はネットワーク、ワーカー、シグナリングのスレッドを 1 本ずつ持つため、
+ * 複数の sora::SoraClientContext を生成して Connection を振り分けることで、メディアの処理を複数のスレッドに分散できます。
+ * index を引数に取る関数は何番目の sora::SoraClientContext を使うかを指定します。
  */
 class SoraFactory {
  public:
+  /**
+   * @param openh264 (オプション) OpenH264 ライブラリへのパス
+   * @param video_codec_preference (オプション) 利用するエンコーダ/デコーダの実装の設定
+   * @param force_i420_conversion (オプション) エンコーダに渡す前に I420 に変換するかどうかの設定
+   * @param contexts 生成する sora::SoraClientContext の数
+   * @param thread_affinity (オプション) i 番目の sora::SoraClientContext のスレッドを
+   *                        thread_affinity[i % thread_affinity.size()] 番の CPU に固定します Linux のみ対応しています
+   */
   SoraFactory(std::optional<std::string> openh264,
               std::optional<sora::VideoCodecPreference> video_codec_preference,
-              std::optional<bool> force_i420_conversion);
+              std::optional<bool> force_i420_conversion,
+              int contexts,
+              std::optional<std::vector<int>> thread_affinity);
 
+  size_t GetContextCount() const { return contexts_.size(); }
   webrtc::scoped_refptr<webrtc::PeerConnectionFactoryInterface>
-  GetPeerConnectionFactory() const;
-  webrtc::scoped_refptr<webrtc::ConnectionContext> GetConnectionContext() const;
-  webrtc::NetworkManager* default_network_manager();
-  webrtc::PacketSocketFactory* default_socket_factory();
+  GetPeerConnectionFactory(size_t index = 0) const;
+  webrtc::scoped_refptr<webrtc::ConnectionContext> GetConnectionContext(
+      size_t index = 0) const;
+  webrtc::NetworkManager* default_network_manager(size_t index = 0);
+  webrtc::PacketSocketFactory* default_socket_factory(size_t index = 0);
+
+  /**
+   * すべての context でネットワークインターフェースの列挙を開始します。
+   *
+   * 列挙を始めておくことで、 Connection ごとの列挙を待たずに候補の収集を始められます。
+   * StartNetworkUpdating を呼んだ場合は SoraFactory を破棄する前に StopNetworkUpdating を呼んでください。
+   */
+  void StartNetworkUpdating();
+  void StopNetworkUpdating();
 
  private:
-  std::shared_ptr<sora::SoraClientContext> context_;
+  std::vector<std::shared_ptr<sora::SoraClientContext>> contexts_;
 };
 
 #endif
\ No newline at end of file
@@ -0,0 +1,176 @@
+#include "sora_frame_transform_stage.h"
+
+#include <algorithm>
+#include <memory>
+#include <stdexcept>
+#include <vector>
+
+// BoringSSL
+#include <openssl/evp.h>
+#include <openssl/rand.h>
+
+namespace {
+
+constexpr size_t kAesGcmTagSize = 16;
+constexpr size_t kAesGcmIvSize = 12;
+
+struct CipherCtxDeleter {
+  void operator()(EVP_CIPHER_CTX* ctx) const { EVP_CIPHER_CTX_free(ctx); }
+};
+using CipherCtx = std::unique_ptr<EVP_CIPHER_CTX, CipherCtxDeleter>;
+
+const EVP_CIPHER* AesGcmCipher(size_t key_size) {
+  return key_size == 16 ? EVP_aes_128_gcm() : EVP_aes_256_gcm();
+}
+
+}  // namespace
+
+SoraAesGcmTransformStage::SoraAesGcmTransformStage(std::string key,
+                                                   size_t unencrypted_bytes)
+    : key_(std::move(key)), unencrypted_bytes_(unencrypted_bytes) {
+  if (key_.size() != 16 && key_.size() != 32) {
+    throw std::invalid_argument("key must be 16 or 32 bytes");
+  }
+}
+
+bool SoraAesGcmTransformStage::Process(
+    webrtc::TransformableFrameInterface* frame) {
+  switch (frame->GetDirection()) {
+    case webrtc::TransformableFrameInterface::Direction::kSender:
+      return Encrypt(frame);
+    case webrtc::TransformableFrameInterface::Direction::kReceiver:
+      return Decrypt(frame);
+    default:
+      return true;
+  }
+}
+
+bool SoraAesGcmTransformStage::Encrypt(
+    webrtc::TransformableFrameInterface* frame) {
+  auto data = frame->GetData();
+  size_t header_size = std::min(unencrypted_bytes_, data.size());
+  size_t payload_size = data.size() - header_size;
+
+  std::vector<uint8_t> out(data.size() + kAesGcmTagSize + kAesGcmIvSize);
+  std::copy(data.begin(), data.begin() + header_size, out.begin());
+  uint8_t* tag = out.data() + header_size + payload_size;
+  uint8_t* iv = tag + kAesGcmTagSize;
+  if (RAND_bytes(iv, kAesGcmIvSize) != 1) {
+    return false;
+  }
+
+  CipherCtx ctx(EVP_CIPHER_CTX_new());
+  int len = 0;
+  // 平文のまま残す先頭部分も改ざんを検知できるように AAD に含める
+  if (!ctx ||
+      EVP_EncryptInit_ex(ctx.get(), AesGcmCipher(key_.size()), nullptr, nullptr,
+                         nullptr) != 1 ||
+      EVP_CIPHER_CTX_ctrl(ctx.get(), EVP_CTRL_GCM_SET_IVLEN, kAesGcmIvSize,
+                          nullptr) != 1 ||
+      EVP_EncryptInit_ex(ctx.get(), nullptr, nullptr,
+                         reinterpret_cast<const uint8_t*>(key_.data()),
+                         iv) != 1 ||
+      EVP_EncryptUpdate(ctx.get(), nullptr, &len, data.data(),
+                        static_cast<int>(header_size)) != 1 ||
+      EVP_EncryptUpdate(ctx.get(), out.data() + header_size, &len,
+                        data.data() + header_size,
+                        static_cast<int>(payload_size)) != 1 ||
+      EVP_EncryptFinal_ex(ctx.get(), out.data() + header_size + len, &len) !=
+          1 ||
+      EVP_CIPHER_CTX_ctrl(ctx.get(), EVP_CTRL_GCM_GET_TAG, kAesGcmTagSize,
+                          tag) != 1) {
+    return false;
+  }
+  frame->SetData(out);
+  return true;
+}
+
+bool SoraAesGcmTransformStage::Decrypt(
+    webrtc::TransformableFrameInterface* frame) {
+  auto data = frame->GetData();
+  if (data.size() < kAesGcmTagSize + kAesGcmIvSize) {
+    return false;
+  }
+  size_t encrypted_size = data.size() - kAesGcmTagSize - kAesGcmIvSize;
+  size_t header_size = std::min(unencrypted_bytes_, encrypted_size);
+  size_t payload_size = encrypted_size - header_size;
+  const uint8_t* tag = data.data() + encrypted_size;
+  const uint8_t* iv = tag + kAesGcmTagSize;
+
+  std::vector<uint8_t> out(encrypted_size);
+  std::copy(data.begin(), data.begin() + header_size, out.begin());
+
+  CipherCtx ctx(EVP_CIPHER_CTX_new());
+  int len = 0;
+  if (!ctx ||
+      EVP_DecryptInit_ex(ctx.get(), AesGcmCipher(key_.size()), nullptr, nullptr,
+                         nullptr) != 1 ||
+      EVP_CIPHER_CTX_ctrl(ctx.get(), EVP_CTRL_GCM_SET_IVLEN, kAesGcmIvSize,
+                          nullptr) != 1 ||
+      EVP_DecryptInit_ex(ctx.get(), nullptr, nullptr,
+                         reinterpret_cast<const uint8_t*>(key_.data()),
+                         iv) != 1 ||
+      EVP_DecryptUpdate(ctx.get(), nullptr, &len, data.data(),
+                        static_cast<int>(header_size)) != 1 ||
+      EVP_DecryptUpdate(ctx.get(), out.data() + header_size, &len,
+                        data.data() + header_size,
+                        static_cast<int>(payload_size)) != 1 ||
+      EVP_CIPHER_CTX_ctrl(ctx.get(), EVP_CTRL_GCM_SET_TAG, kAesGcmTagSize,
+                          const_cast<uint8_t*>(tag)) != 1 ||
+      EVP_DecryptFinal_ex(ctx.get(), out.data() + header_size + len, &len) !=
+          1) {
+    return false;
+  }
+  frame->SetData(out);
+  return true;
+}
+
+SoraTrailerTransformStage::SoraTrailerTransformStage(std::string trailer)
+    : trailer_(std::move(trailer)) {}
+
+bool SoraTrailerTransformStage::Process(
+    webrtc::TransformableFrameInterface* frame) {
+  auto data = frame->GetData();
+  switch (frame->GetDirection()) {
+    case webrtc::TransformableFrameInterface::Direction::kSender: {
+      std::vector<uint8_t> out(data.begin(), data.end());
+      out.insert(out.end(), trailer_.begin(), trailer_.end());
+      frame->SetData(out);
+      return true;
+    }
+    case webrtc::TransformableFrameInterface::Direction::kReceiver: {
+      if (data.size() < trailer_.size() ||
+          !std::equal(trailer_.begin(), trailer_.end(),
+                      data.end() - trailer_.size())) {
+        return false;
+      }
+      // SetData にはフレーム自身のバッファを渡せないので一度コピーする
+      std::vector<uint8_t> out(data.begin(), data.end() - trailer_.size());
+      frame->SetData(out);
+      return true;
+    }
+    default:
+      return true;
+  }
+}
+
+SoraLayerDropTransformStage::SoraLayerDropTransformStage(int max_spatial_index,
+                                                         int max_temporal_index)
+    : max_spatial_index_(max_spatial_index),
+      max_temporal_index_(max_temporal_index) {}
+
+bool SoraLayerDropTransformStage::Process(
+    webrtc::TransformableFrameInterface* frame) {
+  // SoraVideoFrameTransformer にしか登録できないので Video のフレームしか来ない
+  auto metadata =
+      static_cast<webrtc::TransformableVideoFrameInterface*>(frame)->Metadata();
+  int spatial_index = metadata.GetSpatialIndex();
+  int temporal_index = metadata.GetTemporalIndex();
+  if (max_spatial_index_ >= 0 && spatial_index > max_spatial_index_) {
+    return false;
+  }
+  if (max_temporal_index_ >= 0 && temporal_index > max_temporal_index_) {
+    return false;
+  }
+  return true;
+}
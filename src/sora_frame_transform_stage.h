@@ -0,0 +1,97 @@
+#ifndef SORA_FRAME_TRANSFORM_STAGE_H_
+#define SORA_FRAME_TRANSFORM_STAGE_H_
+
+#include <cstddef>
+#include <cstdint>
+#include <string>
+
+// WebRTC
+#include <api/frame_transformer_interface.h>
+
+/**
+ * Python を呼び出さずに WebRTC のスレッド上でエンコード済みのフレームを処理する SoraFrameTransformStage です。
+ *
+ * SoraFrameTransformer に登録して利用します。
+ * SENDER のフレームは登録した順番に、RECEIVER のフレームは登録した逆の順番に処理するので、
+ * 送信側と受信側で同じ順番で登録すれば送信側の処理を受信側で元に戻せます。
+ */
+class SoraFrameTransformStage {
+ public:
+  virtual ~SoraFrameTransformStage() = default;
+  /**
+   * フレームを処理する関数です。
+   *
+   * 複数の WebRTC のスレッドから同時に呼ばれるため、スレッドセーフに実装してください。
+   *
+   * @param frame 処理するフレーム
+   * @return フレームを後段に渡す場合は true 、破棄する場合は false
+   */
+  virtual bool Process(webrtc::TransformableFrameInterface* frame) = 0;
+};
+
+/**
+ * AES-GCM でフレームを暗号化、復号する SoraAesGcmTransformStage です。
+ *
+ * SENDER のフレームは先頭の unencrypted_bytes を平文のまま残して暗号化し、
+ * 末尾に認証タグ (16 バイト) と IV (12 バイト) を付与します。
+ * IV はフレームごとにランダムに生成します。
+ * RECEIVER のフレームは復号し、認証に失敗したフレームは破棄します。
+ */
+class SoraAesGcmTransformStage : public SoraFrameTransformStage {
+ public:
+  /**
+   * @param key 16 バイトもしくは 32 バイトの鍵
+   * @param unencrypted_bytes 暗号化せずに残すフレームの先頭のバイト数
+   */
+  SoraAesGcmTransformStage(std::string key, size_t unencrypted_bytes);
+
+  bool Process(webrtc::TransformableFrameInterface* frame) override;
+
+ private:
+  bool Encrypt(webrtc::TransformableFrameInterface* frame);
+  bool Decrypt(webrtc::TransformableFrameInterface* frame);
+
+  std::string key_;
+  size_t unencrypted_bytes_;
+};
+
+/**
+ * フレームの末尾に固定のバイト列を付与、除去する SoraTrailerTransformStage です。
+ *
+ * SENDER のフレームには trailer を付与します。
+ * RECEIVER のフレームは末尾が trailer と一致する場合に除去し、一致しないフレームは破棄します。
+ */
+class SoraTrailerTransformStage : public SoraFrameTransformStage {
+ public:
+  /**
+   * @param trailer フレームの末尾に付与するバイト列
+   */
+  explicit SoraTrailerTransformStage(std::string trailer);
+
+  bool Process(webrtc::TransformableFrameInterface* frame) override;
+
+ private:
+  std::string trailer_;
+};
+
+/**
+ * 空間レイヤーと時間レイヤーのインデックスが上限を超える Video のフレームを破棄する SoraLayerDropTransformStage です。
+ *
+ * インデックスが取得できないフレームは破棄しません。
+ */
+class SoraLayerDropTransformStage : public SoraFrameTransformStage {
+ public:
+  /**
+   * @param max_spatial_index 残す空間レイヤーのインデックスの上限 負の値の場合は制限しない
+   * @param max_temporal_index 残す時間レイヤーのインデックスの上限 負の値の場合は制限しない
+   */
+  SoraLayerDropTransformStage(int max_spatial_index, int max_temporal_index);
+
+  bool Process(webrtc::TransformableFrameInterface* frame) override;
+
+ private:
+  int max_spatial_index_;
+  int max_temporal_index_;
+};
+
+#endif
@@ -1,18 +1,38 @@
 #ifndef SORA_TRANSFORMER_H_
 #define SORA_TRANSFORMER_H_
 
+#include <algorithm>
+#include <atomic>
+#include <memory>
+#include <mutex>
+#include <optional>
+#include <stdexcept>
 #include <unordered_map>
+#include <vector>
 
 // nonobind
 #include <nanobind/nanobind.h>
 #include <nanobind/ndarray.h>
 #include <nanobind/stl/unique_ptr.h>
 
+#include "gil.h"
+#include "py_buffer.h"
+#include "sora_call.h"
+#include "sora_encoded_frame_recorder.h"
+#include "sora_frame_transform_stage.h"
+
 // WebRTC
+#include <api/environment/environment_factory.h>
 #include <api/frame_transformer_interface.h>
+#include <api/task_queue/task_queue_base.h>
+#include <api/task_queue/task_queue_factory.h>
+#include <api/units/time_delta.h>
+#include <rtc_base/logging.h>
 
 namespace nb = nanobind;
 
+class SoraEncodedFrameInjector;
+
 class SoraTransformFrameCallback {
  public:
   virtual void Transform(std::unique_ptr<webrtc::TransformableFrameInterface>
@@ -92,12 +112,67 @@ class SoraFrameTransformerInterface : public webrtc::FrameTransformerInterface {
       callbacks_;
 };
 
+/**
+ * Encoded Transform を外した RtpSender に設定する SoraPassthroughFrameTransformer です。
+ * 
+ * SoraFrameTransformerInterface は複数の接続で共有されることがあるため、
+ * StartShortCircuiting で外すと共有している全ての接続で Transform が呼ばれなくなります。
+ * 外す RtpSender だけにこれを設定し、登録されたコールバックを短絡させてフレームをそのまま送信します。
+ */
+class SoraPassthroughFrameTransformer
+    : public webrtc::FrameTransformerInterface {
+ public:
+  // 短絡させる前に渡されたフレームはそのまま戻す
+  void Transform(std::unique_ptr<webrtc::TransformableFrameInterface>
+                     transformable_frame) override {
+    webrtc::scoped_refptr<webrtc::TransformedFrameCallback> callback;
+    {
+      std::lock_guard<std::mutex> lock(mutex_);
+      auto it = callbacks_.find(transformable_frame->GetSsrc());
+      callback = it != callbacks_.end() ? it->second : default_callback_;
+    }
+    if (callback) {
+      callback->OnTransformedFrame(std::move(transformable_frame));
+    }
+  }
+  void RegisterTransformedFrameCallback(
+      webrtc::scoped_refptr<webrtc::TransformedFrameCallback> callback)
+      override {
+    callback->StartShortCircuiting();
+    std::lock_guard<std::mutex> lock(mutex_);
+    default_callback_ = callback;
+  }
+  void RegisterTransformedFrameSinkCallback(
+      webrtc::scoped_refptr<webrtc::TransformedFrameCallback> callback,
+      uint32_t ssrc) override {
+    callback->StartShortCircuiting();
+    std::lock_guard<std::mutex> lock(mutex_);
+    callbacks_[ssrc] = callback;
+  }
+  void UnregisterTransformedFrameCallback() override {
+    std::lock_guard<std::mutex> lock(mutex_);
+    default_callback_ = nullptr;
+  }
+  void UnregisterTransformedFrameSinkCallback(uint32_t ssrc) override {
+    std::lock_guard<std::mutex> lock(mutex_);
+    callbacks_.erase(ssrc);
+  }
+
+ private:
+  std::mutex mutex_;
+  webrtc::scoped_refptr<webrtc::TransformedFrameCallback> default_callback_;
+  std::unordered_map<uint32_t,
+                     webrtc::scoped_refptr<webrtc::TransformedFrameCallback>>
+      callbacks_;
+};
+
 /**
  * Transform で渡される webrtc::TransformableFrameInterface を格納する SoraTransformableFrame です。
  * エンコード済みのフレームデータを格納します。
  * 
  * コピーすることはできません。
  * enqueue に渡した時点で所有権を失うため利用できなくなるので注意してください。
+ * enqueue_many に渡した後に操作すると RuntimeError になります。
  * 
  * Audio, Video で共通する部分をここに実装して、それぞれで継承して利用します。
  */
@@ -108,8 +183,17 @@ class SoraTransformableFrame {
       : frame_(std::move(frame)) {}
 
   std::unique_ptr<webrtc::TransformableFrameInterface> ReleaseFrame() {
-    // ReleaseFrame() で frame_ はなくなるが、
-    // SoraTransformableFrame 自体を unique_ptr で扱っている前提のため参照時に frame_ の有無は確認しない
+    // 既に enqueue_many でストリームに戻したフレーム
+    if (!frame_) {
+      return nullptr;
+    }
+    // get_mutable_data などで書き換えたデータはここで一度だけフレームに反映する
+    if (buffer_) {
+      frame_->SetData(*buffer_);
+      buffer_.reset();
+    }
+    // enqueue_many は Python のオブジェクトを残したまま frame_ を取り出すため、
+    // 以降の参照は Frame() で frame_ の有無を確認する
     return std::move(frame_);
   }
 
@@ -119,13 +203,46 @@ class SoraTransformableFrame {
    * @return NumPy の配列 numpy.ndarray のフレームデータ
    */
   const nb::ndarray<nb::numpy, const uint8_t, nb::shape<-1>> GetData() const {
-    auto view = frame_->GetData();
+    if (buffer_) {
+      size_t shape[1] = {buffer_->size()};
+      return nb::ndarray<nb::numpy, const uint8_t, nb::shape<-1>>(
+          buffer_->data(), 1, shape, BufferOwner());
+    }
+
+    auto view = Frame()->GetData();
 
     // pybind11 なら memoryview があるが、 nanobind にはなく ndarray に const をつけて ReadOnly にする
     size_t shape[1] = {static_cast<size_t>(view.size())};
     return nb::ndarray<nb::numpy, const uint8_t, nb::shape<-1>>(
         view.data(), 1, shape, nb::handle());
   }
+  /**
+   * 書き換え可能なフレームデータを取得する関数です。
+   * 
+   * 戻り値を直接書き換えると、enqueue した時点でフレームに反映されます。
+   * フレームのバッファは WebRTC の他の処理と共有されている可能性があるため、
+   * 最初に呼び出した時に 1 度だけ SoraTransformableFrame 内のバッファにコピーし、以降はそのバッファを参照します。
+   * 戻り値はバッファを所有しているため、enqueue の後も安全に参照できますが、
+   * enqueue の後や、append_data や set_data_from でサイズが reserve を超えて変わった後に
+   * それ以前に取得した戻り値を書き換えてもフレームには反映されないので注意してください。
+   * 
+   * @param reserve append_data で末尾に追加する予定のバイト数
+   * @return 書き換え可能な NumPy の配列 numpy.ndarray のフレームデータ
+   */
+  nb::ndarray<nb::numpy, uint8_t, nb::shape<-1>> GetMutableData(
+      size_t reserve) {
+    auto& buffer = Buffer();
+    if (buffer.capacity() < buffer.size() + reserve) {
+      // 既に渡した配列が参照しているバッファは再確保せず、新しいバッファに切り替える
+      auto reserved = std::make_shared<std::vector<uint8_t>>();
+      reserved->reserve(buffer.size() + reserve);
+      reserved->assign(buffer.begin(), buffer.end());
+      buffer_ = std::move(reserved);
+    }
+    size_t shape[1] = {buffer_->size()};
+    return nb::ndarray<nb::numpy, uint8_t, nb::shape<-1>>(buffer_->data(), 1,
+                                                          shape, BufferOwner());
+  }
   /**
    * フレームデータを入れ替える関数です。
    * 
@@ -134,36 +251,132 @@ class SoraTransformableFrame {
   void SetData(
       nb::ndarray<const uint8_t, nb::shape<-1>, nb::c_contig, nb::device::cpu>
           data) {
-    frame_->SetData(
+    auto frame = Frame();
+    buffer_.reset();
+    frame->SetData(
         webrtc::ArrayView<const uint8_t>(data.data(), data.shape(0)));
   }
-  const uint8_t GetPayloadType() const { return frame_->GetPayloadType(); }
-  const uint32_t GetSsrc() const { return frame_->GetSsrc(); }
+  /**
+   * バッファプロトコルに対応したオブジェクトでフレームデータを入れ替える関数です。
+   * 
+   * bytes や numpy.ndarray に変換することなく、1 度のコピーで入れ替えます。
+   * 
+   * @param data 入れ替えるフレームデータ
+   */
+  void SetDataFrom(nb::handle data) {
+    // enqueue_many でストリームに戻した後は RuntimeError にする
+    Frame();
+    PyBuffer view(data);
+    // get_mutable_data の戻り値が参照しているバッファは書き換えず、新しいバッファに切り替える
+    // get_mutable_data の戻り値の一部が渡された場合も、切り替えるまでは元のバッファが残っている
+    buffer_ = std::make_shared<std::vector<uint8_t>>(view.data(),
+                                                     view.data() + view.size());
+  }
+  /**
+   * フレームデータの末尾にデータを追加する関数です。
+   * 
+   * get_mutable_data の reserve で確保しておくと再確保が起きません。
+   * 
+   * @param data 追加するデータ
+   */
+  void AppendData(nb::handle data) {
+    PyBuffer view(data);
+    auto& buffer = Buffer();
+    if (buffer.capacity() < buffer.size() + view.size()) {
+      // 再確保すると get_mutable_data の戻り値が解放済みのメモリを指してしまうため、
+      // 新しいバッファに切り替えて元のバッファは戻り値に所有させたままにする
+      auto grown = std::make_shared<std::vector<uint8_t>>();
+      grown->reserve(buffer.size() + view.size());
+      grown->assign(buffer.begin(), buffer.end());
+      grown->insert(grown->end(), view.data(), view.data() + view.size());
+      buffer_ = std::move(grown);
+      return;
+    }
+    if (Overlaps(view)) {
+      std::vector<uint8_t> copied(view.data(), view.data() + view.size());
+      buffer.insert(buffer.end(), copied.begin(), copied.end());
+      return;
+    }
+    buffer.insert(buffer.end(), view.data(), view.data() + view.size());
+  }
+  const uint8_t GetPayloadType() const { return Frame()->GetPayloadType(); }
+  const uint32_t GetSsrc() const { return Frame()->GetSsrc(); }
   const uint32_t GetTimestamp() const {
     // これは RTPTimestamp なので注意
-    return frame_->GetTimestamp();
+    return Frame()->GetTimestamp();
   }
   void SetRTPTimestamp(uint32_t timestamp) {
-    frame_->SetRTPTimestamp(timestamp);
+    Frame()->SetRTPTimestamp(timestamp);
   }
   std::optional<int64_t> GetCaptureTimeIdentifier() const {
     // Audio, Video, Direction によっては実装されていないため optional
-    auto opt = frame_->GetPresentationTimestamp();
+    auto opt = Frame()->GetPresentationTimestamp();
     return opt.has_value() ? std::optional<int64_t>(opt->us()) : std::nullopt;
   }
   webrtc::TransformableFrameInterface::Direction GetDirection() {
-    return frame_->GetDirection();
+    return Frame()->GetDirection();
   }
-  std::string GetMimeType() { return std::move(frame_->GetMimeType()); }
+  std::string GetMimeType() { return std::move(Frame()->GetMimeType()); }
 
  protected:
+  webrtc::TransformableFrameInterface* Frame() const {
+    if (!frame_) {
+      throw std::runtime_error("The frame has already been enqueued");
+    }
+    return frame_.get();
+  }
+
   std::unique_ptr<webrtc::TransformableFrameInterface> frame_;
+
+ private:
+  std::vector<uint8_t>& Buffer() {
+    if (!buffer_) {
+      auto view = Frame()->GetData();
+      buffer_ =
+          std::make_shared<std::vector<uint8_t>>(view.begin(), view.end());
+    }
+    return *buffer_;
+  }
+  // 配列にバッファの所有権を持たせ、ReleaseFrame や切り替えの後もメモリが解放されないようにする
+  nb::capsule BufferOwner() const {
+    auto owner = new std::shared_ptr<std::vector<uint8_t>>(buffer_);
+    return nb::capsule(owner, [](void* p) noexcept {
+      delete static_cast<std::shared_ptr<std::vector<uint8_t>>*>(p);
+    });
+  }
+  bool Overlaps(const PyBuffer& view) const {
+    if (!buffer_ || buffer_->empty()) {
+      return false;
+    }
+    const uint8_t* begin = buffer_->data();
+    const uint8_t* end = begin + buffer_->capacity();
+    return view.data() < end && begin < view.data() + view.size();
+  }
+
+  // 書き換えたフレームデータ ReleaseFrame でフレームに反映する
+  // GetData や GetMutableData の戻り値とも共有する
+  std::shared_ptr<std::vector<uint8_t>> buffer_;
+};
+
+/**
+ * SoraFrameTransformer のワーカースレッドの処理が追いつかない時のフレームの扱いです。
+ */
+enum class SoraFrameTransformOverflowPolicy {
+  // フレームを破棄する
+  kDrop,
+  // on_transform を呼び出さずにストリームに戻す
+  kPassthrough,
 };
 
 /**
  * Encoded Transform を行う SoraFrameTransformer です。
  * 
  * Audio, Video で共通する部分をここに実装して、それぞれで継承して利用します。
+ * 
+ * SoraFrameTransformStage を登録すると、Python を呼び出さずに WebRTC のスレッド上でフレームを処理します。
+ * SENDER のフレームは on_transform の後に、RECEIVER のフレームは on_transform の前に処理します。
+ * on_transform が設定されていない、もしくは set_transform_filter の条件に合わないフレームは
+ * Python を呼び出さずにストリームに戻します。
  */
 class SoraFrameTransformer : public SoraTransformFrameCallback {
  public:
@@ -172,7 +385,10 @@ class SoraFrameTransformer : public SoraTransformFrameCallback {
   }
   virtual ~SoraFrameTransformer() { Del(); }
 
-  void Del() { interface_->ReleaseTransformer(); }
+  void Del() {
+    interface_->ReleaseTransformer();
+    StopWorker();
+  }
   /**
    * SoraTransformableFrame をストリームに戻す関数です。
    * 
@@ -182,7 +398,11 @@ class SoraFrameTransformer : public SoraTransformFrameCallback {
    * @param frame on_transform で渡された SoraTransformableFrame
    */
   void Enqueue(std::unique_ptr<SoraTransformableFrame> frame) {
-    interface_->Enqueue(frame->ReleaseFrame());
+    auto released = frame->ReleaseFrame();
+    // 既に enqueue_many でストリームに戻したフレームは無視する
+    if (released) {
+      Deliver(std::move(released));
+    }
   }
   void StartShortCircuiting() { interface_->StartShortCircuiting(); }
   /**
@@ -195,8 +415,400 @@ class SoraFrameTransformer : public SoraTransformFrameCallback {
     return interface_;
   }
 
+  /**
+   * AES-GCM でフレームを暗号化、復号する SoraAesGcmTransformStage を追加します。
+   * 
+   * @param key 16 バイトもしくは 32 バイトの鍵
+   * @param unencrypted_bytes 暗号化せずに残すフレームの先頭のバイト数
+   */
+  void AddAesGcmStage(nb::handle key, size_t unencrypted_bytes) {
+    PyBuffer view(key);
+    AddStage(std::make_shared<SoraAesGcmTransformStage>(
+        std::string(reinterpret_cast<const char*>(view.data()), view.size()),
+        unencrypted_bytes));
+  }
+  /**
+   * フレームの末尾に固定のバイト列を付与、除去する SoraTrailerTransformStage を追加します。
+   * 
+   * @param trailer フレームの末尾に付与するバイト列
+   */
+  void AddTrailerStage(nb::handle trailer) {
+    PyBuffer view(trailer);
+    AddStage(std::make_shared<SoraTrailerTransformStage>(
+        std::string(reinterpret_cast<const char*>(view.data()), view.size())));
+  }
+  /**
+   * エンコード済みのフレームをファイルに書き出す SoraEncodedFrameRecorder を追加します。
+   * 
+   * 暗号化されていないフレームを書き出す場合は add_aes_gcm_stage より前に追加してください。
+   * 
+   * @param recorder フレームを書き出す SoraEncodedFrameRecorder
+   */
+  void AddRecordingStage(std::shared_ptr<SoraEncodedFrameRecorder> recorder) {
+    AddStage(std::move(recorder));
+  }
+  /**
+   * 登録した SoraFrameTransformStage を全て取り除きます。
+   */
+  void ClearStages() {
+    std::lock_guard<std::mutex> lock(mutex_);
+    stages_ = std::make_shared<const Stages>();
+  }
+  /**
+   * on_transform を呼び出すフレームの条件を設定します。
+   * 
+   * 条件に合わないフレームは on_transform を呼び出さずにストリームに戻します。
+   * 
+   * @param key_frame_only キーフレームのみ on_transform を呼び出す (Audio では全てのフレームが対象になります)
+   * @param payload_types (オプション) on_transform を呼び出す Payload Type のリスト
+   */
+  void SetTransformFilter(bool key_frame_only,
+                          std::optional<std::vector<uint8_t>> payload_types) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    key_frame_only_ = key_frame_only;
+    payload_types_ = std::move(payload_types);
+  }
+
+  /**
+   * on_transform を WebRTC のスレッドではなく専用のワーカースレッドから呼び出すようにします。
+   * 
+   * on_transform の処理が遅い場合や GIL の獲得を待つ場合に、エンコーダーや RTP の受信スレッドを止めないようにします。
+   * on_transform に渡したまま処理が終わっていないフレームが max_in_flight を超えた場合は、
+   * overflow_policy に従ってフレームを破棄するか、on_transform を呼び出さずにストリームに戻します。
+   * 
+   * 既にワーカースレッドを開始している場合は max_in_flight と overflow_policy のみ変更します。
+   * 
+   * @param max_in_flight ワーカースレッドに渡して処理が終わっていないフレームの上限
+   * @param overflow_policy 上限を超えた時のフレームの扱い
+   */
+  void StartWorker(size_t max_in_flight,
+                   SoraFrameTransformOverflowPolicy overflow_policy) {
+    if (max_in_flight == 0) {
+      throw std::invalid_argument("max_in_flight must be greater than 0");
+    }
+    std::lock_guard<std::mutex> lock(mutex_);
+    if (batch_size_ > max_in_flight) {
+      throw std::invalid_argument(
+          "max_in_flight must be greater than or equal to batch_size");
+    }
+    max_in_flight_ = max_in_flight;
+    overflow_policy_ = overflow_policy;
+    if (!worker_) {
+      worker_ =
+          webrtc::CreateEnvironment().task_queue_factory().CreateTaskQueue(
+              "FrameTransformWorker",
+              webrtc::TaskQueueFactory::Priority::NORMAL);
+    }
+  }
+  /**
+   * StartWorker で開始したワーカースレッドを終了し、on_transform を WebRTC のスレッドから呼び出すように戻します。
+   * 
+   * ワーカースレッドに渡して on_transform をまだ呼び出していないフレームは破棄されます。
+   */
+  void StopWorker() {
+    std::unique_ptr<webrtc::TaskQueueBase, webrtc::TaskQueueDeleter> worker;
+    {
+      std::lock_guard<std::mutex> lock(mutex_);
+      worker = std::move(worker_);
+    }
+    if (!worker) {
+      return;
+    }
+    // ワーカースレッドが on_transform を呼び出すために GIL の獲得を待っている場合があるので、
+    // GIL を解放してからワーカースレッドの終了を待つ
+    {
+      gil_scoped_release release;
+      worker.reset();
+    }
+    std::lock_guard<std::mutex> lock(mutex_);
+    pending_.clear();
+    in_flight_ = 0;
+  }
+  /**
+   * on_transform_many にフレームをまとめて渡すように設定します。
+   * 
+   * start_worker でワーカースレッドを開始している場合のみ有効です。
+   * batch_size 件溜まるか、最初のフレームから interval_ms 経過した時に on_transform_many を呼び出します。
+   * 
+   * batch_size が start_worker の max_in_flight を超えると on_transform_many が呼ばれなくなるため、
+   * ワーカースレッドを開始している場合は max_in_flight 以下にしてください。
+   * 
+   * @param batch_size まとめるフレームの数 0 の場合はまとめない
+   * @param interval_ms 最初のフレームが来てから on_transform_many を呼び出すまでの最大の時間 (ms) 1 以上
+   */
+  void SetTransformBatch(size_t batch_size, int interval_ms) {
+    if (interval_ms <= 0) {
+      throw std::invalid_argument("interval_ms must be greater than 0");
+    }
+    std::lock_guard<std::mutex> lock(mutex_);
+    if (worker_ && batch_size > max_in_flight_) {
+      throw std::invalid_argument(
+          "batch_size must be less than or equal to max_in_flight");
+    }
+    batch_size_ = batch_size;
+    batch_interval_ms_ = interval_ms;
+  }
+  /**
+   * 複数の SoraTransformableFrame をまとめてストリームに戻す関数です。
+   * 
+   * enqueue と同じく、渡した SoraTransformableFrame は以後操作することはできません。
+   * Python のオブジェクトは残りますが、フレームを参照する関数は RuntimeError になります。
+   * ストリームに戻す処理は GIL を解放して行います。
+   * 
+   * @param frames on_transform_many で渡された SoraTransformableFrame のリスト
+   */
+  void EnqueueMany(nb::list frames) {
+    std::vector<std::unique_ptr<webrtc::TransformableFrameInterface>> released;
+    released.reserve(nb::len(frames));
+    for (nb::handle item : frames) {
+      auto frame = nb::cast<SoraTransformableFrame*>(item)->ReleaseFrame();
+      // 既に enqueue されたフレームは無視する
+      if (frame) {
+        released.push_back(std::move(frame));
+      }
+    }
+    gil_scoped_release release;
+    for (auto& frame : released) {
+      Deliver(std::move(frame));
+    }
+  }
+
+  // エンコードされたフレームがくる
+  void Transform(std::unique_ptr<webrtc::TransformableFrameInterface>
+                     transformable_frame) override {
+    if (transformable_frame->GetDirection() !=
+            webrtc::TransformableFrameInterface::Direction::kSender &&
+        !ProcessStages(transformable_frame.get())) {
+      return;
+    }
+    if (!Select(transformable_frame.get())) {
+      Deliver(std::move(transformable_frame));
+      return;
+    }
+
+    std::unique_lock<std::mutex> lock(mutex_);
+    // on_transform_many にまとめて渡すのはワーカースレッドがある場合のみ
+    bool batch = worker_ && batch_size_ > 0 && has_transform_many_callback_;
+    if (!batch && !has_transform_callback_) {
+      lock.unlock();
+      Deliver(std::move(transformable_frame));
+      return;
+    }
+    if (!worker_) {
+      lock.unlock();
+      InvokeTransform(std::move(transformable_frame));
+      return;
+    }
+    if (in_flight_ >= max_in_flight_) {
+      // Python の処理が追いついていない
+      auto policy = overflow_policy_;
+      lock.unlock();
+      if (policy == SoraFrameTransformOverflowPolicy::kPassthrough) {
+        Deliver(std::move(transformable_frame));
+      }
+      return;
+    }
+    ++in_flight_;
+    if (batch) {
+      pending_.push_back(std::move(transformable_frame));
+      if (pending_.size() >= batch_size_) {
+        PostBatch();
+      } else if (pending_.size() == 1) {
+        worker_->PostDelayedTask(
+            [this, generation = batch_generation_]() {
+              FlushBatch(generation);
+            },
+            webrtc::TimeDelta::Millis(batch_interval_ms_));
+      }
+      return;
+    }
+    worker_->PostTask([this, frame = std::move(transformable_frame)]() mutable {
+      // InvokeTransform は例外を投げないので、 on_transform が失敗しても in_flight_ は必ず戻る
+      InvokeTransform(std::move(frame));
+      std::lock_guard<std::mutex> lock(mutex_);
+      --in_flight_;
+    });
+  }
+
+  // set_transform_batch を設定した場合にフレームのリストを受け取るコールバック
+  std::function<void(nb::list)> on_transform_many_;
+  // Transform で GIL を獲得せずにコールバックの有無を見るためのもの
+  // Python からコールバックを設定した時に GIL を獲得した状態で更新する
+  // コールバックを呼び出す前には GIL を獲得した状態でコールバックを確認し直す
+  std::atomic<bool> has_transform_callback_ = false;
+  std::atomic<bool> has_transform_many_callback_ = false;
+
+ protected:
+  void AddStage(std::shared_ptr<SoraFrameTransformStage> stage) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    auto stages = std::make_shared<Stages>(*stages_);
+    stages->push_back(std::move(stage));
+    stages_ = std::move(stages);
+  }
+  // GIL を獲得した状態で呼ぶこと
+  virtual bool HasTransformCallback() const = 0;
+  // GIL を獲得した状態で呼ぶこと
+  virtual void CallTransform(
+      std::unique_ptr<webrtc::TransformableFrameInterface> frame) = 0;
+  virtual bool IsKeyFrame(webrtc::TransformableFrameInterface* frame) const {
+    return true;
+  }
+  // on_transform_many に渡すために Audio, Video それぞれの SoraTransformableFrame に変換する
+  virtual nb::object WrapFrame(
+      std::unique_ptr<webrtc::TransformableFrameInterface> frame) = 0;
+
  private:
+  using Stages = std::vector<std::shared_ptr<SoraFrameTransformStage>>;
+  using Frames =
+      std::vector<std::unique_ptr<webrtc::TransformableFrameInterface>>;
+
+  // mutex_ を保持した状態で呼ぶこと
+  void PostBatch() {
+    Frames frames = std::move(pending_);
+    pending_.clear();
+    ++batch_generation_;
+    worker_->PostTask([this, frames = std::move(frames)]() mutable {
+      CallTransformMany(std::move(frames));
+    });
+  }
+  // ワーカースレッドで interval_ms 経過した時に呼ばれる
+  void FlushBatch(uint64_t generation) {
+    Frames frames;
+    {
+      std::lock_guard<std::mutex> lock(mutex_);
+      // 既に batch_size に達して渡し済み
+      if (generation != batch_generation_ || pending_.empty()) {
+        return;
+      }
+      frames = std::move(pending_);
+      pending_.clear();
+      ++batch_generation_;
+    }
+    CallTransformMany(std::move(frames));
+  }
+  void CallTransformMany(Frames frames) {
+    size_t count = frames.size();
+    bool called = false;
+    {
+      gil_scoped_acquire acquire;
+      // GIL を獲得するまでの間に on_transform_many が解除されることがある
+      if (on_transform_many_) {
+        nb::list list;
+        for (auto& frame : frames) {
+          list.append(WrapFrame(std::move(frame)));
+        }
+        try {
+          call_python(on_transform_many_, list);
+          called = true;
+        } catch (...) {
+          // ワーカースレッドから例外を投げるとプロセスが終了するので、ログの出力だけで止める
+          // enqueue_many されていないフレームは取り出して、下でストリームに戻す
+          frames.clear();
+          // list は Python から書き換えられている場合があるので try_cast で取り出す
+          for (nb::handle item : list) {
+            SoraTransformableFrame* wrapped = nullptr;
+            if (!nb::try_cast(item, wrapped) || wrapped == nullptr) {
+              continue;
+            }
+            if (auto frame = wrapped->ReleaseFrame()) {
+              frames.push_back(std::move(frame));
+            }
+          }
+        }
+      }
+    }
+    if (!called) {
+      // 解除された場合や例外が発生した場合はフレームを破棄せずにストリームに戻す
+      for (auto& frame : frames) {
+        Deliver(std::move(frame));
+      }
+    }
+    std::lock_guard<std::mutex> lock(mutex_);
+    in_flight_ -= std::min(in_flight_, count);
+  }
+
+  // on_transform を呼び出す、解除されていた場合はフレームを破棄せずにストリームに戻す
+  // ワーカースレッドから例外を投げるとプロセスが終了するので、例外はログの出力だけで止める
+  void InvokeTransform(
+      std::unique_ptr<webrtc::TransformableFrameInterface> frame) {
+    {
+      gil_scoped_acquire acquire;
+      // has_transform_callback_ を見てから GIL を獲得するまでの間に on_transform が解除されることがある
+      if (HasTransformCallback()) {
+        try {
+          CallTransform(std::move(frame));
+        } catch (std::exception& e) {
+          // on_transform に渡したフレームは Python のオブジェクトと一緒に破棄される
+          RTC_LOG(LS_ERROR) << "Failed to call on_transform: " << e.what();
+        } catch (...) {
+          RTC_LOG(LS_ERROR) << "Failed to call on_transform: Unknown exception";
+        }
+        return;
+      }
+    }
+    Deliver(std::move(frame));
+  }
+  // SENDER のフレームを ProcessStages で処理してからストリームに戻す
+  void Deliver(std::unique_ptr<webrtc::TransformableFrameInterface> frame) {
+    if (frame->GetDirection() ==
+            webrtc::TransformableFrameInterface::Direction::kSender &&
+        !ProcessStages(frame.get())) {
+      return;
+    }
+    interface_->Enqueue(std::move(frame));
+  }
+  // false が返ってきた場合はフレームを破棄する
+  bool ProcessStages(webrtc::TransformableFrameInterface* frame) {
+    std::shared_ptr<const Stages> stages;
+    {
+      std::lock_guard<std::mutex> lock(mutex_);
+      stages = stages_;
+    }
+    // RECEIVER では SENDER で処理した順番と逆の順番で元に戻す
+    if (frame->GetDirection() ==
+        webrtc::TransformableFrameInterface::Direction::kSender) {
+      for (auto it = stages->begin(); it != stages->end(); ++it) {
+        if (!(*it)->Process(frame)) {
+          return false;
+        }
+      }
+    } else {
+      for (auto it = stages->rbegin(); it != stages->rend(); ++it) {
+        if (!(*it)->Process(frame)) {
+          return false;
+        }
+      }
+    }
+    return true;
+  }
+  bool Select(webrtc::TransformableFrameInterface* frame) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    if (key_frame_only_ && !IsKeyFrame(frame)) {
+      return false;
+    }
+    if (payload_types_ &&
+        std::find(payload_types_->begin(), payload_types_->end(),
+                  frame->GetPayloadType()) == payload_types_->end()) {
+      return false;
+    }
+    return true;
+  }
+
   webrtc::scoped_refptr<SoraFrameTransformerInterface> interface_;
+  std::mutex mutex_;
+  // 毎フレーム参照するため、変更時は作り直して差し替える
+  std::shared_ptr<const Stages> stages_ = std::make_shared<const Stages>();
+  bool key_frame_only_ = false;
+  std::optional<std::vector<uint8_t>> payload_types_;
+  std::unique_ptr<webrtc::TaskQueueBase, webrtc::TaskQueueDeleter> worker_;
+  size_t max_in_flight_ = 0;
+  size_t in_flight_ = 0;
+  SoraFrameTransformOverflowPolicy overflow_policy_ =
+      SoraFrameTransformOverflowPolicy::kPassthrough;
+  size_t batch_size_ = 0;
+  int batch_interval_ms_ = 10;
+  Frames pending_;
+  uint64_t batch_generation_ = 0;
 };
 
 /**
@@ -244,7 +856,7 @@ class SoraTransformableAudioFrame : public SoraTransformableFrame {
  private:
   const webrtc::TransformableAudioFrameInterface* frame() const {
     return static_cast<const webrtc::TransformableAudioFrameInterface*>(
-        frame_.get());
+        Frame());
   }
 };
 
@@ -257,14 +869,26 @@ class SoraTransformableAudioFrame : public SoraTransformableFrame {
 class SoraAudioFrameTransformer : public SoraFrameTransformer {
  public:
   SoraAudioFrameTransformer() : SoraFrameTransformer() {}
+  // ワーカースレッドから CallTransform が呼ばれないように、破棄される前に止める
+  ~SoraAudioFrameTransformer() override { StopWorker(); }
 
-  void Transform(std::unique_ptr<webrtc::TransformableFrameInterface>
-                     transformable_frame) override {
+  std::function<void(std::unique_ptr<SoraTransformableAudioFrame>)>
+      on_transform_;
+
+ protected:
+  bool HasTransformCallback() const override {
+    return static_cast<bool>(on_transform_);
+  }
+  void CallTransform(std::unique_ptr<webrtc::TransformableFrameInterface>
+                         transformable_frame) override {
     on_transform_(std::make_unique<SoraTransformableAudioFrame>(
         std::move(transformable_frame)));
   }
-  std::function<void(std::unique_ptr<SoraTransformableAudioFrame>)>
-      on_transform_;
+  nb::object WrapFrame(std::unique_ptr<webrtc::TransformableFrameInterface>
+                           transformable_frame) override {
+    return nb::cast(std::make_unique<SoraTransformableAudioFrame>(
+        std::move(transformable_frame)));
+  }
 };
 
 /**
@@ -311,7 +935,7 @@ class SoraTransformableVideoFrame : public SoraTransformableFrame {
  private:
   const webrtc::TransformableVideoFrameInterface* frame() const {
     return static_cast<const webrtc::TransformableVideoFrameInterface*>(
-        frame_.get());
+        Frame());
   }
 };
 
@@ -324,13 +948,49 @@ class SoraTransformableVideoFrame : public SoraTransformableFrame {
 class SoraVideoFrameTransformer : public SoraFrameTransformer {
  public:
   SoraVideoFrameTransformer() : SoraFrameTransformer() {}
+  // ワーカースレッドから CallTransform が呼ばれないように、破棄される前に止める
+  ~SoraVideoFrameTransformer() override { StopWorker(); }
 
-  void Transform(std::unique_ptr<webrtc::TransformableFrameInterface>
-                     transformable_frame) override {
-    on_transform_(std::make_unique<SoraTransformableVideoFrame>(
-        std::move(transformable_frame)));
+  /**
+   * 空間レイヤーと時間レイヤーのインデックスが上限を超えるフレームを破棄する
+   * SoraLayerDropTransformStage を追加します。
+   * 
+   * @param max_spatial_index 残す空間レイヤーのインデックスの上限 負の値の場合は制限しない
+   * @param max_temporal_index 残す時間レイヤーのインデックスの上限 負の値の場合は制限しない
+   */
+  void AddLayerDropStage(int max_spatial_index, int max_temporal_index) {
+    AddStage(std::make_shared<SoraLayerDropTransformStage>(max_spatial_index,
+                                                           max_temporal_index));
   }
+  /**
+   * エンコード済みの映像データを再エンコードせずに送信する SoraEncodedFrameInjector を追加します。
+   * 
+   * SoraEncodedFrameInjector は SoraVideoSource に依存するため sora_encoded_frame_injector.cpp に実装します。
+   * 
+   * @param injector 送信するデータを渡す SoraEncodedFrameInjector
+   */
+  void AddInjectionStage(std::shared_ptr<SoraEncodedFrameInjector> injector);
+
   std::function<void(std::unique_ptr<SoraTransformableVideoFrame>)>
       on_transform_;
+
+ protected:
+  bool HasTransformCallback() const override {
+    return static_cast<bool>(on_transform_);
+  }
+  void CallTransform(std::unique_ptr<webrtc::TransformableFrameInterface>
+                         transformable_frame) override {
+    on_transform_(std::make_unique<SoraTransformableVideoFrame>(
+        std::move(transformable_frame)));
+  }
+  nb::object WrapFrame(std::unique_ptr<webrtc::TransformableFrameInterface>
+                           transformable_frame) override {
+    return nb::cast(std::make_unique<SoraTransformableVideoFrame>(
+        std::move(transformable_frame)));
+  }
+  bool IsKeyFrame(webrtc::TransformableFrameInterface* frame) const override {
+    return static_cast<webrtc::TransformableVideoFrameInterface*>(frame)
+        ->IsKeyFrame();
+  }
 };
 #endif  // SORA_TRANSFORMER_H_
\ No newline at end of file
@@ -1,61 +1,118 @@
-from .sora_sdk_ext import *  # noqa: F401,F403
+"""
+sora_sdk_ext は libwebrtc を含む大きな拡張モジュールで読み込みに時間がかかるため、
+属性に初めてアクセスした時に読み込む。
+バージョンの取得や型の参照だけを行うツールやワーカープロセスの起動を速くするため、
+import sora_sdk の時点では拡張モジュールも importlib.metadata も読み込まない。
+"""
 
-# インストールされたパッケージの場合は importlib.metadata から取得
-# 開発環境の場合は VERSION ファイルから取得
-try:
-    from importlib.metadata import version, PackageNotFoundError
+import os
+from importlib import import_module
+from typing import TYPE_CHECKING
 
-    try:
-        __version__ = version("sora_sdk")
-    except PackageNotFoundError:
-        # パッケージがインストールされていない場合（開発環境）
-        import os
+if TYPE_CHECKING:
+    from ._sink import SoraAudioSink, SoraAudioStreamSink, SoraVideoSink  # noqa: F401
+    from .sora_sdk_ext import *  # noqa: F401,F403
 
-        _version_file = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "VERSION"
-        )
-        if os.path.exists(_version_file):
-            with open(_version_file, "r") as f:
-                __version__ = f.read().strip()
-        else:
-            __version__ = "unknown"
+# パッケージのビルド時に埋め込んだバージョンを使う
+try:
+    from ._version import __version__
 except ImportError:
-    # Python 3.8 以前の互換性のため
     __version__ = "unknown"
 
-"""
-sink はそれぞれ track が必要で参照を保持する必要がある
-しかしながら、 sink の C++ 側で shared_ptr として track を持つと、
-リファレンスカウンタが正しく処理されず終了時にリークしてしまう。
-そのため Python で Wrapper を作り、その中で保持することとした。
-"""
+# 開発環境では VERSION ファイルがあるので、ビルドしていない場合は VERSION ファイルから取得する
+# 古いビルドで書き出した _version.py が残っていると VERSION を更新しても古いバージョンを返すので、
+# +debug などのビルドの種類を除いたバージョンが VERSION と食い違う場合も VERSION ファイルを使う
+_version_file = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "VERSION")
+if os.path.exists(_version_file):
+    with open(_version_file, "r") as f:
+        _source_version = f.read().strip()
+    if __version__.split("+")[0] != _source_version:
+        __version__ = _source_version
+
+# sora_sdk_ext の Impl クラスを継承しているので、 sora_sdk_ext と合わせて読み込む
+_SINK_NAMES = ("SoraAudioSink", "SoraAudioStreamSink", "SoraVideoSink")
 
 
-class SoraAudioSink(SoraAudioSinkImpl):
-    def __init__(self, track, output_frequency, output_channels):
-        super().__init__(track, output_frequency, output_channels)
-        self.__track = track
+def __getattr__(name: str):
+    # from . import ... は属性の確認でこの関数を呼び出して再帰するので import_module を使う
+    if name == "__all__":
+        sora_sdk_ext = import_module(".sora_sdk_ext", __name__)
+        value = [n for n in dir(sora_sdk_ext) if not n.startswith("_")]
+        value += [*_SINK_NAMES, "SoraPool"]
+    elif name in _SINK_NAMES:
+        value = getattr(import_module("._sink", __name__), name)
+    elif name.startswith("__"):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    else:
+        sora_sdk_ext = import_module(".sora_sdk_ext", __name__)
+        try:
+            value = getattr(sora_sdk_ext, name)
+        except AttributeError:
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    # 次回以降は __getattr__ を通らないようにする
+    globals()[name] = value
+    return value
 
-    def __del__(self):
-        super().__del__()
-        del self.__track
 
+def __dir__():
+    return sorted(set(globals()) | set(__getattr__("__all__")))
 
-class SoraAudioStreamSink(SoraAudioStreamSinkImpl):
-    def __init__(self, track, output_frequency, output_channels):
-        super().__init__(track, output_frequency, output_channels)
-        self.__track = track
 
-    def __del__(self):
-        super().__del__()
-        del self.__track
+class SoraPool:
+    """
+    複数の Sora インスタンスに Connection を振り分ける SoraPool です。
 
+    Connection は生成時点で切断も破棄もされていない Connection が最も少ない Sora インスタンスに振り分けます。
+    AudioSource と VideoSource は 1 つ目の Sora インスタンスで生成し、
+    他の Sora インスタンスの Connection には create_mirror_source で転送したトラックを渡します。
+    """
 
-class SoraVideoSink(SoraVideoSinkImpl):
-    def __init__(self, track):
-        super().__init__(track)
-        self.__track = track
+    def __init__(self, size: int, **kwargs):
+        """
+        :param size: 生成する Sora インスタンスの数
+        :param kwargs: 各 Sora インスタンスの生成時に渡す引数
+        """
+        if size < 1:
+            raise ValueError("size must be 1 or greater")
+        from .sora_sdk_ext import Sora
+
+        self._shards = [Sora(**kwargs) for _ in range(size)]
+        # (id(source), shard の番号) -> (source, 転送したトラック)
+        # source が先に解放されて id が再利用されないよう source の参照も保持する
+        self._mirrors = {}
+
+    @property
+    def shards(self):
+        return list(self._shards)
+
+    def create_audio_source(self, channels: int, sample_rate: int):
+        return self._shards[0].create_audio_source(channels, sample_rate)
+
+    def create_video_source(self):
+        return self._shards[0].create_video_source()
+
+    def create_connection(self, audio_source=None, video_source=None, **kwargs):
+        """
+        最も Connection の少ない Sora インスタンスで Connection を生成します。
+
+        :param audio_source: create_audio_source で生成した AudioSource
+        :param video_source: create_video_source で生成した VideoSource
+        :param kwargs: Sora.create_connection に渡す引数
+        """
+        index = min(range(len(self._shards)), key=lambda i: self._shards[i].connection_count)
+        return self._shards[index].create_connection(
+            audio_source=self._source_for(audio_source, index),
+            video_source=self._source_for(video_source, index),
+            **kwargs,
+        )
 
-    def __del__(self):
-        super().__del__()
-        del self.__track
+    def _source_for(self, source, index: int):
+        if source is None or index == 0:
+            return source
+        key = (id(source), index)
+        if key not in self._mirrors:
+            self._mirrors[key] = (
+                source,
+                self._shards[index].create_mirror_source(source),
+            )
+        return self._mirrors[key][1]
@@ -25,10 +25,12 @@
 #include "sora_audio_source.h"
 #include "sora_audio_stream_sink.h"
 #include "sora_connection.h"
+#include "sora_encoded_frame_injector.h"
 #include "sora_frame_transformer.h"
 #include "sora_log.h"
 #include "sora_track_interface.h"
 #include "sora_vad.h"
+#include "sora_video_codec_capability_cache.h"
 #include "sora_video_sink.h"
 #include "sora_video_source.h"
 
@@ -161,6 +163,11 @@ int audio_frame_transformer_tp_traverse(PyObject* self,
     nb::object on_transform = nb::find(audio_frame_transformer->on_transform_);
     Py_VISIT(on_transform.ptr());
   }
+  if (audio_frame_transformer->on_transform_many_) {
+    nb::object on_transform_many =
+        nb::find(audio_frame_transformer->on_transform_many_);
+    Py_VISIT(on_transform_many.ptr());
+  }
 
   return 0;
 }
@@ -173,6 +180,9 @@ int audio_frame_transformer_tp_clear(PyObject* self) {
   SoraAudioFrameTransformer* audio_frame_transformer =
       nb::inst_ptr<SoraAudioFrameTransformer>(self);
   audio_frame_transformer->on_transform_ = nullptr;
+  audio_frame_transformer->on_transform_many_ = nullptr;
+  audio_frame_transformer->has_transform_callback_ = false;
+  audio_frame_transformer->has_transform_many_callback_ = false;
   return 0;
 }
 
@@ -195,6 +205,11 @@ int video_frame_transformer_tp_traverse(PyObject* self,
     nb::object on_transform = nb::find(video_frame_transformer->on_transform_);
     Py_VISIT(on_transform.ptr());
   }
+  if (video_frame_transformer->on_transform_many_) {
+    nb::object on_transform_many =
+        nb::find(video_frame_transformer->on_transform_many_);
+    Py_VISIT(on_transform_many.ptr());
+  }
 
   return 0;
 }
@@ -207,6 +222,9 @@ int video_frame_transformer_tp_clear(PyObject* self) {
   SoraVideoFrameTransformer* video_frame_transformer =
       nb::inst_ptr<SoraVideoFrameTransformer>(self);
   video_frame_transformer->on_transform_ = nullptr;
+  video_frame_transformer->on_transform_many_ = nullptr;
+  video_frame_transformer->has_transform_callback_ = false;
+  video_frame_transformer->has_transform_many_callback_ = false;
   return 0;
 }
 
@@ -257,6 +275,16 @@ int connection_tp_traverse(PyObject* self, visitproc visit, void* arg) {
     Py_VISIT(on_message.ptr());
   }
 
+  if (conn->on_messages_) {
+    nb::object on_messages = nb::find(conn->on_messages_);
+    Py_VISIT(on_messages.ptr());
+  }
+
+  if (conn->on_blob_) {
+    nb::object on_blob = nb::find(conn->on_blob_);
+    Py_VISIT(on_blob.ptr());
+  }
+
   if (conn->on_rpc_) {
     nb::object on_rpc = nb::find(conn->on_rpc_);
     Py_VISIT(on_rpc.ptr());
@@ -272,11 +300,35 @@ int connection_tp_traverse(PyObject* self, visitproc visit, void* arg) {
     Py_VISIT(on_track.ptr());
   }
 
+  if (conn->on_remove_track_) {
+    nb::object on_remove_track = nb::find(conn->on_remove_track_);
+    Py_VISIT(on_remove_track.ptr());
+  }
+
   if (conn->on_data_channel_) {
     nb::object on_data_channel = nb::find(conn->on_data_channel_);
     Py_VISIT(on_data_channel.ptr());
   }
 
+  if (conn->on_reconnect_) {
+    nb::object on_reconnect = nb::find(conn->on_reconnect_);
+    Py_VISIT(on_reconnect.ptr());
+  }
+
+  if (conn->on_buffered_amount_low_) {
+    nb::object on_buffered_amount_low = nb::find(conn->on_buffered_amount_low_);
+    Py_VISIT(on_buffered_amount_low.ptr());
+  }
+
+  if (conn->on_send_error_) {
+    nb::object on_send_error = nb::find(conn->on_send_error_);
+    Py_VISIT(on_send_error.ptr());
+  }
+
+  if (conn->disconnect_future_.is_valid()) {
+    Py_VISIT(conn->disconnect_future_.ptr());
+  }
+
   return 0;
 }
 
@@ -293,9 +345,16 @@ int connection_tp_clear(PyObject* self) {
   conn->on_notify_ = nullptr;
   conn->on_push_ = nullptr;
   conn->on_message_ = nullptr;
+  conn->on_messages_ = nullptr;
+  conn->on_blob_ = nullptr;
   conn->on_switched_ = nullptr;
   conn->on_track_ = nullptr;
+  conn->on_remove_track_ = nullptr;
   conn->on_data_channel_ = nullptr;
+  conn->on_reconnect_ = nullptr;
+  conn->on_buffered_amount_low_ = nullptr;
+  conn->on_send_error_ = nullptr;
+  conn->disconnect_future_ = nb::object();
   return 0;
 }
 
@@ -499,9 +558,95 @@ NB_MODULE(sora_sdk_ext, m) {
       nb::type_slots(connection_slots))
       .def("connect", &SoraConnection::Connect)
       .def("disconnect", &SoraConnection::Disconnect)
+      .def("disconnect_async", &SoraConnection::DisconnectAsync)
+      .def("set_audio_track", &SoraConnection::SetAudioTrack,
+           "audio_source"_a.none(),
+           nb::sig("def set_audio_track("
+                   "self, "
+                   "audio_source: Optional[SoraTrackInterface]"
+                   ") -> None"))
+      .def("set_video_track", &SoraConnection::SetVideoTrack,
+           "video_source"_a.none(),
+           nb::sig("def set_video_track("
+                   "self, "
+                   "video_source: Optional[SoraTrackInterface]"
+                   ") -> None"))
+      .def("set_audio_sender_frame_transformer",
+           &SoraConnection::SetAudioSenderFrameTransformer,
+           "audio_sender_frame_transformer"_a.none(),
+           nb::sig("def set_audio_sender_frame_transformer("
+                   "self, "
+                   "audio_sender_frame_transformer: "
+                   "Optional[SoraAudioFrameTransformer]"
+                   ") -> None"))
+      .def("set_video_sender_frame_transformer",
+           &SoraConnection::SetVideoSenderFrameTransformer,
+           "video_sender_frame_transformer"_a.none(),
+           nb::sig("def set_video_sender_frame_transformer("
+                   "self, "
+                   "video_sender_frame_transformer: "
+                   "Optional[SoraVideoFrameTransformer]"
+                   ") -> None"))
       .def("send_data_channel", &SoraConnection::SendDataChannel, "label"_a,
-           "data"_a)
+           "data"_a,
+           nb::sig("def send_data_channel("
+                   "self, "
+                   "label: str, "
+                   "data: collections.abc.Buffer"
+                   ") -> bool"))
+      .def("send_data_channel_many",
+           nb::overload_cast<const std::string&, nb::handle>(
+               &SoraConnection::SendDataChannelMany),
+           "label"_a, "data_list"_a,
+           nb::sig("def send_data_channel_many("
+                   "self, "
+                   "label: str, "
+                   "data_list: collections.abc.Iterable[collections.abc.Buffer]"
+                   ") -> list[bool]"))
+      .def("send_data_channel_many",
+           nb::overload_cast<nb::handle>(&SoraConnection::SendDataChannelMany),
+           "messages"_a,
+           nb::sig("def send_data_channel_many("
+                   "self, "
+                   "messages: collections.abc.Iterable["
+                   "tuple[str, collections.abc.Buffer]]"
+                   ") -> list[bool]"))
+      .def("enqueue_data_channel", &SoraConnection::EnqueueDataChannel,
+           "label"_a, "data"_a, "block"_a = false, "timeout"_a = nb::none(),
+           nb::sig("def enqueue_data_channel("
+                   "self, "
+                   "label: str, "
+                   "data: collections.abc.Buffer, "
+                   "block: bool = False, "
+                   "timeout: Optional[float] = None"
+                   ") -> bool"))
+      .def("send_blob", &SoraConnection::SendBlob, "label"_a, "data"_a,
+           "chunk_size"_a = 16 * 1024, "timeout"_a = nb::none(),
+           nb::sig("def send_blob("
+                   "self, "
+                   "label: str, "
+                   "data: collections.abc.Buffer, "
+                   "chunk_size: int = 16384, "
+                   "timeout: Optional[float] = None"
+                   ") -> bool"))
+      .def("set_data_channel_compression",
+           &SoraConnection::SetDataChannelCompression, "label"_a,
+           "level"_a = -1, "dictionary"_a = nb::none(),
+           "max_decompressed_size"_a = 16 * 1024 * 1024,
+           nb::sig("def set_data_channel_compression("
+                   "self, "
+                   "label: str, "
+                   "level: int = -1, "
+                   "dictionary: Optional[collections.abc.Buffer] = None, "
+                   "max_decompressed_size: int = 16777216"
+                   ") -> None"))
+      .def("remove_data_channel_compression",
+           &SoraConnection::RemoveDataChannelCompression, "label"_a)
+      .def("buffered_amount", &SoraConnection::BufferedAmount, "label"_a)
+      .def("wait_buffered_amount_low", &SoraConnection::WaitBufferedAmountLow,
+           "label"_a, "timeout"_a = nb::none())
       .def("get_stats", &SoraConnection::GetStats)
+      .def_prop_ro("timings", &SoraConnection::GetTimings)
       .def_rw("on_set_offer", &SoraConnection::on_set_offer_)
       .def_rw("on_ws_close", &SoraConnection::on_ws_close_)
       .def_rw("on_disconnect", &SoraConnection::on_disconnect_)
@@ -509,10 +654,50 @@ NB_MODULE(sora_sdk_ext, m) {
       .def_rw("on_notify", &SoraConnection::on_notify_)
       .def_rw("on_push", &SoraConnection::on_push_)
       .def_rw("on_message", &SoraConnection::on_message_)
+      .def_rw("on_messages", &SoraConnection::on_messages_)
+      .def_rw("on_blob", &SoraConnection::on_blob_)
+      .def_rw("message_as_memoryview", &SoraConnection::message_as_memoryview_)
+      .def_prop_rw(
+          "message_batch_size",
+          [](SoraConnection& conn) { return conn.message_batch_size_.load(); },
+          [](SoraConnection& conn, size_t value) {
+            conn.message_batch_size_ = value;
+          })
+      .def_prop_rw(
+          "message_batch_interval_ms",
+          [](SoraConnection& conn) {
+            return conn.message_batch_interval_ms_.load();
+          },
+          [](SoraConnection& conn, int value) {
+            conn.message_batch_interval_ms_ = value;
+          })
+      .def_rw("auto_reconnect", &SoraConnection::auto_reconnect_)
+      .def_rw("reconnect_max_attempts",
+              &SoraConnection::reconnect_max_attempts_)
+      .def_rw("reconnect_initial_delay_ms",
+              &SoraConnection::reconnect_initial_delay_ms_)
+      .def_rw("reconnect_max_delay_ms",
+              &SoraConnection::reconnect_max_delay_ms_)
       .def_rw("on_rpc", &SoraConnection::on_rpc_)
       .def_rw("on_switched", &SoraConnection::on_switched_)
       .def_rw("on_track", &SoraConnection::on_track_)
-      .def_rw("on_data_channel", &SoraConnection::on_data_channel_);
+      .def_rw("on_remove_track", &SoraConnection::on_remove_track_)
+      .def_rw("on_data_channel", &SoraConnection::on_data_channel_)
+      .def_rw("on_reconnect", &SoraConnection::on_reconnect_)
+      .def_rw("on_buffered_amount_low",
+              &SoraConnection::on_buffered_amount_low_)
+      .def_rw("on_send_error", &SoraConnection::on_send_error_)
+      .def_prop_rw(
+          "buffered_amount_low_threshold",
+          [](SoraConnection& conn) {
+            return conn.buffered_amount_low_threshold_.load();
+          },
+          [](SoraConnection& conn, uint64_t value) {
+            conn.buffered_amount_low_threshold_ = value;
+          })
+      .def_rw("max_buffered_amount", &SoraConnection::max_buffered_amount_)
+      .def_rw("max_blob_size", &SoraConnection::max_blob_size_)
+      .def_rw("max_blob_assemblies", &SoraConnection::max_blob_assemblies_);
 
   nb::enum_<webrtc::TransformableFrameInterface::Direction>(
       m, "SoraTransformableFrameDirection", nb::is_arithmetic())
@@ -525,7 +710,19 @@ NB_MODULE(sora_sdk_ext, m) {
   nb::class_<SoraTransformableFrame>(m, "SoraTransformableFrame")
       .def("get_data", &SoraTransformableFrame::GetData,
            nb::rv_policy::reference_internal)
+      .def("get_mutable_data", &SoraTransformableFrame::GetMutableData,
+           "reserve"_a = 0, nb::rv_policy::reference_internal)
       .def("set_data", &SoraTransformableFrame::SetData)
+      .def("set_data_from", &SoraTransformableFrame::SetDataFrom, "data"_a,
+           nb::sig("def set_data_from("
+                   "self, "
+                   "data: collections.abc.Buffer"
+                   ") -> None"))
+      .def("append_data", &SoraTransformableFrame::AppendData, "data"_a,
+           nb::sig("def append_data("
+                   "self, "
+                   "data: collections.abc.Buffer"
+                   ") -> None"))
       .def_prop_ro("payload_type", &SoraTransformableFrame::GetPayloadType)
       .def_prop_ro("ssrc", &SoraTransformableFrame::GetSsrc)
       .def_prop_rw("rtp_timestamp", &SoraTransformableFrame::GetTimestamp,
@@ -571,24 +768,116 @@ NB_MODULE(sora_sdk_ext, m) {
       .def_prop_ro("contributing_sources",
                    &SoraTransformableVideoFrame::GetCsrcs);
 
+  nb::class_<SoraEncodedFrameRecorder>(m, "SoraEncodedFrameRecorder")
+      .def(nb::init<const std::string&>(), "path"_a)
+      .def("close", &SoraEncodedFrameRecorder::Close,
+           nb::call_guard<nb::gil_scoped_release>())
+      .def_prop_ro("frame_count", &SoraEncodedFrameRecorder::GetFrameCount)
+      .def_prop_ro("format", &SoraEncodedFrameRecorder::GetFormat);
+
+  nb::class_<SoraEncodedFrameInjector>(m, "SoraEncodedFrameInjector")
+      .def(nb::init<SoraVideoSource*, int, int, size_t>(), "video_source"_a,
+           "width"_a = 320, "height"_a = 240, "max_queue_size"_a = 30)
+      .def("push", &SoraEncodedFrameInjector::Push, "data"_a, "key_frame"_a,
+           "timestamp_us"_a = nb::none(),
+           nb::sig("def push("
+                   "self, "
+                   "data: collections.abc.Buffer, "
+                   "key_frame: bool, "
+                   "timestamp_us: Optional[int] = None"
+                   ") -> bool"))
+      .def_prop_ro("queue_size", &SoraEncodedFrameInjector::GetQueueSize);
+
+  nb::enum_<SoraFrameTransformOverflowPolicy>(
+      m, "SoraFrameTransformOverflowPolicy", nb::is_arithmetic())
+      .value("DROP", SoraFrameTransformOverflowPolicy::kDrop)
+      .value("PASSTHROUGH", SoraFrameTransformOverflowPolicy::kPassthrough);
+
   nb::class_<SoraFrameTransformer>(m, "SoraFrameTransformer")
       .def("enqueue", &SoraFrameTransformer::Enqueue)
       .def("start_short_circuiting",
-           &SoraFrameTransformer::StartShortCircuiting);
+           &SoraFrameTransformer::StartShortCircuiting)
+      .def("add_aes_gcm_stage", &SoraFrameTransformer::AddAesGcmStage, "key"_a,
+           "unencrypted_bytes"_a = 0,
+           nb::sig("def add_aes_gcm_stage("
+                   "self, "
+                   "key: collections.abc.Buffer, "
+                   "unencrypted_bytes: int = 0"
+                   ") -> None"))
+      .def("add_trailer_stage", &SoraFrameTransformer::AddTrailerStage,
+           "trailer"_a,
+           nb::sig("def add_trailer_stage("
+                   "self, "
+                   "trailer: collections.abc.Buffer"
+                   ") -> None"))
+      .def("add_recording_stage", &SoraFrameTransformer::AddRecordingStage,
+           "recorder"_a)
+      .def("clear_stages", &SoraFrameTransformer::ClearStages)
+      .def("start_worker", &SoraFrameTransformer::StartWorker,
+           "max_in_flight"_a = 8,
+           "overflow_policy"_a = SoraFrameTransformOverflowPolicy::kPassthrough)
+      .def("stop_worker", &SoraFrameTransformer::StopWorker)
+      .def("set_transform_batch", &SoraFrameTransformer::SetTransformBatch,
+           "batch_size"_a, "interval_ms"_a = 10)
+      .def("enqueue_many", &SoraFrameTransformer::EnqueueMany, "frames"_a,
+           nb::sig("def enqueue_many("
+                   "self, "
+                   "frames: list[SoraTransformableFrame]"
+                   ") -> None"))
+      .def("set_transform_filter", &SoraFrameTransformer::SetTransformFilter,
+           "key_frame_only"_a = false, "payload_types"_a = nb::none())
+      .def_prop_rw(
+          "on_transform_many",
+          [](SoraFrameTransformer& transformer) {
+            return transformer.on_transform_many_;
+          },
+          [](SoraFrameTransformer& transformer,
+             std::function<void(nb::list)> on_transform_many) {
+            transformer.on_transform_many_ = std::move(on_transform_many);
+            transformer.has_transform_many_callback_ =
+                static_cast<bool>(transformer.on_transform_many_);
+          });
 
   nb::class_<SoraAudioFrameTransformer, SoraFrameTransformer>(
       m, "SoraAudioFrameTransformer",
       nb::type_slots(audio_frame_transformer_slots))
       .def(nb::init<>())
       .def("__del__", &SoraAudioFrameTransformer::Del)
-      .def_rw("on_transform", &SoraAudioFrameTransformer::on_transform_);
+      .def_prop_rw(
+          "on_transform",
+          [](SoraAudioFrameTransformer& transformer) {
+            return transformer.on_transform_;
+          },
+          [](SoraAudioFrameTransformer& transformer,
+             std::function<void(std::unique_ptr<SoraTransformableAudioFrame>)>
+                 on_transform) {
+            transformer.on_transform_ = std::move(on_transform);
+            transformer.has_transform_callback_ =
+                static_cast<bool>(transformer.on_transform_);
+          });
 
   nb::class_<SoraVideoFrameTransformer, SoraFrameTransformer>(
       m, "SoraVideoFrameTransformer",
       nb::type_slots(video_frame_transformer_slots))
       .def(nb::init<>())
       .def("__del__", &SoraVideoFrameTransformer::Del)
-      .def_rw("on_transform", &SoraVideoFrameTransformer::on_transform_);
+      .def("add_injection_stage", &SoraVideoFrameTransformer::AddInjectionStage,
+           "injector"_a)
+      .def("add_layer_drop_stage",
+           &SoraVideoFrameTransformer::AddLayerDropStage,
+           "max_spatial_index"_a = -1, "max_temporal_index"_a = -1)
+      .def_prop_rw(
+          "on_transform",
+          [](SoraVideoFrameTransformer& transformer) {
+            return transformer.on_transform_;
+          },
+          [](SoraVideoFrameTransformer& transformer,
+             std::function<void(std::unique_ptr<SoraTransformableVideoFrame>)>
+                 on_transform) {
+            transformer.on_transform_ = std::move(on_transform);
+            transformer.has_transform_callback_ =
+                static_cast<bool>(transformer.on_transform_);
+          });
 
   nb::enum_<sora::VideoCodecImplementation>(m, "SoraVideoCodecImplementation",
                                             nb::is_arithmetic())
@@ -643,18 +932,13 @@ NB_MODULE(sora_sdk_ext, m) {
 
   m.def(
       "get_video_codec_capability",
-      [](std::optional<std::string> openh264) -> sora::VideoCodecCapability {
-        sora::VideoCodecCapabilityConfig config;
-        config.openh264_path = openh264;
-        if (sora::CudaContext::CanCreate()) {
-          config.cuda_context = sora::CudaContext::Create();
-        }
-        if (sora::AMFContext::CanCreate()) {
-          config.amf_context = sora::AMFContext::Create();
-        }
-        return sora::GetVideoCodecCapability(config);
+      [](std::optional<std::string> openh264,
+         std::optional<std::string> cache_file) -> sora::VideoCodecCapability {
+        return GetCachedVideoCodecCapability(openh264, cache_file);
       },
-      "openh264"_a = nb::none());
+      "openh264"_a = nb::none(), "cache_file"_a = nb::none(),
+      // 初回はハードウェアの確認に時間がかかるので、他のスレッドを止めないよう GIL を解放する
+      nb::call_guard<nb::gil_scoped_release>());
 
   auto video_codec_preference =
       nb::class_<sora::VideoCodecPreference>(m, "SoraVideoCodecPreference")
@@ -720,15 +1004,27 @@ NB_MODULE(sora_sdk_ext, m) {
   m.def("create_video_codec_preference_from_implementation",
         &sora::CreateVideoCodecPreferenceFromImplementation);
 
+  nb::class_<SoraConnectionConfig>(
+      m, "SoraConnectionConfig",
+      nb::intrusive_ptr<SoraConnectionConfig>(
+          [](SoraConnectionConfig* p, PyObject* po) noexcept {
+            p->set_self_py(po);
+          }))
+      .def_prop_ro("role", &SoraConnectionConfig::role)
+      .def_prop_ro("channel_id", &SoraConnectionConfig::channel_id);
+
   nb::class_<Sora>(m, "Sora",
                    nb::intrusive_ptr<Sora>([](Sora* p, PyObject* po) noexcept {
                      p->set_self_py(po);
                    }))
       .def(nb::init<std::optional<std::string>,
                     std::optional<sora::VideoCodecPreference>,
-                    std::optional<bool>>(),
+                    std::optional<bool>, int, int,
+                    std::optional<std::vector<int>>, int, bool>(),
            "openh264"_a = nb::none(), "video_codec_preference"_a = nb::none(),
-           "force_i420_conversion"_a = nb::none())
+           "force_i420_conversion"_a = nb::none(), "io_threads"_a = 1,
+           "contexts"_a = 1, "thread_affinity"_a = nb::none(),
+           "dtls_certificates"_a = 0, "prewarm_network"_a = false)
       .def("create_connection", &Sora::CreateConnection, "signaling_urls"_a,
            "role"_a, "channel_id"_a, "client_id"_a = nb::none(),
            "bundle_id"_a = nb::none(), "metadata"_a = nb::none(),
@@ -814,9 +1110,116 @@ NB_MODULE(sora_sdk_ext, m) {
                    "Optional[SoraDegradationPreference] = None, "
                    "user_agent: Optional[str] = None"
                    ") -> SoraConnection"))
+      .def("create_connection_config", &Sora::CreateConnectionConfig,
+           "signaling_urls"_a, "role"_a, "channel_id"_a,
+           "client_id"_a = nb::none(), "bundle_id"_a = nb::none(),
+           "metadata"_a = nb::none(),
+           "signaling_notify_metadata"_a = nb::none(),
+           "audio_source"_a = nb::none(), "video_source"_a = nb::none(),
+           "audio"_a = nb::none(), "video"_a = nb::none(),
+           "audio_codec_type"_a = nb::none(), "video_codec_type"_a = nb::none(),
+           "video_bit_rate"_a = nb::none(), "audio_bit_rate"_a = nb::none(),
+           "video_vp9_params"_a = nb::none(), "video_av1_params"_a = nb::none(),
+           "video_h264_params"_a = nb::none(),
+           "audio_opus_params"_a = nb::none(), "simulcast"_a = nb::none(),
+           "spotlight"_a = nb::none(), "spotlight_number"_a = nb::none(),
+           "simulcast_rid"_a = nb::none(),
+           "simulcast_request_rid"_a = nb::none(),
+           "spotlight_focus_rid"_a = nb::none(),
+           "spotlight_unfocus_rid"_a = nb::none(),
+           "forwarding_filter"_a = nb::none(),
+           "forwarding_filters"_a = nb::none(), "data_channels"_a = nb::none(),
+           "data_channel_signaling"_a = nb::none(),
+           "ignore_disconnect_websocket"_a = nb::none(),
+           "data_channel_signaling_timeout"_a = nb::none(),
+           "disconnect_wait_timeout"_a = nb::none(),
+           "websocket_close_timeout"_a = nb::none(),
+           "websocket_connection_timeout"_a = nb::none(),
+           "audio_streaming_language_code"_a = nb::none(),
+           "insecure"_a = nb::none(), "client_cert"_a = nb::none(),
+           "client_key"_a = nb::none(), "ca_cert"_a = nb::none(),
+           "proxy_url"_a = nb::none(), "proxy_username"_a = nb::none(),
+           "proxy_password"_a = nb::none(), "proxy_agent"_a = nb::none(),
+           "degradation_preference"_a = nb::none(), "user_agent"_a = nb::none(),
+           nb::sig("def create_connection_config("
+                   "self, "
+                   "signaling_urls: list[str], "
+                   "role: str, "
+                   "channel_id: str, "
+                   "client_id: Optional[str] = None, "
+                   "bundle_id: Optional[str] = None, "
+                   "metadata: Optional[dict] = None, "
+                   "signaling_notify_metadata: Optional[dict] = None, "
+                   "audio_source: Optional[SoraTrackInterface] = None, "
+                   "video_source: Optional[SoraTrackInterface] = None, "
+                   "audio: Optional[bool] = None, "
+                   "video: Optional[bool] = None, "
+                   "audio_codec_type: Optional[str] = None, "
+                   "video_codec_type: Optional[str] = None, "
+                   "video_bit_rate: Optional[int] = None, "
+                   "audio_bit_rate: Optional[int] = None, "
+                   "video_vp9_params: Optional[dict] = None, "
+                   "video_av1_params: Optional[dict] = None, "
+                   "video_h264_params: Optional[dict] = None, "
+                   "audio_opus_params: Optional[dict] = None, "
+                   "simulcast: Optional[bool] = None, "
+                   "spotlight: Optional[bool] = None, "
+                   "spotlight_number: Optional[int] = None, "
+                   "simulcast_rid: Optional[str] = None, "
+                   "simulcast_request_rid: Optional[str] = None, "
+                   "spotlight_focus_rid: Optional[str] = None, "
+                   "spotlight_unfocus_rid: Optional[str] = None, "
+                   "forwarding_filter: Optional[dict] = None, "
+                   "forwarding_filters: Optional[list[dict]] = None, "
+                   "data_channels: Optional[list[dict]] = None, "
+                   "data_channel_signaling: Optional[bool] = None, "
+                   "ignore_disconnect_websocket: Optional[bool] = None, "
+                   "data_channel_signaling_timeout: Optional[int] = None, "
+                   "disconnect_wait_timeout: Optional[int] = None, "
+                   "websocket_close_timeout: Optional[int] = None, "
+                   "websocket_connection_timeout: Optional[int] = None, "
+                   "audio_streaming_language_code: Optional[str] = None, "
+                   "insecure: Optional[bool] = None, "
+                   "client_cert: Optional[bytes] = None, "
+                   "client_key: Optional[bytes] = None, "
+                   "ca_cert: Optional[bytes] = None, "
+                   "proxy_url: Optional[str] = None, "
+                   "proxy_username: Optional[str] = None, "
+                   "proxy_password: Optional[str] = None, "
+                   "proxy_agent: Optional[str] = None, "
+                   "degradation_preference: "
+                   "Optional[SoraDegradationPreference] = None, "
+                   "user_agent: Optional[str] = None"
+                   ") -> SoraConnectionConfig"))
+      .def("create_connection_from_config", &Sora::CreateConnectionFromConfig,
+           "config"_a, "client_id"_a = nb::none(), "bundle_id"_a = nb::none(),
+           "metadata"_a = nb::none(),
+           "signaling_notify_metadata"_a = nb::none(),
+           "audio_source"_a = nb::none(), "video_source"_a = nb::none(),
+           "audio_frame_transformer"_a = nb::none(),
+           "video_frame_transformer"_a = nb::none(),
+           nb::sig("def create_connection_from_config("
+                   "self, "
+                   "config: SoraConnectionConfig, "
+                   "client_id: Optional[str] = None, "
+                   "bundle_id: Optional[str] = None, "
+                   "metadata: Optional[dict] = None, "
+                   "signaling_notify_metadata: Optional[dict] = None, "
+                   "audio_source: Optional[SoraTrackInterface] = None, "
+                   "video_source: Optional[SoraTrackInterface] = None, "
+                   "audio_frame_transformer: "
+                   "Optional[SoraAudioFrameTransformer] = None, "
+                   "video_frame_transformer: "
+                   "Optional[SoraVideoFrameTransformer] = None"
+                   ") -> SoraConnection"))
+      .def("disconnect_all", &Sora::DisconnectAll, "timeout"_a = nb::none())
+      .def("connect_many", &Sora::ConnectMany, "connections"_a,
+           "max_concurrent"_a = 8, "timeout"_a = 30.0f)
       .def("create_audio_source", &Sora::CreateAudioSource, "channels"_a,
            "sample_rate"_a)
       .def("create_video_source", &Sora::CreateVideoSource)
+      .def("create_mirror_source", &Sora::CreateMirrorSource, "origin"_a)
+      .def_prop_ro("connection_count", &Sora::GetConnectionCount)
       .def(
           "create_libcamera_source",
           [](Sora* self, int width, int height, int fps,
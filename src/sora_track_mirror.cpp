@@ -0,0 +1,138 @@
+#include "sora_track_mirror.h"
+
+void SoraMirrorAudioSourceInterface::OnData(
+    const void* audio_data,
+    int bits_per_sample,
+    int sample_rate,
+    size_t number_of_channels,
+    size_t number_of_frames,
+    std::optional<int64_t> absolute_capture_timestamp_ms) {
+  webrtc::MutexLock lock(&sink_lock_);
+  for (auto* sink : sinks_) {
+    sink->OnData(audio_data, bits_per_sample, sample_rate, number_of_channels,
+                 number_of_frames, absolute_capture_timestamp_ms);
+  }
+}
+
+webrtc::MediaSourceInterface::SourceState
+SoraMirrorAudioSourceInterface::state() const {
+  return kLive;
+}
+
+bool SoraMirrorAudioSourceInterface::remote() const {
+  return false;
+}
+
+void SoraMirrorAudioSourceInterface::SetVolume(double volume) {
+  for (auto* observer : audio_observers_) {
+    observer->OnSetVolume(volume);
+  }
+}
+
+void SoraMirrorAudioSourceInterface::RegisterAudioObserver(
+    AudioObserver* observer) {
+  audio_observers_.push_back(observer);
+}
+
+void SoraMirrorAudioSourceInterface::UnregisterAudioObserver(
+    AudioObserver* observer) {
+  audio_observers_.remove(observer);
+}
+
+void SoraMirrorAudioSourceInterface::AddSink(
+    webrtc::AudioTrackSinkInterface* sink) {
+  webrtc::MutexLock lock(&sink_lock_);
+  sinks_.push_back(sink);
+}
+
+void SoraMirrorAudioSourceInterface::RemoveSink(
+    webrtc::AudioTrackSinkInterface* sink) {
+  webrtc::MutexLock lock(&sink_lock_);
+  sinks_.remove(sink);
+}
+
+SoraTrackMirror::SoraTrackMirror(
+    DisposePublisher* publisher,
+    webrtc::scoped_refptr<webrtc::MediaStreamTrackInterface> track,
+    nb::ref<SoraTrackInterface> origin)
+    : SoraTrackInterface(publisher, track),
+      origin_(origin),
+      origin_subscriber_(this) {
+  publisher_->AddSubscriber(this);
+  origin_->AddSubscriber(&origin_subscriber_);
+}
+
+void SoraTrackMirror::Disposed() {
+  // 生成元の Sora が破棄された場合は転送元も含めて外す
+  Detach();
+  origin_ = nullptr;
+  SoraTrackInterface::Disposed();
+}
+
+void SoraTrackMirror::Detach() {
+  if (!attached_) {
+    return;
+  }
+  attached_ = false;
+  if (origin_->GetTrack()) {
+    RemoveSinkFromOrigin(origin_->GetTrack().get());
+  }
+  // 転送元の Disposed から呼ばれた場合に転送元が解放されないよう、 origin_ はここでは手放さない
+  origin_->RemoveSubscriber(&origin_subscriber_);
+}
+
+SoraAudioTrackMirror::SoraAudioTrackMirror(
+    DisposePublisher* publisher,
+    webrtc::scoped_refptr<SoraMirrorAudioSourceInterface> source,
+    webrtc::scoped_refptr<webrtc::MediaStreamTrackInterface> track,
+    nb::ref<SoraTrackInterface> origin)
+    : SoraTrackMirror(publisher, track, origin), source_(source) {
+  static_cast<webrtc::AudioTrackInterface*>(origin->GetTrack().get())
+      ->AddSink(this);
+}
+
+SoraAudioTrackMirror::~SoraAudioTrackMirror() {
+  // 基底クラスのデストラクタからは RemoveSinkFromOrigin を呼べないので、ここで外す
+  Detach();
+}
+
+void SoraAudioTrackMirror::OnData(
+    const void* audio_data,
+    int bits_per_sample,
+    int sample_rate,
+    size_t number_of_channels,
+    size_t number_of_frames,
+    std::optional<int64_t> absolute_capture_timestamp_ms) {
+  source_->OnData(audio_data, bits_per_sample, sample_rate, number_of_channels,
+                  number_of_frames, absolute_capture_timestamp_ms);
+}
+
+void SoraAudioTrackMirror::RemoveSinkFromOrigin(
+    webrtc::MediaStreamTrackInterface* origin_track) {
+  static_cast<webrtc::AudioTrackInterface*>(origin_track)->RemoveSink(this);
+}
+
+SoraVideoTrackMirror::SoraVideoTrackMirror(
+    DisposePublisher* publisher,
+    webrtc::scoped_refptr<sora::ScalableVideoTrackSource> source,
+    webrtc::scoped_refptr<webrtc::MediaStreamTrackInterface> track,
+    nb::ref<SoraTrackInterface> origin)
+    : SoraTrackMirror(publisher, track, origin), source_(source) {
+  static_cast<webrtc::VideoTrackInterface*>(origin->GetTrack().get())
+      ->AddOrUpdateSink(this, webrtc::VideoSinkWants());
+}
+
+SoraVideoTrackMirror::~SoraVideoTrackMirror() {
+  // 基底クラスのデストラクタからは RemoveSinkFromOrigin を呼べないので、ここで外す
+  Detach();
+}
+
+void SoraVideoTrackMirror::OnFrame(const webrtc::VideoFrame& frame) {
+  // フレームのバッファは参照カウントで共有されるのでコピーは発生しない
+  source_->OnCapturedFrame(frame);
+}
+
+void SoraVideoTrackMirror::RemoveSinkFromOrigin(
+    webrtc::MediaStreamTrackInterface* origin_track) {
+  static_cast<webrtc::VideoTrackInterface*>(origin_track)->RemoveSink(this);
+}
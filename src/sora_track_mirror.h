@@ -0,0 +1,164 @@
+#ifndef SORA_TRACK_MIRROR_H_
+#define SORA_TRACK_MIRROR_H_
+
+#include <list>
+#include <optional>
+
+// nonobind
+#include <nanobind/intrusive/ref.h>
+
+// WebRTC
+#include <api/media_stream_interface.h>
+#include <api/notifier.h>
+#include <api/scoped_refptr.h>
+#include <api/video/video_frame.h>
+#include <api/video/video_sink_interface.h>
+#include <rtc_base/synchronization/mutex.h>
+
+// Sora
+#include <sora/scalable_track_source.h>
+
+#include "sora_track_interface.h"
+
+namespace nb = nanobind;
+
+/**
+ * 受け取った 10 ms ごとの音声データをそのまま Sink に渡す webrtc::AudioSourceInterface です。
+ *
+ * SoraAudioTrackMirror の実体で、 SoraAudioSourceInterface と異なりデータを溜めずに渡します。
+ */
+class SoraMirrorAudioSourceInterface
+    : public webrtc::Notifier<webrtc::AudioSourceInterface> {
+ public:
+  void OnData(const void* audio_data,
+              int bits_per_sample,
+              int sample_rate,
+              size_t number_of_channels,
+              size_t number_of_frames,
+              std::optional<int64_t> absolute_capture_timestamp_ms);
+
+  // MediaSourceInterface implementation.
+  webrtc::MediaSourceInterface::SourceState state() const override;
+  bool remote() const override;
+
+  // AudioSourceInterface implementation.
+  void SetVolume(double volume) override;
+  void RegisterAudioObserver(AudioObserver* observer) override;
+  void UnregisterAudioObserver(AudioObserver* observer) override;
+  void AddSink(webrtc::AudioTrackSinkInterface* sink) override;
+  void RemoveSink(webrtc::AudioTrackSinkInterface* sink) override;
+
+ private:
+  std::list<AudioObserver*> audio_observers_;
+  webrtc::Mutex sink_lock_;
+  std::list<webrtc::AudioTrackSinkInterface*> sinks_;
+};
+
+/**
+ * 別の Sora インスタンスで生成されたトラックの内容を、この Sora インスタンスのトラックに転送する SoraTrackMirror です。
+ *
+ * Sora インスタンスをまたいでトラックを共有することはできないため、
+ * 転送元のトラックに Sink として取り付いて、受け取った内容をこの Sora インスタンスで生成したトラックに渡します。
+ * 転送元が破棄された場合は転送を止めますが、このトラック自体は生成元の Sora が破棄されるまで使えます。
+ */
+class SoraTrackMirror : public SoraTrackInterface {
+ public:
+  /**
+   * @param publisher このトラックを生成した Sora
+   * @param track このトラックの webrtc::MediaStreamTrackInterface
+   * @param origin 転送元のトラック
+   */
+  SoraTrackMirror(
+      DisposePublisher* publisher,
+      webrtc::scoped_refptr<webrtc::MediaStreamTrackInterface> track,
+      nb::ref<SoraTrackInterface> origin);
+
+  void Disposed() override;
+
+ protected:
+  /**
+   * 転送元のトラックから Sink を外して転送を止めます。
+   *
+   * 継承先のデストラクタで呼び出してください。
+   */
+  void Detach();
+  virtual void RemoveSinkFromOrigin(
+      webrtc::MediaStreamTrackInterface* origin_track) = 0;
+
+ private:
+  /**
+   * 転送元のトラックの破棄を受け取る DisposeSubscriber です。
+   *
+   * 生成元の Sora の破棄と区別するために SoraTrackMirror とは別に Subscribe します。
+   */
+  class OriginSubscriber : public DisposeSubscriber {
+   public:
+    explicit OriginSubscriber(SoraTrackMirror* mirror) : mirror_(mirror) {}
+    void PublisherDisposed() override { mirror_->Detach(); }
+
+   private:
+    SoraTrackMirror* mirror_;
+  };
+
+  nb::ref<SoraTrackInterface> origin_;
+  OriginSubscriber origin_subscriber_;
+  bool attached_ = true;
+};
+
+/**
+ * 別の Sora インスタンスで生成された音声トラックのデータを転送する SoraAudioTrackMirror です。
+ *
+ * データはデコードやエンコードをせずにそのまま渡します。
+ */
+class SoraAudioTrackMirror : public SoraTrackMirror,
+                             public webrtc::AudioTrackSinkInterface {
+ public:
+  SoraAudioTrackMirror(
+      DisposePublisher* publisher,
+      webrtc::scoped_refptr<SoraMirrorAudioSourceInterface> source,
+      webrtc::scoped_refptr<webrtc::MediaStreamTrackInterface> track,
+      nb::ref<SoraTrackInterface> origin);
+  ~SoraAudioTrackMirror() override;
+
+  void OnData(const void* audio_data,
+              int bits_per_sample,
+              int sample_rate,
+              size_t number_of_channels,
+              size_t number_of_frames,
+              std::optional<int64_t> absolute_capture_timestamp_ms) override;
+
+ protected:
+  void RemoveSinkFromOrigin(
+      webrtc::MediaStreamTrackInterface* origin_track) override;
+
+ private:
+  webrtc::scoped_refptr<SoraMirrorAudioSourceInterface> source_;
+};
+
+/**
+ * 別の Sora インスタンスで生成された映像トラックのフレームを転送する SoraVideoTrackMirror です。
+ *
+ * フレームのバッファはコピーせずに共有します。
+ */
+class SoraVideoTrackMirror
+    : public SoraTrackMirror,
+      public webrtc::VideoSinkInterface<webrtc::VideoFrame> {
+ public:
+  SoraVideoTrackMirror(
+      DisposePublisher* publisher,
+      webrtc::scoped_refptr<sora::ScalableVideoTrackSource> source,
+      webrtc::scoped_refptr<webrtc::MediaStreamTrackInterface> track,
+      nb::ref<SoraTrackInterface> origin);
+  ~SoraVideoTrackMirror() override;
+
+  void OnFrame(const webrtc::VideoFrame& frame) override;
+
+ protected:
+  void RemoveSinkFromOrigin(
+      webrtc::MediaStreamTrackInterface* origin_track) override;
+
+ private:
+  webrtc::scoped_refptr<sora::ScalableVideoTrackSource> source_;
+};
+
+#endif
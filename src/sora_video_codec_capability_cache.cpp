@@ -0,0 +1,182 @@
+#include "sora_video_codec_capability_cache.h"
+
+#include <filesystem>
+#include <fstream>
+#include <iterator>
+#include <map>
+#include <mutex>
+#include <set>
+#include <utility>
+
+// Boost
+#include <boost/json.hpp>
+#include <boost/preprocessor/stringize.hpp>
+
+// WebRTC
+#include <rtc_base/logging.h>
+
+namespace {
+
+std::string ReadFile(const std::string& path) {
+  std::ifstream ifs(path, std::ios::binary);
+  if (!ifs) {
+    return "";
+  }
+  return std::string(std::istreambuf_iterator<char>(ifs),
+                     std::istreambuf_iterator<char>());
+}
+
+/**
+ * ファイルのキャッシュを使ってよいかを判断するためのキーを生成します。
+ *
+ * ドライバのバージョンを正確に取得するにはドライバを読み込む必要があり、それ自体が遅いため、
+ * Linux で読み込まずに取得できるものだけをキーに含めます。
+ */
+std::string CreateCacheKey(const std::optional<std::string>& openh264) {
+  boost::json::object key;
+  key["sdk_version"] = BOOST_PP_STRINGIZE(SORA_PYTHON_SDK_VERSION);
+  if (openh264) {
+    key["openh264_path"] = *openh264;
+    // 片方だけ取得に失敗した場合に、失敗した方の値をキーに含めないようにそれぞれ確認する
+    std::error_code size_ec;
+    auto size = std::filesystem::file_size(*openh264, size_ec);
+    if (!size_ec) {
+      key["openh264_size"] = size;
+    }
+    std::error_code mtime_ec;
+    auto mtime = std::filesystem::last_write_time(*openh264, mtime_ec);
+    if (!mtime_ec) {
+      key["openh264_mtime"] = mtime.time_since_epoch().count();
+    }
+  }
+#if defined(__linux__)
+  key["nvidia_driver_version"] = ReadFile("/proc/driver/nvidia/version");
+  key["amdgpu_version"] = ReadFile("/sys/module/amdgpu/version");
+#endif
+  return boost::json::serialize(key);
+}
+
+std::optional<sora::VideoCodecCapability> LoadCacheFile(
+    const std::string& path,
+    const std::string& key) {
+  auto content = ReadFile(path);
+  if (content.empty()) {
+    return std::nullopt;
+  }
+  boost::system::error_code ec;
+  auto value = boost::json::parse(content, ec);
+  if (ec || !value.is_object()) {
+    return std::nullopt;
+  }
+  auto* cached_key = value.as_object().if_contains("key");
+  auto* capability = value.as_object().if_contains("capability");
+  if (cached_key == nullptr || !cached_key->is_string() ||
+      cached_key->as_string() != key || capability == nullptr) {
+    return std::nullopt;
+  }
+  try {
+    return boost::json::value_to<sora::VideoCodecCapability>(*capability);
+  } catch (const std::exception& e) {
+    RTC_LOG(LS_WARNING) << "Failed to load video codec capability cache: "
+                        << e.what();
+    return std::nullopt;
+  }
+}
+
+void SaveCacheFile(const std::string& path,
+                   const std::string& key,
+                   const sora::VideoCodecCapability& capability) {
+  boost::json::object value;
+  value["key"] = key;
+  value["capability"] = boost::json::value_from(capability);
+  // 同時に書き込まれても壊れたファイルを読まないよう、一時ファイルに書いてから置き換える
+  std::string tmp = path + ".tmp";
+  {
+    std::ofstream ofs(tmp, std::ios::binary | std::ios::trunc);
+    if (!ofs) {
+      RTC_LOG(LS_WARNING) << "Failed to write video codec capability cache: "
+                          << path;
+      return;
+    }
+    ofs << boost::json::serialize(value);
+  }
+  std::error_code ec;
+  std::filesystem::rename(tmp, path, ec);
+  if (ec) {
+    RTC_LOG(LS_WARNING) << "Failed to write video codec capability cache: "
+                        << path << " error=" << ec.message();
+  }
+}
+
+}  // namespace
+
+std::shared_ptr<sora::CudaContext> GetSharedCudaContext() {
+  // 静的変数の破棄はドライバのライブラリが先に解放された後に走ることがあり、
+  // その時にコンテキストを破棄するとプロセスの終了時に落ちるので、意図的に解放しない
+  static std::once_flag flag;
+  static auto* context = new std::shared_ptr<sora::CudaContext>();
+  std::call_once(flag, []() {
+    if (sora::CudaContext::CanCreate()) {
+      *context = sora::CudaContext::Create();
+    }
+  });
+  return *context;
+}
+
+std::shared_ptr<sora::AMFContext> GetSharedAMFContext() {
+  // 静的変数の破棄はドライバのライブラリが先に解放された後に走ることがあり、
+  // その時にコンテキストを破棄するとプロセスの終了時に落ちるので、意図的に解放しない
+  static std::once_flag flag;
+  static auto* context = new std::shared_ptr<sora::AMFContext>();
+  std::call_once(flag, []() {
+    if (sora::AMFContext::CanCreate()) {
+      *context = sora::AMFContext::Create();
+    }
+  });
+  return *context;
+}
+
+sora::VideoCodecCapability GetCachedVideoCodecCapability(
+    std::optional<std::string> openh264,
+    std::optional<std::string> cache_file) {
+  static std::mutex mutex;
+  static std::map<std::optional<std::string>, sora::VideoCodecCapability>
+      capabilities;
+
+  // このプロセスで書き込んだ (cache_file, openh264) の組
+  static std::set<std::pair<std::string, std::optional<std::string>>>
+      saved_files;
+
+  std::lock_guard<std::mutex> lock(mutex);
+  auto it = capabilities.find(openh264);
+  if (it != capabilities.end()) {
+    // 別の cache_file で呼ばれた場合でもファイルに保存しておく
+    if (cache_file && saved_files.emplace(*cache_file, openh264).second) {
+      SaveCacheFile(*cache_file, CreateCacheKey(openh264), it->second);
+    }
+    return it->second;
+  }
+
+  std::string key;
+  if (cache_file) {
+    key = CreateCacheKey(openh264);
+    auto capability = LoadCacheFile(*cache_file, key);
+    if (capability) {
+      saved_files.emplace(*cache_file, openh264);
+      capabilities.emplace(openh264, *capability);
+      return *capability;
+    }
+  }
+
+  sora::VideoCodecCapabilityConfig config;
+  config.openh264_path = openh264;
+  config.cuda_context = GetSharedCudaContext();
+  config.amf_context = GetSharedAMFContext();
+  auto capability = sora::GetVideoCodecCapability(config);
+  if (cache_file) {
+    saved_files.emplace(*cache_file, openh264);
+    SaveCacheFile(*cache_file, key, capability);
+  }
+  capabilities.emplace(openh264, capability);
+  return capability;
+}
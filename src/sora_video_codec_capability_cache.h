@@ -0,0 +1,43 @@
+#ifndef SORA_VIDEO_CODEC_CAPABILITY_CACHE_H_
+#define SORA_VIDEO_CODEC_CAPABILITY_CACHE_H_
+
+#include <memory>
+#include <optional>
+#include <string>
+
+// Sora
+#include <sora/sora_client_context.h>
+#include <sora/sora_video_codec.h>
+
+/**
+ * プロセス内で共有する sora::CudaContext を返します。
+ *
+ * 初めて呼ばれた時に生成し、以降は同じものを返します。 CUDA が使えない環境では nullptr を返します。
+ * プロセスの終了時に破棄すると落ちることがあるため、生成したコンテキストは解放しません。
+ */
+std::shared_ptr<sora::CudaContext> GetSharedCudaContext();
+
+/**
+ * プロセス内で共有する sora::AMFContext を返します。
+ *
+ * 初めて呼ばれた時に生成し、以降は同じものを返します。 AMF が使えない環境では nullptr を返します。
+ * プロセスの終了時に破棄すると落ちることがあるため、生成したコンテキストは解放しません。
+ */
+std::shared_ptr<sora::AMFContext> GetSharedAMFContext();
+
+/**
+ * sora::GetVideoCodecCapability の結果をキャッシュして返します。
+ *
+ * 結果はプロセス内で openh264 ごとにキャッシュします。
+ * cache_file を指定した場合はファイルにも保存し、別のプロセスでも使い回します。
+ * ファイルのキャッシュは Sora Python SDK のバージョン、 OpenH264 ライブラリの更新日時とサイズ、
+ * 取得できる場合は GPU のドライバのバージョンが一致する場合のみ使います。
+ *
+ * @param openh264 (オプション) OpenH264 ライブラリへのパス
+ * @param cache_file (オプション) 結果を保存するファイルへのパス
+ */
+sora::VideoCodecCapability GetCachedVideoCodecCapability(
+    std::optional<std::string> openh264,
+    std::optional<std::string> cache_file);
+
+#endif
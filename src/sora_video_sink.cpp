@@ -80,7 +80,16 @@ void SoraVideoSinkImpl::Disposed() {
 }
 
 void SoraVideoSinkImpl::PublisherDisposed() {
-  Disposed();
+  // Track の受信が終わったら Python で破棄されるのを待たずに Track から外れて、
+  // Track を解放できるようにしてから OnFrameQueue スレッドを止める
+  Del();
+  if (PyGILState_Check()) {
+    // デストラクタと同じ理由で GIL を解放する
+    gil_scoped_release release;
+    on_frame_queue_.reset();
+  } else {
+    on_frame_queue_.reset();
+  }
 }
 
 void SoraVideoSinkImpl::OnFrame(const webrtc::VideoFrame& frame) {
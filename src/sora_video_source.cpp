@@ -60,6 +60,19 @@ void SoraVideoSource::OnCaptured(
   queue_cond_.notify_all();
 }
 
+void SoraVideoSource::OnCapturedBlank(int width,
+                                      int height,
+                                      int64_t timestamp_us) {
+  if (finished_) {
+    return;
+  }
+  // BGR の全て 0 は黒になる
+  std::unique_ptr<uint8_t> data(new uint8_t[width * height * 3]());
+  queue_.push(
+      std::make_unique<Frame>(std::move(data), width, height, timestamp_us));
+  queue_cond_.notify_all();
+}
+
 bool SoraVideoSource::SendFrameProcess() {
   std::unique_ptr<Frame> frame;
   {
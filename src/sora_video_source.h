@@ -79,6 +79,17 @@ class SoraVideoSource : public SoraTrackInterface {
       nb::ndarray<uint8_t, nb::shape<-1, -1, 3>, nb::c_contig, nb::device::cpu>
           ndarray,
       int64_t timestamp_us);
+  /**
+   * 黒一色のフレームを渡します。
+   * 
+   * SoraEncodedFrameInjector がエンコーダーに 1 フレーム出力させるために Python SDK 内で使う関数です。
+   * GIL を保持した状態で呼び出してください。
+   * 
+   * @param width フレームの幅
+   * @param height フレームの高さ
+   * @param timestamp_us マイクロ秒単位の整数で表されるフレームのタイムスタンプ
+   */
+  void OnCapturedBlank(int width, int height, int64_t timestamp_us);
 
  private:
   struct Frame {
@@ -2,6 +2,7 @@ import json
 import queue
 import threading
 import time
+from collections.abc import Buffer
 from enum import Enum
 from threading import Event
 from typing import Any, Callable, Optional
@@ -194,6 +195,7 @@ class SoraClient:
         self._disconnected: Event = Event()
 
         self._notify_queue: queue.Queue = queue.Queue()
+        self._remove_track_queue: queue.Queue = queue.Queue()
 
         self._disconnect_error_code: Optional[int] = None
         self._disconnect_error_message: Optional[str] = None
@@ -218,6 +220,7 @@ class SoraClient:
         self._connection.on_ws_close = self._on_ws_close
         self._connection.on_notify = self._on_notify
         self._connection.on_track = self._on_track
+        self._connection.on_remove_track = self._on_remove_track
         self._connection.on_data_channel = self._on_data_channel
         self._connection.on_message = self._on_message
         self._connection.on_disconnect = self._on_disconnect
@@ -260,13 +263,21 @@ class SoraClient:
         self._connection.disconnect()
         print("disconnect: disconnected")
 
-    def send_message(self, label: str, data: bytes, timeout: float = 5):
+    def send_message(self, label: str, data: Buffer, timeout: float = 5) -> bool:
         # TODO: direction が sendrecv / sendonly の時しか送れず、例外をあげるようにする
         print(f"send: label={label}, data={data!r}")
 
         # on_data_channel() が呼ばれるまではデータチャネルの準備ができていないので待機
         self._data_channel_ready_events[label].wait(timeout=timeout)
-        self._connection.send_data_channel(label, data)
+        return self._connection.send_data_channel(label, data)
+
+    def send_message_many(
+        self, label: str, data_list: list[Buffer], timeout: float = 5
+    ) -> list[bool]:
+        print(f"send many: label={label}, count={len(data_list)}")
+
+        self._data_channel_ready_events[label].wait(timeout=timeout)
+        return self._connection.send_data_channel_many(label, data_list)
 
     def recv_message(self, label: str, timeout: float = 5) -> bytes:
         return self._messaging_recv_queues[label].get(block=True, timeout=timeout)
@@ -275,6 +286,15 @@ class SoraClient:
         raw_stats = self._connection.get_stats()
         return json.loads(raw_stats)
 
+    def replace_video_source(self, width: int, height: int) -> None:
+        # 入れ替える前にソースに渡したフレームは破棄されるため、入れ替えてからフレームを渡す
+        video_source = self._sora.create_video_source()
+        self._connection.set_video_track(video_source)
+        # 以降は fake_video_loop から入れ替えたソースにフレームを渡す
+        self._video_width = width
+        self._video_height = height
+        self._video_source = video_source
+
     @property
     def role(self) -> str:
         return self._role
@@ -504,6 +524,13 @@ class SoraClient:
             self._video_sink = SoraVideoSink(track)
             self._video_sink.on_frame = self._on_video_frame
 
+    def _on_remove_track(self, track: SoraMediaTrack) -> None:
+        # 呼び出された後に track は破棄されるので、ここで必要な情報を取り出しておく
+        self._remove_track_queue.put(track.kind)
+
+    def wait_remove_track(self, timeout: Optional[int] = 5) -> str:
+        return self._remove_track_queue.get(block=True, timeout=timeout)
+
     def wait_notify(self, pred: Callable[[dict], bool], timeout: Optional[int] = 5):
         while True:
             notify = self._notify_queue.get(block=True, timeout=timeout)
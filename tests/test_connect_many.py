@@ -0,0 +1,89 @@
+import pytest
+from client import SoraClient, SoraRole
+
+from sora_sdk import Sora
+
+
+def test_connect_many(settings):
+    sendonly = SoraClient(
+        settings,
+        SoraRole.SENDONLY,
+        audio=False,
+        video=True,
+    )
+    sendonly.connect(fake_video=True)
+
+    sora = Sora()
+
+    access_token = settings.access_token()
+    # secret が設定されていない場合は access_token が存在しない
+    metadata = {"access_token": access_token} if access_token is not None else None
+
+    config = sora.create_connection_config(
+        signaling_urls=settings.signaling_urls,
+        role="recvonly",
+        channel_id=settings.channel_id,
+        metadata=metadata,
+        audio=False,
+        video=True,
+    )
+    connections = [sora.create_connection_from_config(config) for _ in range(4)]
+
+    result = sora.connect_many(connections, max_concurrent=2, timeout=30)
+
+    # 既に connect を呼んだ Connection は受け付けない
+    with pytest.raises(ValueError):
+        sora.connect_many(connections)
+
+    for conn in connections:
+        conn.disconnect()
+    sendonly.disconnect()
+
+    assert result["timed_out"] is False
+    assert result["not_started"] == []
+
+    assert len(result["timings"]) == len(connections)
+    for timings in result["timings"]:
+        # 各段階には順番に到達する
+        assert timings["ws_open"] is not None
+        assert timings["offer"] is not None
+        assert timings["connected"] is not None
+        assert timings["first_track"] is not None
+        assert timings["ws_open"] <= timings["offer"] <= timings["connected"]
+
+    for name in ("ws_open", "offer", "connected", "first_track"):
+        percentiles = result["percentiles"][name]
+        assert 0 < percentiles["p50"] <= percentiles["p90"] <= percentiles["p99"]
+
+
+def test_connect_many_timeout(settings):
+    sora = Sora()
+
+    access_token = settings.access_token()
+    # secret が設定されていない場合は access_token が存在しない
+    metadata = {"access_token": access_token} if access_token is not None else None
+
+    config = sora.create_connection_config(
+        signaling_urls=settings.signaling_urls,
+        role="recvonly",
+        channel_id=settings.channel_id,
+        metadata=metadata,
+        audio=False,
+        video=True,
+    )
+    connections = [sora.create_connection_from_config(config) for _ in range(3)]
+
+    # 1 つ目の接続処理が終わる前にタイムアウトさせる
+    result = sora.connect_many(connections, max_concurrent=1, timeout=0.001)
+
+    connections[0].disconnect()
+
+    assert result["timed_out"] is True
+    # connect を呼ばなかった Connection が分かる
+    assert result["not_started"] == connections[1:]
+
+
+def test_connect_many_invalid():
+    sora = Sora()
+    with pytest.raises(ValueError):
+        sora.connect_many([], max_concurrent=0)
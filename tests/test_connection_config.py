@@ -0,0 +1,79 @@
+import json
+import threading
+
+import pytest
+
+from sora_sdk import Sora
+
+
+def test_create_connection_from_config(settings):
+    sora = Sora()
+
+    access_token = settings.access_token()
+    # secret が設定されていない場合は access_token が存在しない
+    metadata = {"access_token": access_token} if access_token is not None else None
+
+    # 変換と検証は 1 度だけ行い、複数の Connection で使い回す
+    config = sora.create_connection_config(
+        signaling_urls=settings.signaling_urls,
+        role="recvonly",
+        channel_id=settings.channel_id,
+        metadata=metadata,
+        audio=True,
+        video=True,
+    )
+    assert config.role == "recvonly"
+    assert config.channel_id == settings.channel_id
+
+    client_ids = ["config-client-1", "config-client-2"]
+    offers = [None, None]
+    offered = [threading.Event(), threading.Event()]
+    connections = []
+    for i, client_id in enumerate(client_ids):
+
+        def on_set_offer(raw_offer: str, i=i):
+            offers[i] = json.loads(raw_offer)
+            offered[i].set()
+
+        conn = sora.create_connection_from_config(config, client_id=client_id)
+        conn.on_set_offer = on_set_offer
+        conn.connect()
+        connections.append(conn)
+
+    for event in offered:
+        assert event.wait(10)
+
+    for conn in connections:
+        conn.disconnect()
+
+    # Connection ごとに上書きした client_id が使われる
+    for offer, client_id in zip(offers, client_ids):
+        assert offer["client_id"] == client_id
+
+
+def test_create_connection_config_invalid_metadata(settings):
+    sora = Sora()
+
+    # 変換できない値は生成時にエラーになる
+    with pytest.raises(TypeError):
+        sora.create_connection_config(
+            signaling_urls=settings.signaling_urls,
+            role="recvonly",
+            channel_id=settings.channel_id,
+            metadata={"invalid": object()},
+        )
+
+
+def test_create_connection_from_config_other_sora(settings):
+    sora = Sora()
+    other_sora = Sora()
+
+    config = sora.create_connection_config(
+        signaling_urls=settings.signaling_urls,
+        role="recvonly",
+        channel_id=settings.channel_id,
+    )
+
+    # 生成元と異なる Sora では使えない
+    with pytest.raises(ValueError):
+        other_sora.create_connection_from_config(config)
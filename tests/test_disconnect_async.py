@@ -0,0 +1,57 @@
+import threading
+
+from sora_sdk import Sora
+
+
+def create_recvonly(sora: Sora, settings):
+    access_token = settings.access_token()
+    # secret が設定されていない場合は access_token が存在しない
+    metadata = {"access_token": access_token} if access_token is not None else None
+    conn = sora.create_connection(
+        signaling_urls=settings.signaling_urls,
+        role="recvonly",
+        channel_id=settings.channel_id,
+        metadata=metadata,
+        audio=True,
+        video=True,
+    )
+    offered = threading.Event()
+    disconnected = threading.Event()
+    conn.on_set_offer = lambda raw_offer: offered.set()
+    conn.on_disconnect = lambda error_code, message: disconnected.set()
+    return conn, offered, disconnected
+
+
+def test_disconnect_async(settings):
+    sora = Sora()
+
+    conn, offered, disconnected = create_recvonly(sora, settings)
+    conn.connect()
+    assert offered.wait(10)
+
+    future = conn.disconnect_async()
+    # 同じ切断に対しては同じ Future を返す
+    assert conn.disconnect_async() is future
+
+    assert future.result(timeout=10) is None
+    assert disconnected.is_set()
+
+    # 切断済みの場合は完了した Future を返す
+    assert conn.disconnect_async().done()
+    # 同期の disconnect を呼んでも待たされない
+    conn.disconnect()
+
+
+def test_disconnect_all(settings):
+    sora = Sora()
+
+    connections = [create_recvonly(sora, settings) for _ in range(3)]
+    for conn, offered, _ in connections:
+        conn.connect()
+        assert offered.wait(10)
+
+    assert sora.disconnect_all(timeout=10) is True
+
+    for _, _, disconnected in connections:
+        assert disconnected.is_set()
+    assert sora.connection_count == 0
@@ -0,0 +1,47 @@
+import threading
+
+import pytest
+
+from sora_sdk import Sora
+
+
+def create_recvonly(sora: Sora, settings):
+    access_token = settings.access_token()
+    # secret が設定されていない場合は access_token が存在しない
+    metadata = {"access_token": access_token} if access_token is not None else None
+    return sora.create_connection(
+        signaling_urls=settings.signaling_urls,
+        role="recvonly",
+        channel_id=settings.channel_id,
+        metadata=metadata,
+        audio=True,
+        video=True,
+    )
+
+
+def test_dtls_certificates_and_prewarm_network(settings):
+    # 証明書の数より多い Connection を生成して、証明書を使い回しても接続できることを確認する
+    sora = Sora(dtls_certificates=2, prewarm_network=True)
+
+    connections = []
+    connected = []
+    for _ in range(3):
+        conn = create_recvonly(sora, settings)
+        event = threading.Event()
+        conn.on_notify = lambda raw_message, event=event: (
+            event.set() if '"connection.created"' in raw_message else None
+        )
+        conn.connect()
+        connections.append(conn)
+        connected.append(event)
+
+    for event in connected:
+        assert event.wait(10)
+
+    for conn in connections:
+        conn.disconnect()
+
+
+def test_dtls_certificates_invalid():
+    with pytest.raises(ValueError):
+        Sora(dtls_certificates=-1)
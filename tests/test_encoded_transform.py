@@ -1,18 +1,25 @@
 import json
 import threading
 import time
+from pathlib import Path
 from threading import Event
 from typing import Any, Optional
 
 import numpy
+import pytest
+from client import SoraClient, SoraRole
 from conftest import Settings
 
 from sora_sdk import (
     Sora,
     SoraAudioFrameTransformer,
     SoraAudioSource,
+    SoraEncodedFrameInjector,
+    SoraEncodedFrameRecorder,
+    SoraFrameTransformOverflowPolicy,
     SoraMediaTrack,
     SoraTransformableAudioFrame,
+    SoraTransformableFrame,
     SoraTransformableVideoFrame,
     SoraVideoFrameTransformer,
     SoraVideoSource,
@@ -25,12 +32,24 @@ class SendonlyEncodedTransform:
         settings: Settings,
         metadata: dict[str, Any] | None = None,
         jwt_private_claims: dict[str, Any] | None = None,
+        aes_gcm_key: bytes | None = None,
+        append_in_place: bool = False,
+        worker: bool = False,
+        batch: bool = False,
+        raise_in_batch: bool = False,
+        video_codec_type: str | None = None,
+        inject: bool = False,
+        relay_to: SoraEncodedFrameInjector | None = None,
     ):
         self._signaling_urls: list[str] = settings.signaling_urls
         self._channel_id: str = settings.channel_id
 
         self._connection_id: str
 
+        self._append_in_place = append_in_place
+        self._raise_in_batch = raise_in_batch
+        self._relay_to = relay_to
+
         if jwt_private_claims is not None:
             access_token = settings.access_token(**jwt_private_claims)
         else:
@@ -76,8 +95,32 @@ class SendonlyEncodedTransform:
 
         # Video 向けの Encoded Transformer
         self._video_transformer = SoraVideoFrameTransformer()
-        # Video のエンコードフレームを受け取るコールバック関数を on_transform に設定
-        self._video_transformer.on_transform = self._on_video_transform
+        self._injector: Optional[SoraEncodedFrameInjector] = None
+        if inject:
+            # エンコード済みのフレームを push して再エンコードせずに送信する
+            self._injector = SoraEncodedFrameInjector(self._video_source)
+            self._video_transformer.add_injection_stage(self._injector)
+        else:
+            # Video のエンコードフレームを受け取るコールバック関数を on_transform に設定
+            self._video_transformer.on_transform = self._on_video_transform
+
+        # on_transform をエンコーダーのスレッドではなくワーカースレッドから呼び出す
+        if worker:
+            self._audio_transformer.start_worker(max_in_flight=8)
+            self._video_transformer.start_worker(
+                max_in_flight=8, overflow_policy=SoraFrameTransformOverflowPolicy.DROP
+            )
+
+        # Video のエンコードフレームをワーカースレッドでまとめて受け取る
+        if batch:
+            self._video_transformer.start_worker(max_in_flight=32)
+            self._video_transformer.set_transform_batch(4, interval_ms=20)
+            self._video_transformer.on_transform_many = self._on_video_transform_many
+
+        # on_transform の後に Python を呼び出さずに暗号化する
+        if aes_gcm_key is not None:
+            self._audio_transformer.add_aes_gcm_stage(aes_gcm_key, unencrypted_bytes=1)
+            self._video_transformer.add_aes_gcm_stage(aes_gcm_key, unencrypted_bytes=10)
 
         self._connection = self._sora.create_connection(
             signaling_urls=self._signaling_urls,
@@ -86,6 +129,7 @@ class SendonlyEncodedTransform:
             metadata=metadata,
             audio=True,
             video=True,
+            video_codec_type=video_codec_type,
             audio_source=self._audio_source,
             video_source=self._video_source,
             audio_frame_transformer=self._audio_transformer,
@@ -98,6 +142,7 @@ class SendonlyEncodedTransform:
 
         self._is_called_on_audio_transform = False
         self._is_called_on_video_transform = False
+        self._is_enqueued_frame_rejected = False
 
     def connect(self):
         self._connection.connect()
@@ -116,6 +161,21 @@ class SendonlyEncodedTransform:
     def disconnect(self):
         self._connection.disconnect()
 
+    def attach_transformers(self):
+        # 接続中に Encoded Transform を設定する
+        self._connection.set_audio_sender_frame_transformer(self._audio_transformer)
+        self._connection.set_video_sender_frame_transformer(self._video_transformer)
+
+    def detach_transformers(self):
+        # 接続中に Encoded Transform を外す、以降のフレームは on_transform を経由せずに送信される
+        # 外すのはこの接続だけで、同じ Transformer を使う他の接続は影響を受けない
+        self._connection.set_audio_sender_frame_transformer(None)
+        self._connection.set_video_sender_frame_transformer(None)
+
+    def reset_transform_called(self):
+        self._is_called_on_audio_transform = False
+        self._is_called_on_video_transform = False
+
     def get_stats(self):
         raw_stats = self._connection.get_stats()
         stats = json.loads(raw_stats)
@@ -129,6 +189,14 @@ class SendonlyEncodedTransform:
     def is_called_on_video_transform(self):
         return self._is_called_on_video_transform
 
+    @property
+    def is_enqueued_frame_rejected(self):
+        return self._is_enqueued_frame_rejected
+
+    @property
+    def injector(self):
+        return self._injector
+
     def _fake_audio_loop(self):
         while not self._disconnected.is_set():
             time.sleep(0.02)
@@ -138,7 +206,8 @@ class SendonlyEncodedTransform:
     def _fake_video_loop(self):
         while not self._disconnected.is_set():
             time.sleep(1.0 / 30)
-            if self._video_source is not None:
+            # push されたフレームを送信する場合は SoraEncodedFrameInjector がフレームを渡す
+            if self._video_source is not None and self._injector is None:
                 self._video_source.on_captured(
                     numpy.zeros((self._video_height, self._video_width, 3), dtype=numpy.uint8)
                 )
@@ -188,7 +257,44 @@ class SendonlyEncodedTransform:
         frame.set_data(new_data)
         self._audio_transformer.enqueue(frame)
 
+    def _on_video_transform_many(self, frames: list[SoraTransformableFrame]):
+        for frame in frames:
+            frame.append_data(b"sora")
+        self._is_called_on_video_transform = True
+        if self._raise_in_batch:
+            # 半分だけ戻して例外を投げる、残りのフレームはそのままストリームに戻される
+            self._video_transformer.enqueue_many(frames[: len(frames) // 2])
+            raise RuntimeError("on_transform_many failed")
+        # まとめてストリームに戻す
+        self._video_transformer.enqueue_many(frames)
+        # enqueue_many に渡したフレームは参照できない
+        try:
+            frames[0].get_data()
+        except RuntimeError:
+            self._is_enqueued_frame_rejected = True
+
     def _on_video_transform(self, frame: SoraTransformableVideoFrame):
+        if self._relay_to is not None:
+            # エンコードしたフレームを加工せずに別の接続からも送信する
+            self._relay_to.push(frame.get_data(), frame.is_key_frame)
+            self._is_called_on_video_transform = True
+            self._video_transformer.enqueue(frame)
+            return
+
+        if self._append_in_place:
+            # 末尾に追加する分を確保しておくと append_data で再確保が起きない
+            data = frame.get_mutable_data(reserve=4)
+            frame.append_data(b"sora")
+            # set_data_from でバッファが切り替わっても、先に取得した配列は元のバッファを所有しているので参照できる
+            stale = frame.get_mutable_data(reserve=0)
+            frame.set_data_from(stale)
+            self._is_called_on_video_transform = True
+            self._video_transformer.enqueue(frame)
+            # enqueue の後も配列は有効で、書き換えてもフレームには影響しない
+            data[:] = 0
+            stale[:] = 0
+            return
+
         # この実装が Encoded Transform を利用する上での基本形となる
 
         # frame からエンコードされたフレームデータを取得する
@@ -213,6 +319,8 @@ class RecvonlyEncodedTransform:
         settings: Settings,
         metadata: dict[str, Any] | None = None,
         jwt_private_claims: dict[str, Any] | None = None,
+        aes_gcm_key: bytes | None = None,
+        record_dir: Path | None = None,
     ):
         self._signaling_urls: list[str] = settings.signaling_urls
         self._channel_id: str = settings.channel_id
@@ -241,6 +349,15 @@ class RecvonlyEncodedTransform:
         self._audio_output_frequency: int = 24000
         self._audio_output_channels: int = 1
 
+        self._aes_gcm_key = aes_gcm_key
+
+        # エンコード済みのフレームをデコードせずにファイルに書き出す
+        self._audio_recorder: Optional[SoraEncodedFrameRecorder] = None
+        self._video_recorder: Optional[SoraEncodedFrameRecorder] = None
+        if record_dir is not None:
+            self._audio_recorder = SoraEncodedFrameRecorder(str(record_dir / "audio.ogg"))
+            self._video_recorder = SoraEncodedFrameRecorder(str(record_dir / "video.ivf"))
+
         self._sora = Sora()
 
         self._connection = self._sora.create_connection(
@@ -271,6 +388,10 @@ class RecvonlyEncodedTransform:
 
     def disconnect(self):
         self._connection.disconnect()
+        if self._audio_recorder is not None:
+            self._audio_recorder.close()
+        if self._video_recorder is not None:
+            self._video_recorder.close()
 
     def get_stats(self):
         raw_stats = self._connection.get_stats()
@@ -285,6 +406,14 @@ class RecvonlyEncodedTransform:
     def is_called_on_video_transform(self):
         return self._is_called_on_video_transform
 
+    @property
+    def audio_recorder(self):
+        return self._audio_recorder
+
+    @property
+    def video_recorder(self):
+        return self._video_recorder
+
     def _on_set_offer(self, raw_offer):
         offer = json.loads(raw_offer)
         if offer["type"] == "offer":
@@ -312,6 +441,11 @@ class RecvonlyEncodedTransform:
             self._audio_transformer = SoraAudioFrameTransformer()
             # Audio のエンコードフレームを受け取るコールバック関数を on_transform に設定
             self._audio_transformer.on_transform = self._on_audio_transform
+            if self._audio_recorder is not None:
+                self._audio_transformer.add_recording_stage(self._audio_recorder)
+            # on_transform の前に Python を呼び出さずに復号する
+            if self._aes_gcm_key is not None:
+                self._audio_transformer.add_aes_gcm_stage(self._aes_gcm_key, unencrypted_bytes=1)
             # Encoded Transformer を RTPReceiver に設定する
             track.set_frame_transformer(self._audio_transformer)
         if track.kind == "video":
@@ -319,6 +453,11 @@ class RecvonlyEncodedTransform:
             self._video_transformer = SoraVideoFrameTransformer()
             # Video のエンコードフレームを受け取るコールバック関数を on_transform に設定
             self._video_transformer.on_transform = self._on_video_transform
+            if self._video_recorder is not None:
+                self._video_transformer.add_recording_stage(self._video_recorder)
+            # on_transform の前に Python を呼び出さずに復号する
+            if self._aes_gcm_key is not None:
+                self._video_transformer.add_aes_gcm_stage(self._aes_gcm_key, unencrypted_bytes=10)
             # Encoded Transformer を SoraMediaTrack に設定する
             track.set_frame_transformer(self._video_transformer)
 
@@ -449,3 +588,329 @@ def test_encoded_transform(settings):
 
     assert recvonly.is_called_on_audio_transform is True
     assert recvonly.is_called_on_video_transform is True
+
+
+class KeylessRecvonlyEncodedTransform(RecvonlyEncodedTransform):
+    """
+    鍵を設定せずに受信したフレームを調べる RecvonlyEncodedTransform です。
+    """
+
+    def __init__(self, settings: Settings):
+        super().__init__(settings)
+        self.frames = 0
+        self.plaintext_frames = 0
+
+    def _inspect(self, frame) -> None:
+        data = numpy.asarray(frame.get_data(), dtype=numpy.uint8).tobytes()
+        self.frames += 1
+        # 送信側で末尾に付けた "sora" が見えていれば暗号化されていない
+        if data.endswith(b"sora"):
+            self.plaintext_frames += 1
+
+    def _on_audio_transform(self, frame: SoraTransformableAudioFrame):
+        self._inspect(frame)
+        self._audio_transformer.enqueue(frame)
+
+    def _on_video_transform(self, frame: SoraTransformableVideoFrame):
+        self._inspect(frame)
+        self._video_transformer.enqueue(frame)
+
+
+def test_encoded_transform_aes_gcm_stage(settings):
+    key = bytes(range(16))
+
+    sendonly = SendonlyEncodedTransform(settings, aes_gcm_key=key)
+    sendonly.connect()
+
+    recvonly = RecvonlyEncodedTransform(settings, aes_gcm_key=key)
+    recvonly.connect()
+
+    keyless = KeylessRecvonlyEncodedTransform(settings)
+    keyless.connect()
+
+    time.sleep(5)
+
+    recvonly_stats = recvonly.get_stats()
+
+    sendonly.disconnect()
+    recvonly.disconnect()
+    keyless.disconnect()
+
+    # 鍵を持たない受信側には暗号化されたフレームが届き、送信側で付けた "sora" は見えない
+    assert keyless.frames > 0
+    assert keyless.plaintext_frames == 0
+
+    # 受信側の on_transform では復号された "sora" の末尾が確認できている
+    assert recvonly.is_called_on_audio_transform is True
+    assert recvonly.is_called_on_video_transform is True
+
+    # 復号できたフレームはデコードされる
+    inbound_rtp_stats = next(
+        s for s in recvonly_stats if s.get("type") == "inbound-rtp" and s.get("kind") == "video"
+    )
+    assert inbound_rtp_stats["framesDecoded"] > 0
+
+
+def test_encoded_transform_stage_invalid_key():
+    transformer = SoraVideoFrameTransformer()
+    with pytest.raises(ValueError):
+        transformer.add_aes_gcm_stage(b"short")
+
+
+def test_encoded_transform_append_in_place(settings):
+    sendonly = SendonlyEncodedTransform(settings, append_in_place=True)
+    sendonly.connect()
+
+    recvonly = RecvonlyEncodedTransform(settings)
+    recvonly.connect()
+
+    time.sleep(5)
+
+    recvonly_stats = recvonly.get_stats()
+
+    sendonly.disconnect()
+    recvonly.disconnect()
+
+    # 受信側の on_transform で末尾の "sora" が確認できている
+    assert sendonly.is_called_on_video_transform is True
+    assert recvonly.is_called_on_video_transform is True
+
+    inbound_rtp_stats = next(
+        s for s in recvonly_stats if s.get("type") == "inbound-rtp" and s.get("kind") == "video"
+    )
+    assert inbound_rtp_stats["framesDecoded"] > 0
+
+
+def test_encoded_transform_worker(settings):
+    sendonly = SendonlyEncodedTransform(settings, worker=True)
+    sendonly.connect()
+
+    recvonly = RecvonlyEncodedTransform(settings)
+    recvonly.connect()
+
+    time.sleep(5)
+
+    recvonly_stats = recvonly.get_stats()
+
+    sendonly.disconnect()
+    recvonly.disconnect()
+
+    # ワーカースレッドから on_transform が呼ばれ、enqueue したフレームが受信側に届いている
+    assert sendonly.is_called_on_audio_transform is True
+    assert sendonly.is_called_on_video_transform is True
+    assert recvonly.is_called_on_audio_transform is True
+    assert recvonly.is_called_on_video_transform is True
+
+    inbound_rtp_stats = next(
+        s for s in recvonly_stats if s.get("type") == "inbound-rtp" and s.get("kind") == "video"
+    )
+    assert inbound_rtp_stats["framesDecoded"] > 0
+
+
+def test_encoded_transform_worker_raise(settings):
+    sendonly = SendonlyEncodedTransform(settings, worker=True)
+
+    raised_frames = []
+
+    def on_video_transform(frame: SoraTransformableVideoFrame):
+        raised_frames.append(frame.is_key_frame)
+        raise RuntimeError("on_transform failed")
+
+    # ワーカースレッドで on_transform が例外を投げてもプロセスは終了しない
+    sendonly._video_transformer.on_transform = on_video_transform
+    assert sendonly._video_transformer.on_transform is on_video_transform
+    sendonly.connect()
+
+    time.sleep(5)
+
+    sendonly.disconnect()
+
+    # 例外を投げても処理中のフレームの数は戻るので、max_in_flight を超えて on_transform が呼ばれる
+    assert len(raised_frames) > 8
+    assert sendonly.is_called_on_audio_transform is True
+
+
+def test_encoded_transform_callback_property():
+    transformer = SoraVideoFrameTransformer()
+    assert transformer.on_transform is None
+    assert transformer.on_transform_many is None
+
+    def on_transform_many(frames: list[SoraTransformableFrame]):
+        pass
+
+    transformer.on_transform_many = on_transform_many
+    assert transformer.on_transform_many is on_transform_many
+    transformer.on_transform_many = None
+    assert transformer.on_transform_many is None
+
+
+def test_encoded_transform_batch(settings):
+    sendonly = SendonlyEncodedTransform(settings, batch=True)
+    sendonly.connect()
+
+    recvonly = RecvonlyEncodedTransform(settings)
+    recvonly.connect()
+
+    time.sleep(5)
+
+    recvonly_stats = recvonly.get_stats()
+
+    sendonly.disconnect()
+    recvonly.disconnect()
+
+    # on_transform_many でまとめて受け取ったフレームが enqueue_many で受信側に届いている
+    assert sendonly.is_called_on_video_transform is True
+    assert sendonly.is_enqueued_frame_rejected is True
+    assert recvonly.is_called_on_video_transform is True
+
+    inbound_rtp_stats = next(
+        s for s in recvonly_stats if s.get("type") == "inbound-rtp" and s.get("kind") == "video"
+    )
+    assert inbound_rtp_stats["framesDecoded"] > 0
+
+
+def test_encoded_transform_batch_raise(settings):
+    sendonly = SendonlyEncodedTransform(settings, batch=True, raise_in_batch=True)
+    sendonly.connect()
+
+    recvonly = RecvonlyEncodedTransform(settings)
+    recvonly.connect()
+
+    time.sleep(5)
+
+    recvonly_stats = recvonly.get_stats()
+
+    sendonly.disconnect()
+    recvonly.disconnect()
+
+    # on_transform_many が例外を投げてもプロセスは終了せず、戻されなかったフレームも受信側に届いている
+    assert sendonly.is_called_on_video_transform is True
+    assert recvonly.is_called_on_video_transform is True
+
+    inbound_rtp_stats = next(
+        s for s in recvonly_stats if s.get("type") == "inbound-rtp" and s.get("kind") == "video"
+    )
+    assert inbound_rtp_stats["framesDecoded"] > 0
+
+
+def test_encoded_transform_batch_invalid_args():
+    transformer = SoraVideoFrameTransformer()
+    with pytest.raises(ValueError):
+        transformer.set_transform_batch(4, interval_ms=0)
+
+    # max_in_flight を超える batch_size では on_transform_many が呼ばれない
+    transformer.start_worker(max_in_flight=4)
+    with pytest.raises(ValueError):
+        transformer.set_transform_batch(8)
+    transformer.set_transform_batch(4)
+    with pytest.raises(ValueError):
+        transformer.start_worker(max_in_flight=2)
+    transformer.stop_worker()
+
+
+def test_encoded_transform_recording(settings, tmp_path):
+    sendonly = SendonlyEncodedTransform(settings)
+    sendonly.connect()
+
+    recvonly = RecvonlyEncodedTransform(settings, record_dir=tmp_path)
+    recvonly.connect()
+
+    time.sleep(5)
+
+    sendonly.disconnect()
+    recvonly.disconnect()
+
+    # Opus は Ogg 、VP9 は IVF で書き出される
+    assert recvonly.audio_recorder.format == "ogg"
+    assert recvonly.audio_recorder.frame_count > 0
+    assert (tmp_path / "audio.ogg").read_bytes()[:4] == b"OggS"
+
+    assert recvonly.video_recorder.format == "ivf"
+    assert recvonly.video_recorder.frame_count > 0
+    ivf = (tmp_path / "video.ivf").read_bytes()
+    assert ivf[:4] == b"DKIF"
+    assert ivf[8:12] == b"VP90"
+    # ヘッダのフレーム数は閉じた時に書き込まれる
+    assert int.from_bytes(ivf[24:28], "little") == recvonly.video_recorder.frame_count
+
+
+def test_encoded_frame_injector(settings):
+    # 受信側がビットストリームからキーフレームを判断できる VP8 を利用する
+    injecting = SendonlyEncodedTransform(settings, video_codec_type="VP8", inject=True)
+    injecting.connect()
+
+    # キーフレームの前に push したフレームは破棄される
+    assert injecting.injector.push(b"\x01\x00\x00", False) is False
+    assert injecting.injector.queue_size == 0
+
+    # エンコードしたフレームを injecting にそのまま渡す
+    sendonly = SendonlyEncodedTransform(
+        settings, video_codec_type="VP8", relay_to=injecting.injector
+    )
+    sendonly.connect()
+
+    # 映像は加工せずに送信しているので Encoded Transform を使わずに受信する
+    recvonly = SoraClient(settings, SoraRole.RECVONLY)
+    recvonly.connect()
+
+    time.sleep(5)
+
+    recvonly_stats = recvonly.get_stats()
+
+    sendonly.disconnect()
+    injecting.disconnect()
+    recvonly.disconnect()
+
+    # 再エンコードせずに送信した映像も受信側でデコードできる
+    inbound_rtp_stats = [
+        s for s in recvonly_stats if s.get("type") == "inbound-rtp" and s.get("kind") == "video"
+    ]
+    assert len(inbound_rtp_stats) == 2
+    for stats in inbound_rtp_stats:
+        assert stats["framesDecoded"] > 0
+
+
+def test_encoded_transform_detach_and_attach(settings):
+    sendonly = SendonlyEncodedTransform(settings)
+    sendonly.connect()
+
+    time.sleep(3)
+
+    assert sendonly.is_called_on_audio_transform is True
+    assert sendonly.is_called_on_video_transform is True
+
+    sendonly.detach_transformers()
+    # 外す前に Transform に渡されていたフレームが戻ってくるのを待ってから確認する
+    time.sleep(1)
+    sendonly.reset_transform_called()
+
+    time.sleep(3)
+
+    # 外している間は on_transform が呼ばれない
+    assert sendonly.is_called_on_audio_transform is False
+    assert sendonly.is_called_on_video_transform is False
+
+    bytes_sent = next(
+        s
+        for s in sendonly.get_stats()
+        if s.get("type") == "outbound-rtp" and s.get("kind") == "video"
+    )["bytesSent"]
+
+    sendonly.attach_transformers()
+
+    time.sleep(3)
+
+    sendonly_stats = sendonly.get_stats()
+
+    sendonly.disconnect()
+
+    # 設定し直すと再び on_transform が呼ばれる
+    assert sendonly.is_called_on_audio_transform is True
+    assert sendonly.is_called_on_video_transform is True
+
+    # 外している間も再ネゴシエーションせずに送信し続けている
+    outbound_rtp_stats = next(
+        s for s in sendonly_stats if s.get("type") == "outbound-rtp" and s.get("kind") == "video"
+    )
+    assert bytes_sent > 0
+    assert outbound_rtp_stats["bytesSent"] > bytes_sent
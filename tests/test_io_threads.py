@@ -0,0 +1,108 @@
+import json
+import threading
+import time
+
+import pytest
+from client import SoraClient, SoraRole
+
+from sora_sdk import Sora
+
+
+def create_recvonly(sora: Sora, settings):
+    access_token = settings.access_token()
+    # secret が設定されていない場合は access_token が存在しない
+    metadata = {"access_token": access_token} if access_token is not None else None
+    return sora.create_connection(
+        signaling_urls=settings.signaling_urls,
+        role="recvonly",
+        channel_id=settings.channel_id,
+        metadata=metadata,
+        audio=True,
+        video=True,
+    )
+
+
+def test_io_threads_isolate_slow_callback(settings):
+    sora = Sora(io_threads=2)
+
+    slow_entered = threading.Event()
+    slow_finished = threading.Event()
+    offered = threading.Event()
+
+    def on_slow_set_offer(raw_offer: str):
+        slow_entered.set()
+        # Python のコールバックで処理が詰まっている状態を再現する
+        time.sleep(5)
+        slow_finished.set()
+
+    def on_set_offer(raw_offer: str):
+        offered.set()
+
+    slow = create_recvonly(sora, settings)
+    slow.on_set_offer = on_slow_set_offer
+
+    fast = create_recvonly(sora, settings)
+    fast.on_set_offer = on_set_offer
+
+    slow.connect()
+    assert slow_entered.wait(10)
+
+    # 別のスレッドに振り分けられた Connection は詰まっているコールバックを待たずに進む
+    fast.connect()
+    assert offered.wait(3)
+    assert slow_finished.is_set() is False
+
+    fast.disconnect()
+    slow.disconnect()
+
+
+def test_io_threads_invalid():
+    with pytest.raises(ValueError):
+        Sora(io_threads=0)
+
+
+def test_contexts_shard_recvonly(settings):
+    sendonly = SoraClient(
+        settings,
+        SoraRole.SENDONLY,
+        audio=False,
+        video=True,
+    )
+    sendonly.connect(fake_video=True)
+
+    # 受信のみの Connection は WebRTC のスレッドの組に順番に振り分けられる
+    sora = Sora(contexts=2, thread_affinity=[0])
+
+    connected = [threading.Event(), threading.Event()]
+    recvonly_connections = []
+    for event in connected:
+        conn = create_recvonly(sora, settings)
+        conn.on_set_offer = lambda raw_offer, event=event: event.set()
+        conn.connect()
+        recvonly_connections.append(conn)
+
+    for event in connected:
+        assert event.wait(10)
+
+    time.sleep(5)
+
+    recvonly_stats = [json.loads(conn.get_stats()) for conn in recvonly_connections]
+
+    for conn in recvonly_connections:
+        conn.disconnect()
+    sendonly.disconnect()
+
+    # どちらの組でも受信した映像をデコードできる
+    for stats in recvonly_stats:
+        inbound_rtp_stats = next(
+            s for s in stats if s.get("type") == "inbound-rtp" and s.get("kind") == "video"
+        )
+        assert inbound_rtp_stats["framesDecoded"] > 0
+
+
+def test_contexts_invalid():
+    with pytest.raises(ValueError):
+        Sora(contexts=0)
+
+    with pytest.raises(ValueError):
+        Sora(thread_affinity=[])
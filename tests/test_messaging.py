@@ -1,5 +1,9 @@
+import json
+import threading
 import time
 
+import numpy
+import pytest
 from client import SoraClient, SoraRole
 
 
@@ -63,3 +67,550 @@ def test_messaging(settings):
     assert recvonly_data_channel_stats["state"] == "open"
     assert recvonly_data_channel_stats["messagesReceived"] == 2
     assert recvonly_data_channel_stats["bytesReceived"] == (len(message1) + len(message2))
+
+
+def test_messaging_buffer_protocol(settings):
+    messaging_label = "#test"
+
+    messaging_sendonly = SoraClient(
+        settings,
+        SoraRole.SENDONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "sendonly"}],
+    )
+
+    messaging_recvonly = SoraClient(
+        settings,
+        SoraRole.RECVONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "recvonly"}],
+    )
+
+    messaging_sendonly.connect()
+    messaging_recvonly.connect()
+
+    time.sleep(3)
+
+    # bytes 以外のバッファプロトコルに対応したオブジェクトもそのまま送れることを確認する
+    message1 = bytearray(b"spam")
+    message2 = memoryview(b"egg")
+    message3 = numpy.arange(8, dtype=numpy.uint16)
+
+    assert messaging_sendonly.send_message(messaging_label, message1)
+    assert messaging_sendonly.send_message(messaging_label, message2)
+    assert messaging_sendonly.send_message(messaging_label, message3)
+
+    time.sleep(3)
+
+    assert messaging_recvonly.recv_message(messaging_label) == bytes(message1)
+    assert messaging_recvonly.recv_message(messaging_label) == bytes(message2)
+    assert messaging_recvonly.recv_message(messaging_label) == message3.tobytes()
+
+    messaging_sendonly.disconnect()
+    messaging_recvonly.disconnect()
+
+
+def test_messaging_many(settings):
+    messaging_label = "#test"
+
+    messaging_sendonly = SoraClient(
+        settings,
+        SoraRole.SENDONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "sendonly"}],
+    )
+
+    messaging_recvonly = SoraClient(
+        settings,
+        SoraRole.RECVONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "recvonly"}],
+    )
+
+    messaging_sendonly.connect()
+    messaging_recvonly.connect()
+
+    time.sleep(3)
+
+    messages = [f"message-{i}".encode("utf-8") for i in range(100)]
+
+    # メッセージごとに送信結果が返ってくる
+    results = messaging_sendonly.send_message_many(messaging_label, messages)
+    assert results == [True] * len(messages)
+
+    # 存在しない label はメッセージごとに失敗する
+    results = messaging_sendonly._connection.send_data_channel_many(
+        [(messaging_label, b"spam"), ("#unknown", b"egg")]
+    )
+    assert results == [True, False]
+
+    time.sleep(3)
+
+    for message in messages:
+        assert messaging_recvonly.recv_message(messaging_label) == message
+    assert messaging_recvonly.recv_message(messaging_label) == b"spam"
+
+    messaging_sendonly_stats = messaging_sendonly.get_stats()
+
+    messaging_sendonly.disconnect()
+    messaging_recvonly.disconnect()
+
+    sendonly_data_channel_stats = next(
+        s
+        for s in messaging_sendonly_stats
+        if s.get("type") == "data-channel" and s.get("label") == messaging_label
+    )
+    assert sendonly_data_channel_stats["messagesSent"] == len(messages) + 1
+
+
+def test_messaging_buffered_amount(settings):
+    messaging_label = "#test"
+
+    messaging_sendonly = SoraClient(
+        settings,
+        SoraRole.SENDONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "sendonly"}],
+    )
+
+    messaging_recvonly = SoraClient(
+        settings,
+        SoraRole.RECVONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "recvonly"}],
+    )
+
+    messaging_sendonly.connect()
+    messaging_recvonly.connect()
+
+    time.sleep(3)
+
+    connection = messaging_sendonly._connection
+    assert connection.buffered_amount(messaging_label) == 0
+
+    # 開いていない label には積めない
+    assert not connection.enqueue_data_channel("#unknown", b"x")
+    assert connection.buffered_amount("#unknown") == 0
+
+    send_error_labels = []
+    connection.on_send_error = send_error_labels.append
+
+    low_labels = []
+    connection.max_buffered_amount = 64 * 1024
+    connection.buffered_amount_low_threshold = 16 * 1024
+    connection.on_buffered_amount_low = low_labels.append
+
+    message = b"x" * 1024
+    count = 256
+    for _ in range(count):
+        # 送信キューが max_buffered_amount を超えないように空きを待ちながら積む
+        assert connection.enqueue_data_channel(messaging_label, message, block=True, timeout=5)
+        assert connection.buffered_amount(messaging_label) <= connection.max_buffered_amount
+
+    assert connection.wait_buffered_amount_low(messaging_label, timeout=5)
+    assert connection.buffered_amount(messaging_label) <= connection.buffered_amount_low_threshold
+    assert send_error_labels == []
+
+    time.sleep(3)
+
+    messaging_sendonly_stats = messaging_sendonly.get_stats()
+
+    messaging_sendonly.disconnect()
+    messaging_recvonly.disconnect()
+
+    # 切断後は積めない
+    assert not connection.enqueue_data_channel(messaging_label, message)
+
+    sendonly_data_channel_stats = next(
+        s
+        for s in messaging_sendonly_stats
+        if s.get("type") == "data-channel" and s.get("label") == messaging_label
+    )
+    assert sendonly_data_channel_stats["messagesSent"] == count
+    assert sendonly_data_channel_stats["bytesSent"] == count * len(message)
+
+
+def test_messaging_batch_memoryview(settings):
+    messaging_label = "#test"
+
+    messaging_sendonly = SoraClient(
+        settings,
+        SoraRole.SENDONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "sendonly"}],
+    )
+
+    messaging_recvonly = SoraClient(
+        settings,
+        SoraRole.RECVONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "recvonly"}],
+    )
+
+    messaging_sendonly.connect()
+    messaging_recvonly.connect()
+
+    time.sleep(3)
+
+    batches: list[list[tuple[str, memoryview]]] = []
+    connection = messaging_recvonly._connection
+    connection.message_as_memoryview = True
+    connection.message_batch_size = 10
+    connection.message_batch_interval_ms = 100
+    connection.on_messages = batches.append
+
+    messages = [f"message-{i}".encode("utf-8") for i in range(25)]
+    assert messaging_sendonly.send_message_many(messaging_label, messages) == [True] * 25
+
+    time.sleep(3)
+
+    messaging_sendonly.disconnect()
+    messaging_recvonly.disconnect()
+
+    # 10 件ずつまとめて渡され、残りの 5 件は message_batch_interval_ms 経過後に渡される
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+
+    received = [message for batch in batches for message in batch]
+    for (label, data), message in zip(received, messages):
+        assert label == messaging_label
+        assert isinstance(data, memoryview)
+        assert data.readonly
+        assert data.tobytes() == message
+
+
+def test_messaging_batch_interval_zero(settings):
+    messaging_label = "#test"
+
+    messaging_sendonly = SoraClient(
+        settings,
+        SoraRole.SENDONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "sendonly"}],
+    )
+
+    messaging_recvonly = SoraClient(
+        settings,
+        SoraRole.RECVONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "recvonly"}],
+    )
+
+    messaging_sendonly.connect()
+    messaging_recvonly.connect()
+
+    time.sleep(3)
+
+    batches: list[list[tuple[str, bytes]]] = []
+    connection = messaging_recvonly._connection
+    connection.message_batch_size = 10
+    # 0 の場合は待たずに渡すので、件数が溜まらなくても切断前に全て届く
+    connection.message_batch_interval_ms = 0
+    connection.on_messages = batches.append
+
+    messages = [f"message-{i}".encode("utf-8") for i in range(5)]
+    assert messaging_sendonly.send_message_many(messaging_label, messages) == [True] * 5
+
+    time.sleep(3)
+
+    received = [data for batch in batches for _, data in batch]
+    assert received == messages
+
+    messaging_sendonly.disconnect()
+    messaging_recvonly.disconnect()
+
+
+def test_messaging_batch_size_reset(settings):
+    messaging_label = "#test"
+
+    messaging_sendonly = SoraClient(
+        settings,
+        SoraRole.SENDONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "sendonly"}],
+    )
+
+    messaging_recvonly = SoraClient(
+        settings,
+        SoraRole.RECVONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "recvonly"}],
+    )
+
+    messaging_sendonly.connect()
+    messaging_recvonly.connect()
+
+    time.sleep(3)
+
+    received: list[bytes] = []
+    connection = messaging_recvonly._connection
+    # 件数も時間も満たさないので、まとめている途中のまま残る
+    connection.message_batch_size = 10
+    connection.message_batch_interval_ms = 60000
+    connection.on_message = lambda label, data: received.append(data)
+
+    assert messaging_sendonly.send_message(messaging_label, b"first")
+    assert messaging_sendonly.send_message(messaging_label, b"second")
+    time.sleep(1)
+    assert received == []
+
+    # 0 に戻すと、次のメッセージより先に溜まっていたメッセージが渡される
+    connection.message_batch_size = 0
+    assert messaging_sendonly.send_message(messaging_label, b"third")
+
+    time.sleep(3)
+
+    assert received == [b"first", b"second", b"third"]
+
+    messaging_sendonly.disconnect()
+    messaging_recvonly.disconnect()
+
+
+def test_messaging_disconnect_in_callback(settings):
+    messaging_label = "#test"
+
+    messaging_sendonly = SoraClient(
+        settings,
+        SoraRole.SENDONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "sendonly"}],
+    )
+
+    messaging_recvonly = SoraClient(
+        settings,
+        SoraRole.RECVONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "recvonly"}],
+    )
+
+    messaging_sendonly.connect()
+    messaging_recvonly.connect()
+
+    time.sleep(3)
+
+    connection = messaging_recvonly._connection
+    returned = threading.Event()
+
+    def on_message(label: str, data: bytes):
+        # コールバックのスレッドから呼んでも待たずに戻る
+        connection.disconnect()
+        returned.set()
+
+    connection.on_message = on_message
+
+    assert messaging_sendonly.send_message(messaging_label, b"disconnect") is True
+    assert returned.wait(10)
+    # 後始末は切断の完了後に行われる
+    connection.disconnect_async().result(timeout=10)
+
+    messaging_sendonly.disconnect()
+
+
+def test_messaging_blob(settings):
+    messaging_label = "#test"
+
+    messaging_sendonly = SoraClient(
+        settings,
+        SoraRole.SENDONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "sendonly"}],
+    )
+
+    messaging_recvonly = SoraClient(
+        settings,
+        SoraRole.RECVONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "recvonly"}],
+    )
+
+    messaging_sendonly.connect()
+    messaging_recvonly.connect()
+
+    time.sleep(3)
+
+    events: list[str] = []
+    blobs: list[bytes] = []
+
+    def on_blob(label: str, data: bytes):
+        events.append("blob")
+        blobs.append(data)
+
+    def on_message(label: str, data: bytes):
+        events.append(data.decode())
+
+    recv_connection = messaging_recvonly._connection
+    recv_connection.on_blob = on_blob
+    recv_connection.on_message = on_message
+
+    # チャンクサイズで割り切れないサイズにする
+    blob = numpy.random.default_rng().integers(0, 256, 3 * 1024 * 1024 + 123, dtype=numpy.uint8)
+    connection = messaging_sendonly._connection
+    results: list[bool] = []
+    blob_thread = threading.Thread(
+        target=lambda: results.append(
+            connection.send_blob(messaging_label, blob, chunk_size=16 * 1024, timeout=10)
+        )
+    )
+    blob_thread.start()
+
+    # send_blob で送信している途中に、別のスレッドから通常のメッセージを送れる
+    while connection.buffered_amount(messaging_label) == 0:
+        time.sleep(0.001)
+    assert blob_thread.is_alive()
+    assert messaging_sendonly.send_message(messaging_label, b"control")
+
+    blob_thread.join()
+    assert results == [True]
+    assert connection.wait_buffered_amount_low(messaging_label, timeout=10)
+
+    time.sleep(3)
+
+    messaging_sendonly.disconnect()
+    messaging_recvonly.disconnect()
+
+    # 分割されたチャンクは on_message には渡されず、結合されて on_blob に 1 回だけ渡される
+    # 通常のメッセージは大きなデータの送信完了を待たずに届く
+    assert events == ["control", "blob"]
+    assert blobs[0] == blob.tobytes()
+
+
+def test_messaging_blob_limits(settings):
+    messaging_label = "#test"
+
+    messaging_sendonly = SoraClient(
+        settings,
+        SoraRole.SENDONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "sendonly"}],
+    )
+
+    messaging_recvonly = SoraClient(
+        settings,
+        SoraRole.RECVONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "recvonly"}],
+    )
+
+    messaging_sendonly.connect()
+    messaging_recvonly.connect()
+
+    time.sleep(3)
+
+    blobs: list[bytes] = []
+    recv_connection = messaging_recvonly._connection
+    recv_connection.max_blob_size = 1024
+    recv_connection.on_blob = lambda label, data: blobs.append(data)
+
+    connection = messaging_sendonly._connection
+    # max_blob_size を超えるデータは受信しない
+    assert connection.send_blob(messaging_label, b"a" * 2048, chunk_size=256, timeout=10)
+    assert connection.send_blob(messaging_label, b"b" * 1024, chunk_size=256, timeout=10)
+
+    # ヘッダとして正しくないメッセージは通常のメッセージとして渡される
+    # 全体のサイズ 4 バイトに対してオフセットが 8 バイト
+    invalid = b"SBLB" + (1).to_bytes(4, "big") + (4).to_bytes(8, "big") + (8).to_bytes(8, "big")
+    assert messaging_sendonly.send_message(messaging_label, invalid + b"data")
+
+    assert connection.wait_buffered_amount_low(messaging_label, timeout=10)
+
+    time.sleep(3)
+
+    messaging_sendonly.disconnect()
+    messaging_recvonly.disconnect()
+
+    assert blobs == [b"b" * 1024]
+    assert messaging_recvonly.recv_message(messaging_label) == invalid + b"data"
+
+
+def test_messaging_compression(settings):
+    messaging_label = "#test"
+
+    messaging_sendonly = SoraClient(
+        settings,
+        SoraRole.SENDONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "sendonly"}],
+    )
+
+    messaging_recvonly = SoraClient(
+        settings,
+        SoraRole.RECVONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "recvonly"}],
+    )
+
+    # 送信側と受信側で同じ辞書を使う
+    dictionary = b'{"type": "telemetry", "values": []}'
+    messaging_sendonly._connection.set_data_channel_compression(
+        messaging_label, level=9, dictionary=dictionary
+    )
+    messaging_recvonly._connection.set_data_channel_compression(
+        messaging_label, level=9, dictionary=dictionary
+    )
+
+    messaging_sendonly.connect()
+    messaging_recvonly.connect()
+
+    time.sleep(3)
+
+    message = json.dumps({"type": "telemetry", "values": list(range(1000))}).encode()
+    assert messaging_sendonly.send_message(messaging_label, message)
+
+    time.sleep(3)
+
+    sendonly_stats = messaging_sendonly.get_stats()
+
+    messaging_sendonly.disconnect()
+    messaging_recvonly.disconnect()
+
+    assert messaging_recvonly.recv_message(messaging_label) == message
+
+    # 圧縮したまま送られているので、送信したバイト数は元のメッセージより小さい
+    data_channel_stats = next(
+        s
+        for s in sendonly_stats
+        if s.get("type") == "data-channel" and s.get("label") == messaging_label
+    )
+    assert data_channel_stats["messagesSent"] == 1
+    assert 0 < data_channel_stats["bytesSent"] < len(message) // 2
+
+    with pytest.raises(ValueError):
+        messaging_sendonly._connection.set_data_channel_compression(messaging_label, level=10)
+
+
+def test_messaging_compression_max_decompressed_size(settings):
+    messaging_label = "#test"
+
+    messaging_sendonly = SoraClient(
+        settings,
+        SoraRole.SENDONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "sendonly"}],
+    )
+
+    messaging_recvonly = SoraClient(
+        settings,
+        SoraRole.RECVONLY,
+        data_channel_signaling=True,
+        data_channels=[{"label": messaging_label, "direction": "recvonly"}],
+    )
+
+    messaging_sendonly._connection.set_data_channel_compression(messaging_label)
+    messaging_recvonly._connection.set_data_channel_compression(
+        messaging_label, max_decompressed_size=1024
+    )
+
+    messaging_sendonly.connect()
+    messaging_recvonly.connect()
+
+    time.sleep(3)
+
+    # 数 KiB に圧縮される 1 MiB のメッセージは、伸長後の上限を超えるので破棄される
+    assert messaging_sendonly.send_message(messaging_label, b"\x00" * 1024 * 1024)
+    assert messaging_sendonly.send_message(messaging_label, b"small")
+
+    time.sleep(3)
+
+    messaging_sendonly.disconnect()
+    messaging_recvonly.disconnect()
+
+    assert messaging_recvonly.recv_message(messaging_label) == b"small"
@@ -0,0 +1,264 @@
+import json
+import socket
+import struct
+import threading
+import time
+
+from client import SoraClient, SoraRole
+
+from sora_sdk import Sora, SoraSignalingErrorCode
+
+
+def test_auto_reconnect_not_on_disconnect(settings):
+    sora = Sora()
+
+    access_token = settings.access_token()
+    # secret が設定されていない場合は access_token が存在しない
+    metadata = {"access_token": access_token} if access_token is not None else None
+    conn = sora.create_connection(
+        signaling_urls=settings.signaling_urls,
+        role="recvonly",
+        channel_id=settings.channel_id,
+        metadata=metadata,
+        audio=True,
+        video=True,
+    )
+    assert conn.auto_reconnect is False
+    conn.auto_reconnect = True
+    conn.reconnect_max_attempts = 3
+    conn.reconnect_initial_delay_ms = 50
+
+    connected = threading.Event()
+    disconnected = threading.Event()
+    reconnects = []
+    conn.on_notify = lambda raw_message: (
+        connected.set() if '"connection.created"' in raw_message else None
+    )
+    conn.on_disconnect = lambda error_code, message: disconnected.set()
+    conn.on_reconnect = lambda attempt, error_code, message: reconnects.append(attempt)
+
+    conn.connect()
+    assert connected.wait(10)
+
+    # 自分で切断した場合は再接続しない
+    conn.disconnect()
+
+    assert disconnected.is_set()
+    assert reconnects == []
+
+
+class ConnectProxy:
+    """
+    シグナリングの WebSocket を HTTP CONNECT で中継するプロキシ
+
+    cut() で中継中の接続を RST で切断し、ネットワークの問題による切断を再現する
+    """
+
+    def __init__(self):
+        self._server = socket.create_server(("127.0.0.1", 0))
+        self.url = f"http://127.0.0.1:{self._server.getsockname()[1]}"
+        self._lock = threading.Lock()
+        self._accepting = True
+        self._sockets: list[socket.socket] = []
+        self._closed = False
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def cut(self, accept: bool) -> None:
+        # accept が False の場合は以降の CONNECT も拒否して、再接続を失敗させ続ける
+        with self._lock:
+            self._accepting = accept
+            sockets, self._sockets = self._sockets, []
+        for sock in sockets:
+            # SO_LINGER を 0 にして close すると RST が送られる
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            sock.close()
+
+    def close(self) -> None:
+        self._closed = True
+        self.cut(accept=False)
+        self._server.close()
+
+    def _accept_loop(self) -> None:
+        while not self._closed:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(client,), daemon=True).start()
+
+    def _handle(self, client: socket.socket) -> None:
+        request = b""
+        while b"\r\n\r\n" not in request:
+            chunk = client.recv(4096)
+            if not chunk:
+                client.close()
+                return
+            request += chunk
+        # CONNECT host:port HTTP/1.1
+        host, port = request.split(b" ")[1].decode().rsplit(":", 1)
+        with self._lock:
+            accepting = self._accepting
+        if not accepting:
+            client.sendall(b"HTTP/1.1 503 Service Unavailable\r\n\r\n")
+            client.close()
+            return
+        upstream = socket.create_connection((host, int(port)))
+        with self._lock:
+            self._sockets += [client, upstream]
+        client.sendall(b"HTTP/1.1 200 Connection Established\r\n\r\n")
+        threading.Thread(target=self._pipe, args=(client, upstream), daemon=True).start()
+        self._pipe(upstream, client)
+
+    def _pipe(self, src: socket.socket, dst: socket.socket) -> None:
+        try:
+            while chunk := src.recv(65536):
+                dst.sendall(chunk)
+        except OSError:
+            pass
+
+
+class ReconnectingRecvonly:
+    """プロキシ経由で接続し、再接続に関するコールバックを記録する recvonly"""
+
+    def __init__(self, settings, sora: Sora, proxy: ConnectProxy):
+        access_token = settings.access_token()
+        # secret が設定されていない場合は access_token が存在しない
+        metadata = {"access_token": access_token} if access_token is not None else None
+        self.connection = sora.create_connection(
+            signaling_urls=settings.signaling_urls,
+            role="recvonly",
+            channel_id=settings.channel_id,
+            metadata=metadata,
+            audio=False,
+            video=True,
+            # シグナリングを WebSocket のままにして、プロキシでの切断を検知させる
+            data_channel_signaling=False,
+            proxy_url=proxy.url,
+        )
+        self.connection.auto_reconnect = True
+        self.connection.reconnect_max_attempts = 3
+        self.connection.reconnect_initial_delay_ms = 200
+        self.connection.reconnect_max_delay_ms = 5000
+
+        self.connection_id: str | None = None
+        self.connected = threading.Event()
+        self.reconnected = threading.Event()
+        self.track = threading.Event()
+        self.disconnected = threading.Event()
+        self.created_count = 0
+        self.track_count = 0
+        self.removed_track_kinds: list[str] = []
+        # (attempt, error_code, time.monotonic())
+        self.reconnects: list[tuple[int, SoraSignalingErrorCode, float]] = []
+        self.disconnect_error_code: SoraSignalingErrorCode | None = None
+
+        self.connection.on_set_offer = self._on_set_offer
+        self.connection.on_notify = self._on_notify
+        self.connection.on_track = self._on_track
+        self.connection.on_remove_track = self._on_remove_track
+        self.connection.on_reconnect = self._on_reconnect
+        self.connection.on_disconnect = self._on_disconnect
+
+    def _on_set_offer(self, raw_message: str) -> None:
+        # 再接続すると新しい connection_id になる
+        self.connection_id = json.loads(raw_message)["connection_id"]
+
+    def _on_notify(self, raw_message: str) -> None:
+        message = json.loads(raw_message)
+        if (
+            message.get("event_type") == "connection.created"
+            and message.get("connection_id") == self.connection_id
+        ):
+            self.created_count += 1
+            self.connected.set()
+            if self.reconnects:
+                self.reconnected.set()
+
+    def _on_track(self, track) -> None:
+        self.track_count += 1
+        self.track.set()
+
+    def _on_remove_track(self, track) -> None:
+        # 呼び出された後に track は破棄されるので、ここで必要な情報を取り出しておく
+        self.removed_track_kinds.append(track.kind)
+
+    def _on_reconnect(self, attempt: int, error_code: SoraSignalingErrorCode, message: str) -> None:
+        self.reconnects.append((attempt, error_code, time.monotonic()))
+        self.connected.clear()
+        self.track.clear()
+
+    def _on_disconnect(self, error_code: SoraSignalingErrorCode, message: str) -> None:
+        self.disconnect_error_code = error_code
+        self.disconnected.set()
+
+
+def test_auto_reconnect_recovers(settings):
+    sendonly = SoraClient(settings, SoraRole.SENDONLY, audio=False, video=True)
+    sendonly.connect(fake_video=True)
+
+    proxy = ConnectProxy()
+    sora = Sora()
+    recvonly = ReconnectingRecvonly(settings, sora, proxy)
+
+    recvonly.connection.connect()
+    assert recvonly.connected.wait(10)
+    assert recvonly.track.wait(10)
+    assert sora.connection_count == 1
+
+    # 中継中の接続だけを切り、再接続は通す
+    proxy.cut(accept=True)
+
+    assert recvonly.reconnected.wait(30)
+    assert recvonly.track.wait(10)
+
+    # 再接続を待っている間も Connection の数は変わらない
+    assert sora.connection_count == 1
+    assert [attempt for attempt, _, _ in recvonly.reconnects] == [1]
+    assert recvonly.created_count == 2
+    # 古い PeerConnection のトラックは破棄され、新しいトラックが渡される
+    assert recvonly.removed_track_kinds == ["video"]
+    assert recvonly.track_count == 2
+    assert not recvonly.disconnected.is_set()
+
+    recvonly.connection.disconnect()
+    sendonly.disconnect()
+    proxy.close()
+
+    assert recvonly.disconnected.is_set()
+    assert sora.connection_count == 0
+
+
+def test_auto_reconnect_gives_up(settings):
+    sendonly = SoraClient(settings, SoraRole.SENDONLY, audio=False, video=True)
+    sendonly.connect(fake_video=True)
+
+    proxy = ConnectProxy()
+    sora = Sora()
+    recvonly = ReconnectingRecvonly(settings, sora, proxy)
+
+    recvonly.connection.connect()
+    assert recvonly.connected.wait(10)
+    assert recvonly.track.wait(10)
+
+    # 中継中の接続を切り、以降の CONNECT も拒否して再接続を失敗させ続ける
+    cut_at = time.monotonic()
+    proxy.cut(accept=False)
+
+    assert recvonly.disconnected.wait(30)
+
+    # reconnect_max_attempts 回で諦めて on_disconnect が呼ばれる
+    attempts = [attempt for attempt, _, _ in recvonly.reconnects]
+    assert attempts == [1, 2, 3]
+    assert recvonly.disconnect_error_code != SoraSignalingErrorCode.CLOSE_SUCCEEDED
+    assert sora.connection_count == 0
+    assert recvonly.removed_track_kinds == ["video"]
+    assert recvonly.track_count == 1
+
+    # 待ち時間は 200ms から 2 倍ずつ伸びる
+    times = [cut_at] + [t for _, _, t in recvonly.reconnects]
+    for i, delay in enumerate((0.2, 0.4, 0.8)):
+        assert times[i + 1] - times[i] >= delay * 0.9
+
+    recvonly.connection.disconnect()
+    sendonly.disconnect()
+    proxy.close()
@@ -111,3 +111,77 @@ def test_sendonly_recvonly_video(
     assert inbound_rtp_stats["keyFramesDecoded"] > 0
 
     print("keyFrameDecoded:", inbound_rtp_stats["keyFramesDecoded"])
+
+
+def test_sendonly_recvonly_replace_video_track(settings):
+    sendonly = SoraClient(
+        settings,
+        SoraRole.SENDONLY,
+        audio=False,
+        video=True,
+        video_codec_type="VP8",
+        video_width=640,
+        video_height=480,
+    )
+    sendonly.connect(fake_video=True)
+
+    recvonly = SoraClient(
+        settings,
+        SoraRole.RECVONLY,
+    )
+    recvonly.connect()
+
+    time.sleep(5)
+
+    # 再接続や再ネゴシエーションをせずに送信する映像のトラックを入れ替える
+    connection_id = sendonly.connection_id
+    sendonly.replace_video_source(320, 240)
+
+    time.sleep(5)
+
+    sendonly_stats = sendonly.get_stats()
+    recvonly_stats = recvonly.get_stats()
+
+    assert sendonly.connection_id == connection_id
+    assert sendonly.connected is True
+
+    sendonly.disconnect()
+    recvonly.disconnect()
+
+    # outbound-rtp が無かったら StopIteration 例外が上がる
+    outbound_rtp_stats = next(s for s in sendonly_stats if s.get("type") == "outbound-rtp")
+    assert outbound_rtp_stats["frameWidth"] == 320
+    assert outbound_rtp_stats["frameHeight"] == 240
+
+    # inbound-rtp が無かったら StopIteration 例外が上がる
+    inbound_rtp_stats = next(s for s in recvonly_stats if s.get("type") == "inbound-rtp")
+    assert inbound_rtp_stats["frameWidth"] == 320
+    assert inbound_rtp_stats["frameHeight"] == 240
+    assert inbound_rtp_stats["framesDecoded"] > 0
+
+
+def test_sendonly_recvonly_remove_track(settings):
+    sendonly = SoraClient(
+        settings,
+        SoraRole.SENDONLY,
+        audio=True,
+        video=True,
+    )
+    sendonly.connect(fake_audio=True, fake_video=True)
+
+    recvonly = SoraClient(
+        settings,
+        SoraRole.RECVONLY,
+    )
+    recvonly.connect()
+
+    time.sleep(5)
+
+    # 送信側が切断すると受信側で on_remove_track が呼ばれる
+    sendonly.disconnect()
+
+    removed = {recvonly.wait_remove_track(timeout=10), recvonly.wait_remove_track(timeout=10)}
+
+    recvonly.disconnect()
+
+    assert removed == {"audio", "video"}
@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+
+import numpy
+import pytest
+
+from sora_sdk import SoraPool
+
+
+def test_sora_pool_shares_source(settings):
+    pool = SoraPool(2)
+
+    video_source = pool.create_video_source()
+    audio_source = pool.create_audio_source(1, 16000)
+
+    stop = threading.Event()
+
+    def capture_loop():
+        while not stop.is_set():
+            time.sleep(1.0 / 30)
+            color = numpy.random.randint(0, 256, size=(3,), dtype=numpy.uint8)
+            video_source.on_captured(numpy.full((480, 640, 3), color, dtype=numpy.uint8))
+            audio_source.on_data(numpy.zeros((320, 1), dtype=numpy.int16))
+
+    capture_thread = threading.Thread(target=capture_loop, daemon=True)
+    capture_thread.start()
+
+    access_token = settings.access_token()
+    metadata = {"access_token": access_token} if access_token is not None else None
+
+    connected = [threading.Event(), threading.Event()]
+    connections = []
+    for event in connected:
+        conn = pool.create_connection(
+            audio_source=audio_source,
+            video_source=video_source,
+            signaling_urls=settings.signaling_urls,
+            role="sendonly",
+            channel_id=settings.channel_id,
+            metadata=metadata,
+            audio=True,
+            video=True,
+        )
+        conn.on_set_offer = lambda raw_offer, event=event: event.set()
+        conn.connect()
+        connections.append(conn)
+
+    # Connection は少ない方の Sora インスタンスに振り分けられる
+    assert [shard.connection_count for shard in pool.shards] == [1, 1]
+
+    for event in connected:
+        assert event.wait(10)
+
+    time.sleep(5)
+
+    stats = [json.loads(conn.get_stats()) for conn in connections]
+
+    for conn in connections:
+        conn.disconnect()
+    stop.set()
+    capture_thread.join()
+
+    # 切断した Connection は数えない
+    assert [shard.connection_count for shard in pool.shards] == [0, 0]
+
+    # 転送したトラックを使う 2 つ目の Sora インスタンスの Connection も送信できている
+    for s in stats:
+        video_outbound_rtp = next(
+            o for o in s if o.get("type") == "outbound-rtp" and o.get("kind") == "video"
+        )
+        assert video_outbound_rtp["framesEncoded"] > 0
+        assert video_outbound_rtp["bytesSent"] > 0
+
+        audio_outbound_rtp = next(
+            o for o in s if o.get("type") == "outbound-rtp" and o.get("kind") == "audio"
+        )
+        assert audio_outbound_rtp["bytesSent"] > 0
+
+
+def test_sora_pool_invalid():
+    with pytest.raises(ValueError):
+        SoraPool(0)
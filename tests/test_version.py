@@ -1,4 +1,7 @@
 import os
+import subprocess
+import sys
+
 import sora_sdk
 
 
@@ -15,3 +18,38 @@ def test_version():
 
     assert sora_sdk.__version__ == expected_version
     print(f"sora_sdk.__version__ = {sora_sdk.__version__}")
+
+
+def test_version_without_loading_extension():
+    """__version__ を参照しても sora_sdk_ext や importlib.metadata を読み込まないことを確認"""
+    code = (
+        "import sys, sora_sdk; sora_sdk.__version__; "
+        "print('sora_sdk.sora_sdk_ext' in sys.modules, 'importlib.metadata' in sys.modules)"
+    )
+    output = subprocess.check_output([sys.executable, "-c", code], text=True)
+    assert output.split() == ["False", "False"]
+
+    # 属性にアクセスした時点で読み込まれる
+    assert sora_sdk.Sora is sora_sdk.sora_sdk_ext.Sora
+
+
+def test_version_stale_version_module(tmp_path):
+    """ビルド後に VERSION を更新した場合、古い _version.py ではなく VERSION のバージョンを返すことを確認"""
+    package_dir = tmp_path / "src" / "sora_sdk"
+    package_dir.mkdir(parents=True)
+    with open(sora_sdk.__file__, "r") as f:
+        (package_dir / "__init__.py").write_text(f.read())
+    (tmp_path / "VERSION").write_text("2099.1.0\n")
+
+    code = "import sora_sdk; print(sora_sdk.__version__)"
+    env = {**os.environ, "PYTHONPATH": str(tmp_path / "src")}
+
+    # 古いビルドで書き出した _version.py は使わない
+    (package_dir / "_version.py").write_text('__version__ = "2025.1.0+debug"\n')
+    output = subprocess.check_output([sys.executable, "-c", code], text=True, env=env)
+    assert output.strip() == "2099.1.0"
+
+    # VERSION と一致していれば +debug を付けたまま使う
+    (package_dir / "_version.py").write_text('__version__ = "2099.1.0+debug"\n')
+    output = subprocess.check_output([sys.executable, "-c", code], text=True, env=env)
+    assert output.strip() == "2099.1.0+debug"
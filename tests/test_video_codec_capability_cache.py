@@ -0,0 +1,61 @@
+import json
+import subprocess
+import sys
+
+from sora_sdk import get_video_codec_capability
+
+
+def test_capability_cache_file(tmp_path):
+    cache_file = tmp_path / "capability.json"
+
+    capability = get_video_codec_capability(cache_file=str(cache_file))
+
+    # 初回の呼び出しで結果がファイルに保存される
+    cached = json.loads(cache_file.read_text())
+    assert cached["capability"] == capability.to_json()
+
+    # 2 回目以降はプロセス内のキャッシュから同じ結果が返る
+    assert get_video_codec_capability().to_json() == capability.to_json()
+
+
+def _engine_count_in_new_process(cache_file):
+    # プロセス内のキャッシュを使わずにファイルを読ませるため、新しいプロセスで呼び出す
+    code = (
+        "import sys; from sora_sdk import get_video_codec_capability; "
+        "print(len(get_video_codec_capability(cache_file=sys.argv[1]).engines))"
+    )
+    output = subprocess.check_output([sys.executable, "-c", code, str(cache_file)], text=True)
+    return int(output)
+
+
+def test_capability_cache_file_load(tmp_path):
+    cache_file = tmp_path / "capability.json"
+    assert _engine_count_in_new_process(cache_file) > 0
+
+    # キーが一致するキャッシュは調べ直さずにそのまま使う
+    cached = json.loads(cache_file.read_text())
+    cached["capability"]["engines"] = []
+    cache_file.write_text(json.dumps(cached))
+    assert _engine_count_in_new_process(cache_file) == 0
+
+
+def test_capability_cache_file_mismatch(tmp_path):
+    cache_file = tmp_path / "capability.json"
+    assert _engine_count_in_new_process(cache_file) > 0
+    cached = json.loads(cache_file.read_text())
+
+    # キーが一致しないキャッシュは使わずに調べ直し、正しいキーで保存し直す
+    cache_file.write_text(json.dumps({"key": "invalid", "capability": {"engines": []}}))
+    assert _engine_count_in_new_process(cache_file) > 0
+    assert json.loads(cache_file.read_text())["key"] == cached["key"]
+
+
+def test_shared_context_exit():
+    # 共有しているハードウェアのコンテキストを使う Sora を残したまま終了しても、終了処理で落ちない
+    code = (
+        "from sora_sdk import Sora, get_video_codec_capability; "
+        "sora = Sora(); get_video_codec_capability(); print('ok')"
+    )
+    # 終了コードが 0 でなければ CalledProcessError になる
+    output = subprocess.check_output([sys.executable, "-c", code], text=True)
+    assert output.strip() == "ok"